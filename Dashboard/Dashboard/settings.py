@@ -133,3 +133,109 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Partition cache
+# Byte budget of the per-process cache of cleaned_data partitions (see myapp/partition_cache.py)
+PARTITION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Seconds between two version checks of the same cached partition
+PARTITION_CACHE_VERSION_TTL = 30
+
+# Optional table with (table_name, version) rows bumped by the loading jobs.
+# When unset, partitions are versioned by their highest django_index and their insert, update
+# and delete counters in pg_stat_user_tables (see DynamicTableLoader.table_version).
+PARTITION_VERSION_TABLE = None
+
+# Partition fetching (see myapp/partition_fetch.py)
+# How filtered multi-partition loads run: 'sequential', 'union' (one UNION ALL query) or 'parallel'
+PARTITION_FETCH_MODE = 'union'
+
+# Worker threads, and therefore database connections, used for parallel partition fetches
+PARTITION_FETCH_WORKERS = 8
+
+# Streaming exports (see myapp/export.py)
+# Rows fetched from the server-side cursor per CSV chunk / Parquet row group
+EXPORT_CHUNK_SIZE = 10000
+
+# Local Arrow mirror of the partitions (see myapp/partition_mirror.py)
+# 'postgres' reads every partition from the database, 'mirror' reads the partitions synced with
+# `python manage.py sync_partition_mirror` from memory-mapped files and the others from the database
+PARTITION_BACKEND = 'postgres'
+
+PARTITION_MIRROR_DIR = BASE_DIR / 'partition_mirror'
+
+# Rows per record batch; each batch records its Ramses_id range so that lookups skip the others
+PARTITION_MIRROR_BATCH_ROWS = 65536
+
+# Partitioned parent table the cleaned_data partitions are attached to by
+# `python manage.py manage_partitions --attach` (see myapp/partition_admin.py)
+PARTITION_PARENT_TABLE = 'cleaned_data'
+
+# Partition catalog (see myapp/partition_catalog.py)
+# Seconds between two reloads of the partition table list, row estimates and sizes
+PARTITION_CATALOG_TTL = 300
+
+# Selections estimated above this many rows get a warning in the dashboard
+PARTITION_ROW_WARNING = 2000000
+
+# Time-series graph (see myapp/downsampling.py)
+# Maximum points per trace sent to the browser, and how longer traces are reduced: 'lttb' or 'minmax'
+GRAPH_MAX_POINTS = 1500
+GRAPH_DOWNSAMPLING = 'lttb'
+
+# Async data views (see the *_async views in myapp/views.py), served under ASGI
+# Worker threads, and therefore database connections, shared by the partition queries of the async views
+ASYNC_DB_WORKERS = 16
+
+# Request coalescing (see myapp/singleflight.py)
+# Cache alias shared by the workers (e.g. a Redis or Memcached entry of CACHES) used to coalesce
+# identical partition loads across processes; None coalesces within each process only
+SINGLEFLIGHT_CACHE_ALIAS = None
+
+# Seconds a worker may hold the load lock, and keeps a loaded partition available to the others
+SINGLEFLIGHT_LOCK_TIMEOUT = 300
+SINGLEFLIGHT_RESULT_TTL = 60
+
+# Loaded partitions larger than this are not shared through the cache; the waiting workers load them in parallel
+SINGLEFLIGHT_SHARE_MAX_BYTES = 64 * 1024 * 1024
+
+# Caches
+# The analysis cache (see myapp/analysis_cache.py) lives in a file-based cache shared by the
+# workers of this host; a Redis server can be used instead for several hosts, e.g.
+# {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analysis': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'analysis_cache',
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# Analysis result cache (see myapp/analysis_cache.py)
+ANALYSIS_CACHE_ALIAS = 'analysis'
+ANALYSIS_CACHE_TIMEOUT = 3600
+
+# Results larger than this once serialized are not cached; frames from this size on are zstd-compressed
+ANALYSIS_CACHE_MAX_BYTES = 32 * 1024 * 1024
+ANALYSIS_CACHE_COMPRESS_MIN_BYTES = 64 * 1024
+
+# Partition loading (see DynamicTableLoader.iter_frames and dtypes.load_compact_frame)
+# Partitions are streamed from a server-side cursor and compacted this many rows at a time;
+# set PARTITION_STREAMING_LOAD = False to fetch them whole
+PARTITION_STREAMING_LOAD = True
+PARTITION_LOAD_CHUNK_SIZE = 50000
+
+# Ingestion of the cleaned source tables into the partitions (see myapp/ingest.py)
+# Rows sent per COPY FROM STDIN
+INGEST_COPY_ROWS = 50000
+
+# Limit breach forecasts (see myapp/forecasting.py), cached per arrondissement and partition version
+# in the analysis cache; kept longer than other analyses since they only change with new controls
+FORECAST_CACHE_TIMEOUT = 7 * 24 * 3600
+# A forecast has a row per quote of an arrondissement, beyond ANALYSIS_CACHE_MAX_BYTES for the large ones
+FORECAST_CACHE_MAX_BYTES = 256 * 1024 * 1024
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import DynamicTableLoader
+from .singleflight import singleflight
+
+try:
+    import pyarrow as pa
+except ImportError:  # Frames are pickled without pyarrow
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical(value):
+    # A scalar or a list of values, in any order and with duplicates, gives the same key
+    if value is None or value == '' or value == []:
+        return None
+    if not isinstance(value, (list, tuple, set)):
+        return value
+    values = sorted({str(item) for item in value})
+    return values[0] if len(values) == 1 else values
+
+
+def _partition_number(value):
+    return int(float(value))
+
+
+class AnalysisCache:
+    """Cache of analysis results (DataFrames) in a Django cache backend, shared by the workers.
+
+    Keys are built from canonicalized parameters (list order, duplicates and scalar vs list do
+    not matter) and the version stamps of the partitions read, so a result is never served once
+    one of its partitions changed. Frames are stored as Arrow IPC streams, zstd-compressed from
+    `compress_min_bytes`, or pickled without pyarrow; serialized results above `max_bytes` are
+    not stored. Hit, miss and store counters are kept per process.
+    """
+
+    def __init__(self, cache_alias='default', timeout=3600, max_bytes=32 * 1024 * 1024,
+                 compress_min_bytes=64 * 1024, version_ttl=30):
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.compress_min_bytes = compress_min_bytes
+        self.version_ttl = version_ttl
+        self._versions = {}  # (year, arrondissement) -> (version, checked_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.too_large = 0
+        self.stored_bytes = 0
+
+    def partition_version(self, year, arrondissement):
+        """Version stamp of a partition, rechecked at most once every `version_ttl` seconds."""
+        key = (_partition_number(year), _partition_number(arrondissement))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._versions.get(key)
+            if cached is not None and now - cached[1] < self.version_ttl:
+                return cached[0]
+        version = DynamicTableLoader.table_version(year, arrondissement)
+        with self._lock:
+            self._versions[key] = (version, now)
+        return version
+
+    def make_key(self, name, partitions, **params):
+        """Cache key of an analysis over `partitions` ((year, arrondissement) pairs) with `params`."""
+        partitions = sorted({(_partition_number(year), _partition_number(arrondissement))
+                             for year, arrondissement in partitions})
+        canonical = {
+            'params': {key: _canonical(value) for key, value in params.items()},
+            'partitions': [[year, arrondissement, self.partition_version(year, arrondissement)]
+                           for year, arrondissement in partitions],
+        }
+        digest = hashlib.md5(json.dumps(canonical, sort_keys=True, default=str).encode()).hexdigest()
+        return f'analysis:{name}:{digest}'
+
+    def get_or_compute(self, name, partitions, compute, timeout=None, max_bytes=None, **params):
+        """Return the cached result of `compute()` for these partitions and parameters, computing it on a miss.
+
+        Empty results are not cached. Concurrent misses on the same key in a process compute once.
+        `timeout` and `max_bytes` override the cache's default lifetime in seconds and size limit.
+        """
+        key = self.make_key(name, partitions, **params)
+        df = self.get(key)
+        if df is not None:
+            return df
+
+        def compute_and_store():
+            result = compute()
+            if not result.empty:
+                self.set(key, result, timeout, max_bytes=max_bytes)
+            return result
+
+        return singleflight.do(key, compute_and_store)
+
+    def get(self, key):
+        payload = caches[self.cache_alias].get(key)
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self._loads(payload)
+
+    def set(self, key, df, timeout=None, max_bytes=None):
+        payload = self._dumps(df)
+        if len(payload[1]) > (max_bytes or self.max_bytes):
+            with self._lock:
+                self.too_large += 1
+            logger.info("Not caching %s: %d bytes serialized", key, len(payload[1]))
+            return
+        caches[self.cache_alias].set(key, payload, timeout or self.timeout)
+        with self._lock:
+            self.stores += 1
+            self.stored_bytes += len(payload[1])
+
+    def _dumps(self, df):
+        if pa is not None:
+            try:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+            except (pa.ArrowException, TypeError, ValueError) as e:
+                # Mixed-type object columns: fall back to pickle
+                logger.debug("Pickling analysis result instead of Arrow: %s", e)
+            else:
+                large = df.memory_usage(deep=True).sum() >= self.compress_min_bytes
+                options = pa.ipc.IpcWriteOptions(compression='zstd' if large else None)
+                sink = pa.BufferOutputStream()
+                with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+                return ('arrow', sink.getvalue().to_pybytes())
+        return ('pickle', pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _loads(payload):
+        kind, data = payload
+        if kind == 'arrow':
+            return pa.ipc.open_stream(pa.py_buffer(data)).read_all().to_pandas()
+        return pickle.loads(data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'cache_alias': self.cache_alias,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'too_large': self.too_large,
+                'stored_bytes': self.stored_bytes,
+                'max_bytes': self.max_bytes,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+analysis_cache = AnalysisCache(
+    cache_alias=getattr(settings, 'ANALYSIS_CACHE_ALIAS', 'default'),
+    timeout=getattr(settings, 'ANALYSIS_CACHE_TIMEOUT', 3600),
+    max_bytes=getattr(settings, 'ANALYSIS_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+    compress_min_bytes=getattr(settings, 'ANALYSIS_CACHE_COMPRESS_MIN_BYTES', 64 * 1024),
+    version_ttl=getattr(settings, 'PARTITION_CACHE_VERSION_TTL', 30),
+)
@@ -0,0 +1,90 @@
+import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ControlDue
+from .snapshot import snapshot_frame
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_SNAPSHOT_FIELDS = ['Ramses_id', 'Date_control', 'Date_last_control', 'Périodicité',
+                            'Ligne', 'Poste', 'arrondissement']
+
+
+def due_dates(last_control, periodicity):
+    """Next control dates: `last_control` plus `periodicity` months (NaT when either is missing)."""
+    last_control = pd.to_datetime(pd.Series(last_control), utc=True)
+    periodicity = pd.to_numeric(pd.Series(np.asarray(periodicity, dtype=object), index=last_control.index),
+                                errors='coerce')
+    due = pd.Series(pd.NaT, index=last_control.index, dtype=last_control.dtype)
+    # Month offsets are not vectorized; there are only a handful of distinct periodicities
+    for months in periodicity.dropna().unique():
+        mask = periodicity == months
+        due[mask] = last_control[mask] + pd.DateOffset(months=int(months))
+    return due
+
+
+def switch_controls(latest):
+    """Last control, periodicity and next due date of every switch of a snapshot frame.
+
+    A switch's last control is the most recent Date_control or Date_last_control of its quotes,
+    and its periodicity the shortest Périodicité among them. Returns a frame indexed by Ramses_id.
+    """
+    last_control = pd.concat([pd.to_datetime(latest[column], utc=True)
+                              for column in ('Date_control', 'Date_last_control')], axis=1).max(axis=1)
+    switches = latest.assign(last_control=last_control).groupby('Ramses_id', sort=False).agg(
+        arrondissement=('arrondissement', 'first'),
+        Ligne=('Ligne', 'first'),
+        Poste=('Poste', 'first'),
+        last_control=('last_control', 'max'),
+        periodicity=('Périodicité', 'min'),
+    )
+    switches['due_date'] = due_dates(switches['last_control'], switches['periodicity'])
+    return switches
+
+
+def days_overdue(due_date, today=None):
+    """Days since a due date (negative while it is still ahead), None without a due date."""
+    if due_date is None:
+        return None
+    today = today or timezone.now().date()
+    return (today - due_date.date()).days
+
+
+def refresh_control_schedule():
+    """Recompute the next control date of every switch from the snapshot; returns the switch count."""
+    latest = snapshot_frame(fields=SCHEDULE_SNAPSHOT_FIELDS)
+    switches = switch_controls(latest) if not latest.empty else pd.DataFrame()
+    now = timezone.now()
+    rows = [
+        ControlDue(
+            Ramses_id=row.Index, arrondissement=int(row.arrondissement),
+            Ligne=None if pd.isna(row.Ligne) else row.Ligne, Poste=None if pd.isna(row.Poste) else row.Poste,
+            last_control=None if pd.isna(row.last_control) else row.last_control.to_pydatetime(),
+            periodicity=None if pd.isna(row.periodicity) else int(row.periodicity),
+            due_date=None if pd.isna(row.due_date) else row.due_date.to_pydatetime(),
+            refreshed_at=now,
+        )
+        for row in switches.itertuples()
+    ]
+    with transaction.atomic():
+        ControlDue.objects.all().delete()
+        ControlDue.objects.bulk_create(rows, batch_size=5000)
+    logger.info("Control schedule refreshed: %d switches", len(rows))
+    return len(rows)
+
+
+def due_switches(within_days=None, arrondissements=None):
+    """ControlDue rows already overdue or due within `within_days` days, earliest due first.
+
+    Without `within_days`, only overdue switches are returned.
+    """
+    horizon = timezone.now() + datetime.timedelta(days=int(within_days or 0))
+    queryset = ControlDue.objects.filter(due_date__lte=horizon).order_by('due_date')
+    if arrondissements:
+        queryset = queryset.filter(arrondissement__in=[int(arr) for arr in arrondissements])
+    return queryset
@@ -1,74 +1,59 @@
+import json
 import pandas as pd
 import plotly.graph_objects as go
-from dash import dcc, html
+from dash import dash_table, dcc, html
 from dash.dependencies import Input, Output, State
 from django_plotly_dash import DjangoDash
-from .models import DynamicTableLoader
-import datetime
+from .degradation import degradation_rates, rank_degradation
+from .downsampling import reduce_trace
+from .gauges import LIMIT_COLUMNS, classify_frame, gauge_steps
+from .lookup_index import lookup_index
+from .partition_catalog import partition_catalog
+from .partition_fetch import fetch_partitions
+from .singleflight import singleflight
+from django.conf import settings
 import logging
 
 PAGE_SIZE = 10  # Display 10 rows at a time initially
 
 app = DjangoDash('quote_evolution_dashboard')
 
-# Static options for year and arrondissements
-STATIC_YEARS = [2010, 2011, 2012, 2013, 2016, 2017, 2018, 2019, 2020, 2021, 2022, 2023, 2024, 2070]
-STATIC_ARRONDISSEMENTS = [10, 11, 12, 21, 22, 23, 24, 25, 31, 32, 33, 34, 35, 41, 42, 43, 44, 45, 46, 51, 52, 53, 54, 0]
+# The year and arrondissement options come from the partition catalog, reloaded at this interval
+CATALOG_REFRESH_MS = getattr(settings, 'PARTITION_CATALOG_TTL', 300) * 1000
 
-# Get the current year
-current_year = datetime.datetime.now().year
+# Columns of the switch history loaded into the clientside store
+GRAPH_COLUMNS = ['Ramses_id', 'Quote_name', 'Quote_name_general', 'Quote_measured_value', 'Date_control',
+                 'IAL_min', 'IAL_max', 'IL_min', 'IL_max', 'AL_min', 'AL_max']
 
-# Add the current year to the list if it's not already present
-if current_year not in STATIC_YEARS:
-    STATIC_YEARS.append(current_year)
-    STATIC_YEARS.sort()
+# Points per graph trace; longer histories are downsampled ('lttb' or 'minmax'), constant threshold stretches collapsed
+GRAPH_MAX_POINTS = getattr(settings, 'GRAPH_MAX_POINTS', 1500)
+GRAPH_DOWNSAMPLING = getattr(settings, 'GRAPH_DOWNSAMPLING', 'lttb')
+
+# Decimals kept for the floats of the clientside history store
+STORE_DECIMALS = 4
+
+# Columns needed to compute degradation rates
+DEGRADATION_COLUMNS = ['Ramses_id', 'Quote_name', 'Quote_measured_value', 'Date_control']
+
+# Columns shown in the degradation ranking table
+DEGRADATION_TABLE_COLUMNS = ['Ramses_id', 'Quote_name', 'measurements', 'last_control', 'latest_value',
+                             'slope_total', 'slope_last_two', 'slope_fit']
+DEGRADATION_TOP = 100
 
 # Centralized function to load data
-def get_dash_data(years=None, arrondissements=None):
-    data = []
-    columns = []
+def get_dash_data(years=None, arrondissements=None, **filters):
+    """Load the selected partitions as one DataFrame.
+
+    Without filters, whole partitions come renamed from the shared partition cache. Keyword
+    filters (columns, ramses_ids, quote_names, start_date, end_date, order_by, limit, see
+    DynamicTableLoader.build_query) are pushed down to SQL and bypass the cache.
+    Partitions whose table does not exist are skipped. Concurrent calls with the same arguments
+    share one load and its DataFrame, which callers must not mutate.
+    """
+    # Identical concurrent loads (callbacks fired by the same selection, several users) run once
+    key = ('dash_data', json.dumps([years, arrondissements, filters], sort_keys=True, default=str))
     try:
-        # Convert years and arrondissements to strings if provided
-        if years and arrondissements:
-            for year in years:
-                for arrondissement in arrondissements:
-                    cols, rows = DynamicTableLoader.load_data(year, arrondissement)
-                    if not columns:
-                        columns = cols
-                    data.extend(rows)
-
-        df = pd.DataFrame(data, columns=columns)
-
-        # Rename columns according to the Django model field names (if needed)
-        df.rename(columns={
-            'Numéro ES': 'Num_ES',
-            'Catégorie UIC': 'Cat_UIC',
-            "Type d'appareil": 'Type_AW',
-            'Vitesse branche directe': 'V_directe',
-            'Vitesse branche déviée': 'V_déviée',
-            'Coeur(s) fissuré(s)': 'Coeur_fissuré',
-            'Gare / Bifurcation': 'Gare_Bifurcation',
-            'Catégorie de voie': 'Cat_voie',
-            'Modèle coeur P1': 'Modèle_P1',
-            'Modèle coeur P2': 'Modèle_P2',
-            "Nombre d'attaques compl.": 'Nombre_att_compl',
-            'Rayon voie directe': 'Rayon_directe',
-            'Nominale verkanting': 'Nom_verkanting',
-            'Model halve tongenstellen': 'Model_halve_tongenstellen',
-            'Modèle coeur K1/K2': 'Modèle_K1_K2',
-            'Arrond.': 'Arr',
-            'Poste': 'Poste',
-            'No. Ident.': 'Ramses_id',
-            'Date de contrôle': 'Date_control',
-            'Date dernier contrôle': 'Date_last_control',
-            'Type de contrôle': 'Type_control',
-            'Règle 1': 'Tool_id',
-            'Périodicité': 'Périodicité',
-            'Fiche remplie par:': 'Author',
-            'Date validation SMS': 'Date_validation_SMS'
-        }, inplace=True)
-
-        return df
+        return singleflight.do(key, lambda: fetch_partitions(years, arrondissements, **filters))
 
     except Exception as e:
         logging.error(f"Error in get_dash_data: {str(e)}")
@@ -76,18 +61,20 @@ def get_dash_data(years=None, arrondissements=None):
 
 # Layout for the Dash app
 app.layout = html.Div([
+    dcc.Interval(id='partition-catalog-interval', interval=CATALOG_REFRESH_MS),
     dcc.Dropdown(
         id='year-dropdown',
-        options=[{'label': str(year), 'value': year} for year in STATIC_YEARS],
+        options=[],
         multi=True,
         placeholder="Select years"
     ),
     dcc.Dropdown(
         id='arrondissement-dropdown',
-        options=[{'label': f'Arrond.: {arr}', 'value': arr} for arr in STATIC_ARRONDISSEMENTS],
+        options=[],
         multi=True,
         placeholder="Select arrondissements"
     ),
+    html.Div(id='selection-warning', style={'color': 'darkorange'}),
     html.Button('Load Data', id='load-data-button', n_clicks=0),
     dcc.Dropdown(
         id='ramses-id-dropdown',
@@ -124,10 +111,55 @@ app.layout = html.Div([
     html.Div(id='latest-kpi-il-min', style={'margin-top': '20px', 'fontSize': '24px', 'fontWeight': 'bold'}),
     html.Div(id='latest-kpi-al-max', style={'margin-top': '20px', 'fontSize': '24px', 'fontWeight': 'bold'}),
     html.Div(id='latest-kpi-al-min', style={'margin-top': '20px', 'fontSize': '24px', 'fontWeight': 'bold'}),
-    html.Div(id='loaded-rows', style={'display': 'none'}, children='0')
+    html.Button('Rank degradation', id='rank-degradation-button', n_clicks=0),
+    dash_table.DataTable(
+        id='degradation-table',
+        columns=[{'name': column, 'id': column} for column in DEGRADATION_TABLE_COLUMNS],
+        data=[],
+        page_size=PAGE_SIZE,
+        sort_action='native',
+    ),
+    html.Div(id='loaded-rows', style={'display': 'none'}, children='0'),
+    # History of every quote of the selected switch, see switch_store
+    dcc.Store(id='switch-history')
 ],
     className='dash-app-container')
 
+# Year and arrondissement options: only partitions that exist and hold data
+@app.callback(
+    Output('year-dropdown', 'options'),
+    Output('arrondissement-dropdown', 'options'),
+    Input('partition-catalog-interval', 'n_intervals'),
+    Input('year-dropdown', 'value')
+)
+def update_partition_options(n_intervals, selected_years):
+    try:
+        years = [{'label': str(year), 'value': year} for year in partition_catalog.years()]
+        arrondissements = [{'label': f'Arrond.: {arr}', 'value': arr}
+                           for arr in partition_catalog.arrondissements(selected_years)]
+        return years, arrondissements
+
+    except Exception as e:
+        logging.error(f"Error in update_partition_options: {str(e)}")
+        return [], []
+
+# Warn about missing partitions and selections too large to load comfortably
+@app.callback(
+    Output('selection-warning', 'children'),
+    Input('year-dropdown', 'value'),
+    Input('arrondissement-dropdown', 'value')
+)
+def update_selection_warning(selected_years, selected_arrondissements):
+    if not selected_years or not selected_arrondissements:
+        return None
+
+    try:
+        return partition_catalog.selection_warning(selected_years, selected_arrondissements)
+
+    except Exception as e:
+        logging.error(f"Error in update_selection_warning: {str(e)}")
+        return None
+
 # Callback for Ramses ID dropdown
 @app.callback(
     Output('ramses-id-dropdown', 'options'),
@@ -140,8 +172,8 @@ def update_ramses_dropdown(n_clicks, selected_years, selected_arrondissements):
         return []
 
     try:
-        df = get_dash_data(years=selected_years, arrondissements=selected_arrondissements)
-        ramses_id_options = [{'label': str(ramses_id), 'value': str(ramses_id)} for ramses_id in df['Ramses_id'].unique()]
+        ramses_ids = lookup_index.ramses_ids(selected_years, selected_arrondissements)
+        ramses_id_options = [{'label': str(ramses_id), 'value': str(ramses_id)} for ramses_id in ramses_ids]
         return ramses_id_options
 
     except Exception as e:
@@ -160,19 +192,277 @@ def update_quote_name_dropdown(selected_ramses_id, selected_years, selected_arro
         return []
 
     try:
-        df = get_dash_data(years=selected_years, arrondissements=selected_arrondissements)
-        df = df[df['Ramses_id'] == selected_ramses_id]
-        quote_name_options = [{'label': str(quote_name), 'value': str(quote_name)} for quote_name in df['Quote_name'].unique()]
+        quote_names = lookup_index.quote_names(selected_ramses_id, selected_years, selected_arrondissements)
+        quote_name_options = [{'label': str(quote_name), 'value': str(quote_name)} for quote_name in quote_names]
         return quote_name_options
 
     except Exception as e:
         logging.error(f"Error in update_quote_name_dropdown: {str(e)}")
         return []
 
+LINE_COLORS = {
+    'IAL_min': 'rgba(255,0,0,0.5)',
+    'IAL_max': 'rgba(255,0,0,0.5)',
+    'IL_min': 'rgba(255,105,180,0.5)',
+    'IL_max': 'rgba(255,105,180,0.5)',
+    'AL_min': 'rgba(255,165,0,0.5)',
+    'AL_max': 'rgba(255,165,0,0.5)'
+}
+
+# Layout of the history graph; its traces are drawn in the browser from the switch history store
+HISTORY_LAYOUT = go.Figure().update_layout(
+    title_x=0.5,
+    xaxis_title='',
+    yaxis_title='',
+    showlegend=True,
+    xaxis=dict(showline=True, linewidth=2, linecolor='black', mirror=False, showgrid=False, zeroline=False),
+    yaxis=dict(showline=True, linewidth=2, linecolor='black', mirror=False, showgrid=False, zeroline=False),
+    plot_bgcolor='white'
+).to_plotly_json()['layout']
+
+
+def load_switch_history(years, arrondissements, ramses_id):
+    """Measurements of every quote of one switch with a numeric value, sorted by quote and control date."""
+    df = get_dash_data(
+        years=years,
+        arrondissements=arrondissements,
+        columns=GRAPH_COLUMNS,
+        ramses_ids=ramses_id,
+        order_by=['Quote_name', 'Date_control'],
+    )
+    if df.empty:
+        return df
+
+    # get_dash_data results may be shared with concurrent callers: build a new frame
+    df = df.assign(Quote_measured_value=pd.to_numeric(df['Quote_measured_value'], errors='coerce'))
+    df = df.dropna(subset=['Quote_measured_value'])
+    df = df.assign(Date_control=pd.to_datetime(df['Date_control'], dayfirst=True, utc=True))
+    return df.sort_values(by=['Quote_name', 'Date_control'], kind='mergesort')
+
+
+def _rounded(values):
+    return [None if pd.isna(value) else round(float(value), STORE_DECIMALS) for value in values]
+
+
+def _epoch_ms(dates):
+    dates = pd.Series(dates).dt.tz_convert('UTC')
+    return ((dates - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).tolist()
+
+
+def overview_traces(df):
+    """Graph traces of a whole switch quote history, reduced to at most GRAPH_MAX_POINTS points each.
+
+    Returns {column: {'x': epoch milliseconds, 'y': values}} for the measured values and every
+    threshold that is not all zero; the thresholds are collapsed to steps when they allow it.
+    """
+    dates = df['Date_control']
+    traces = {}
+    for column in ['Quote_measured_value'] + LIMIT_COLUMNS:
+        thresholds = column != 'Quote_measured_value'
+        if thresholds and not df[column].ne(0).any():
+            continue
+        x, y = reduce_trace(dates, df[column], GRAPH_MAX_POINTS, GRAPH_DOWNSAMPLING, steps=thresholds)
+        traces[column] = {'x': _epoch_ms(x), 'y': _rounded(y)}
+    return traces
+
+
+def history_store(df):
+    """Columnar, JSON-ready copy of a switch quote history for the clientside callbacks.
+
+    Dates are epoch milliseconds (UTC) and floats are rounded to STORE_DECIMALS. The gauge of
+    every row is classified here, so the browser only has to pick the one of the latest row:
+    `gauge` indexes the distinct layouts listed in `gauges`. `overview` holds the traces of the
+    whole history, downsampled here (see overview_traces).
+    """
+    specs = []
+    spec_index = {}
+    gauge_rows = []
+    for _, gauge in classify_frame(df).iterrows():
+        spec = {
+            'band': gauge['band'],
+            'axis': None if pd.isna(gauge['axis_min']) else [float(gauge['axis_min']), float(gauge['axis_max'])],
+            'steps': gauge_steps(gauge),
+        }
+        key = json.dumps(spec, sort_keys=True)
+        if key not in spec_index:
+            spec_index[key] = len(specs)
+            specs.append(spec)
+        gauge_rows.append(spec_index[key])
+
+    return {
+        'dates': _epoch_ms(df['Date_control']),
+        'values': _rounded(df['Quote_measured_value']),
+        'limits': {col: _rounded(df[col]) for col in LIMIT_COLUMNS},
+        'gauge': gauge_rows,
+        'gauges': specs,
+        'overview': overview_traces(df),
+    }
+
+
+def switch_store(df, ramses_id):
+    """History store of every quote of a switch, keyed by Quote_name (see history_store)."""
+    return {
+        'ramses_id': str(ramses_id),
+        'quotes': {str(quote_name): history_store(quote)
+                   for quote_name, quote in df.groupby('Quote_name', sort=False, observed=True)},
+    }
+
+
+# Loads the history of all the quotes of a switch once; choosing a quote and dates happens in the browser
 @app.callback(
+    Output('switch-history', 'data'),
+    Input('ramses-id-dropdown', 'value'),
+    State('year-dropdown', 'value'),
+    State('arrondissement-dropdown', 'value')
+)
+def update_switch_history(selected_ramses_id, selected_years, selected_arrondissements):
+    if not selected_ramses_id or not selected_years or not selected_arrondissements:
+        return None
+
+    try:
+        df = load_switch_history(selected_years, selected_arrondissements, selected_ramses_id)
+
+        if df.empty:
+            logging.warning("The DataFrame is empty after applying filters.")
+            return {'ramses_id': str(selected_ramses_id), 'quotes': {}}
+
+        return switch_store(df, selected_ramses_id)
+
+    except Exception as e:
+        logging.error(f"Error in update_switch_history: {str(e)}")
+        return {'ramses_id': str(selected_ramses_id), 'quotes': {}, 'error': str(e)}
+
+# Graph, date filtering, gauge and KPIs of the selected quote, computed in the browser from the
+# stored switch history. Mirrors degradation_rates (rates per calendar month, 0 when the months
+# are equal) and the latest-value KPIs, whose missing limits show as 0.0.
+app.clientside_callback(
+    """
+    function(history, quoteName, startDate, endDate, loadedRows) {
+        var rows = String(parseInt(loadedRows || '0', 10) + %(page_size)d);
+        function noValues(figure, message, slopeMessage) {
+            return [figure, {}, message, slopeMessage || message, loadedRows].concat(Array(7).fill(message));
+        }
+        if (!history || !quoteName) {
+            return noValues({data: [], layout: {}}, 'No data available');
+        }
+        if (history.error) {
+            return noValues({data: [], layout: {title: {text: 'Error: ' + history.error}}},
+                            'Error: No data', 'Error calculating slopes');
+        }
+        var quote = history.quotes[quoteName];
+        if (!quote || !quote.dates.length) {
+            return noValues({data: [], layout: {}}, 'No matching data');
+        }
+
+        var start = startDate ? Date.parse(startDate.slice(0, 10)) : -Infinity;
+        var end = endDate ? Date.parse(endDate.slice(0, 10)) : Infinity;
+        var selected = [];
+        quote.dates.forEach(function(date, i) {
+            if (date >= start && date <= end) { selected.push(i); }
+        });
+
+        function asDate(ms) { return new Date(ms).toISOString().slice(0, 19).replace('T', ' '); }
+        function months(ms) { var d = new Date(ms); return d.getUTCFullYear() * 12 + d.getUTCMonth(); }
+        function pyFloat(value) {
+            value = value === null ? 0.0 : value;
+            return Number.isInteger(value) ? value.toFixed(1) : String(value);
+        }
+
+        // Largest-Triangle-Three-Buckets over the selected rows, like downsampling.lttb_indices
+        function lttb(indices, maxPoints) {
+            var n = indices.length;
+            if (maxPoints >= n || maxPoints < 3) { return indices; }
+            var x = indices.map(function(i) { return quote.dates[i] - quote.dates[indices[0]]; });
+            var y = indices.map(function(i) { return quote.values[i]; });
+            // Bucket edges as numpy.linspace(1, n - 1, maxPoints - 1) computes them
+            var edges = [], step = (n - 2) / (maxPoints - 2);
+            for (var b = 0; b < maxPoints - 2; b++) { edges.push(Math.floor(b * step + 1)); }
+            edges.push(n - 1, n);
+            var kept = 0, shown = [indices[0]];
+            for (var bucket = 0; bucket < maxPoints - 2; bucket++) {
+                var bucketStart = edges[bucket], bucketEnd = edges[bucket + 1], nextEnd = edges[bucket + 2];
+                var avgX = 0, avgY = 0;
+                for (var j = bucketEnd; j < nextEnd; j++) { avgX += x[j]; avgY += y[j]; }
+                avgX /= nextEnd - bucketEnd;
+                avgY /= nextEnd - bucketEnd;
+                var best = bucketStart, bestArea = -1;
+                for (var k = bucketStart; k < bucketEnd; k++) {
+                    var area = Math.abs((x[kept] - avgX) * (y[k] - y[kept]) - (x[kept] - x[k]) * (avgY - y[kept]));
+                    if (area > bestArea) { bestArea = area; best = k; }
+                }
+                kept = best;
+                shown.push(indices[kept]);
+            }
+            shown.push(indices[n - 1]);
+            return shown;
+        }
+
+        // The whole history uses the traces reduced on the server; a date range redraws the
+        // measured trace from the selected rows, with the same point budget
+        var lineColors = %(line_colors)s;
+        function trace(name, x, y, mode, color) {
+            return {type: 'scatter', x: x.map(asDate), y: y, mode: mode, name: name, line: {color: color}};
+        }
+        var layout = %(layout)s;
+        layout.title = Object.assign({}, layout.title, {text: 'AW ' + history.ramses_id + ' quote ' + quoteName + ' over time'});
+        var measured = quote.overview.Quote_measured_value;
+        if (startDate || endDate) {
+            var shown = lttb(selected, %(max_points)d);
+            measured = {x: shown.map(function(i) { return quote.dates[i]; }),
+                        y: shown.map(function(i) { return quote.values[i]; })};
+            var first = selected.length ? quote.dates[selected[0]] : start;
+            var last = selected.length ? quote.dates[selected[selected.length - 1]] : end;
+            layout.xaxis = Object.assign({}, layout.xaxis, {autorange: false,
+                range: [asDate(isFinite(start) ? start : first), asDate(isFinite(end) ? end : last)]});
+        }
+        var data = [trace('Quote Measured Value', measured.x, measured.y, 'lines+markers', 'blue')];
+        Object.keys(lineColors).forEach(function(name) {
+            var threshold = quote.overview[name];
+            if (threshold) { data.push(trace(name, threshold.x, threshold.y, 'lines', lineColors[name])); }
+        });
+        var figure = {data: data, layout: layout};
+
+        if (!selected.length) {
+            return noValues(figure, 'No matching data');
+        }
+
+        var firstRow = selected[0], lastRow = selected[selected.length - 1];
+        var previousRow = selected.length > 1 ? selected[selected.length - 2] : lastRow;
+        var latest = quote.values[lastRow];
+        function rate(from, to) {
+            var monthDiff = months(quote.dates[to]) - months(quote.dates[from]);
+            return monthDiff !== 0 ? (quote.values[to] - quote.values[from]) / monthDiff : 0.0;
+        }
+
+        var gauge = quote.gauges[quote.gauge[lastRow]];
+        var gaugeLayout = {bar: {color: 'darkblue'}, steps: gauge.steps.map(function(step) {
+            return {range: step.range, color: step.color};
+        }), threshold: {line: {color: 'red', width: 4}, thickness: 0.75, value: latest}};
+        if (gauge.axis) { gaugeLayout.axis = {range: gauge.axis}; }
+        var gaugeFigure = {data: [{type: 'indicator', mode: 'gauge+number', value: latest,
+                                   number: {font: {color: gauge.band}}, gauge: gaugeLayout}], layout: {}};
+
+        var limit = function(name) { return pyFloat(quote.limits[name][lastRow]); };
+        return [
+            figure,
+            gaugeFigure,
+            'Taux de dégradation total: changement de ' + rate(firstRow, lastRow).toFixed(2) + ' par mois',
+            'Taux de dégradation entre les deux dernières mesures: changement de ' + rate(previousRow, lastRow).toFixed(2) + ' par mois',
+            rows,
+            'Valeur la plus récente: ' + latest.toFixed(2),
+            'Valeur IAL max la plus récente: ' + limit('IAL_max'),
+            'Valeur IAL min la plus récente: ' + limit('IAL_min'),
+            'Valeur IL max la plus récente: ' + limit('IL_max'),
+            'Valeur IL min la plus récente: ' + limit('IL_min'),
+            'Valeur AL max la plus récente: ' + limit('AL_max'),
+            'Valeur AL min la plus récente: ' + limit('AL_min')
+        ];
+    }
+    """ % {'page_size': PAGE_SIZE, 'max_points': GRAPH_MAX_POINTS, 'line_colors': json.dumps(LINE_COLORS),
+           'layout': json.dumps(HISTORY_LAYOUT)},
     [
         Output('quote-measured-value-graph', 'figure'),
-        Output('gauge-chart', 'figure'),  # Output for gauge chart
+        Output('gauge-chart', 'figure'),
         Output('kpi-slope', 'children'),
         Output('kpi-last-two-points-slope', 'children'),
         Output('loaded-rows', 'children'),
@@ -185,458 +475,40 @@ def update_quote_name_dropdown(selected_ramses_id, selected_years, selected_arro
         Output('latest-kpi-al-min', 'children')
     ],
     [
+        Input('switch-history', 'data'),
         Input('quote-name-dropdown', 'value'),
         Input('date-picker-range', 'start_date'),
         Input('date-picker-range', 'end_date')
     ],
     [
-        State('ramses-id-dropdown', 'value'),
-        State('year-dropdown', 'value'),
-        State('arrondissement-dropdown', 'value'),
         State('loaded-rows', 'children')
-    ]
+    ],
+    prevent_initial_call=True
 )
-def update_graph(selected_quote_name, start_date, end_date, selected_ramses_id, selected_years, selected_arrondissements, loaded_rows):
-    slope = 0.0
-    last_two_points_slope = 0.0
-    latest_value = None
-    latest_ial_max = None
-    latest_ial_min = None
-    latest_il_max = None
-    latest_il_min = None
-    latest_al_max = None
-    latest_al_min = None
-
-    if not selected_quote_name or not selected_ramses_id or not selected_years or not selected_arrondissements:
-        return [go.Figure(), go.Figure(), "No data available", "No data available", loaded_rows, "No data available", "No data available", "No data available", "No data available", "No data available", "No data available", "No data available"]
-
-    try:
-        df = get_dash_data(years=selected_years, arrondissements=selected_arrondissements)
-
-        df = df[df['Ramses_id'] == selected_ramses_id]
-        df = df[df['Quote_name'] == selected_quote_name]
 
-        if start_date:
-            df = df[df['Date_control'] >= pd.to_datetime(start_date)]
-        if end_date:
-            df = df[df['Date_control'] <= pd.to_datetime(end_date)]
+# Callback for the degradation ranking table
+@app.callback(
+    Output('degradation-table', 'data'),
+    Input('rank-degradation-button', 'n_clicks'),
+    State('year-dropdown', 'value'),
+    State('arrondissement-dropdown', 'value')
+)
+def update_degradation_table(n_clicks, selected_years, selected_arrondissements):
+    if n_clicks == 0 or not selected_years or not selected_arrondissements:
+        return []
 
+    try:
+        df = get_dash_data(years=selected_years, arrondissements=selected_arrondissements,
+                           columns=DEGRADATION_COLUMNS)
         if df.empty:
-            logging.warning("The DataFrame is empty after applying filters.")
-            return go.Figure(), go.Figure(), "No matching data", "No matching data", loaded_rows, "No matching data", "No matching data", "No matching data", "No matching data", "No matching data", "No matching data"
-
-        df['Quote_measured_value'] = pd.to_numeric(df['Quote_measured_value'], errors='coerce')
-        df_filtered = df.dropna(subset=['Quote_measured_value'])
-
-        if not df_filtered.empty:
-            df_filtered['Date_control'] = pd.to_datetime(df_filtered['Date_control'], dayfirst=True)
-            df_filtered = df_filtered.sort_values(by='Date_control')
-
-            # Get the latest value and IAL_max
-            latest_value = df_filtered['Quote_measured_value'].iloc[-1]
-            latest_ial_max = df_filtered['IAL_max'].iloc[-1] if not df_filtered['IAL_max'].isna().all() else ""
-            latest_ial_min = df_filtered['IAL_min'].iloc[-1] if not df_filtered['IAL_min'].isna().all() else ""
-            latest_il_max = df_filtered['IL_max'].iloc[-1] if not df_filtered['IL_max'].isna().all() else ""
-            latest_il_min = df_filtered['IL_min'].iloc[-1] if not df_filtered['IL_min'].isna().all() else ""
-            latest_al_max = df_filtered['AL_max'].iloc[-1] if not df_filtered['AL_max'].isna().all() else ""
-            latest_al_min = df_filtered['AL_min'].iloc[-1] if not df_filtered['AL_min'].isna().all() else ""
-
-            def safe_convert_latest(value):
-                if pd.isna(value) or value == "":
-                    return 0.0
-                return float(value)
-
-            latest_value = df_filtered['Quote_measured_value'].iloc[-1]
-            latest_ial_max = safe_convert_latest(df_filtered['IAL_max'].iloc[-1])
-            latest_ial_min = safe_convert_latest(df_filtered['IAL_min'].iloc[-1])
-            latest_il_max = safe_convert_latest(df_filtered['IL_max'].iloc[-1])
-            latest_il_min = safe_convert_latest(df_filtered['IL_min'].iloc[-1])
-            latest_al_max = safe_convert_latest(df_filtered['AL_max'].iloc[-1])
-            latest_al_min = safe_convert_latest(df_filtered['AL_min'].iloc[-1])
-
-            fig = go.Figure()
-
-            fig.add_trace(go.Scatter(
-                x=df_filtered['Date_control'],
-                y=df_filtered['Quote_measured_value'],
-                mode='lines+markers',
-                name='Quote Measured Value',
-                line=dict(color='blue')
-            ))
-
-            line_colors = {
-                'IAL_min': 'rgba(255,0,0,0.5)',  
-                'IAL_max': 'rgba(255,0,0,0.5)',  
-                'IL_min': 'rgba(255,105,180,0.5)',  
-                'IL_max': 'rgba(255,105,180,0.5)',  
-                'AL_min': 'rgba(255,165,0,0.5)',  
-                'AL_max': 'rgba(255,165,0,0.5)'   
-            }
-
-            columns_to_plot = ['IAL_min', 'IAL_max', 'IL_min', 'IL_max', 'AL_min', 'AL_max']
-            for col in columns_to_plot:
-                if df_filtered[col].ne(0).sum() > 0:
-                    fig.add_trace(go.Scatter(
-                        x=df_filtered['Date_control'],
-                        y=df_filtered[col],
-                        mode='lines',
-                        name=col,
-                        line=dict(color=line_colors[col])
-                    ))
-
-            fig.update_layout(
-                title=f"AW {selected_ramses_id} quote {selected_quote_name} over time",
-                title_x=0.5,
-                xaxis_title='',
-                yaxis_title='',
-                showlegend=True,
-                xaxis=dict(showline=True, linewidth=2, linecolor='black', mirror=False, showgrid=False, zeroline=False),
-                yaxis=dict(showline=True, linewidth=2, linecolor='black', mirror=False, showgrid=False, zeroline=False),
-                plot_bgcolor='white'
-            )
-
-            Quote_name_general = df_filtered['Quote_name_general'].iloc[-1]
-
-            Both_ends_gauge = ['E','Ebis', 'CE','Ec', 'X','Tx','T','Ecartement ']
-            One_end_lower_gauge = ['A', 'D','F',  'J','L', 'S', 'Dp ()',
-            'DwrL', 'DwrR', 'M', 'M_value', 'Z',  'Fbis',
-            'Jbis','Z jeu max mm','Ua', 'Uca', 'Ud','s',
-            'Jeux aiguilles/coussinets', 'M_value_value', 'Dpl D', 'Dpl G', 'Dvr L', 'Dvr R']
-            One_end_upper_gauge = ['B', 'C','K', 'k','X']
-            
-
-            if Quote_name_general in Both_ends_gauge:
-                background_color = "green"  # Default color if something goes wrong
-
-
-                green_min = None
-                green_max = None
-                if not pd.isna(latest_al_min) or not pd.isna(latest_al_max):
-                    green_min = float(latest_al_min) if not pd.isna(latest_al_min) else None
-                    green_max = float(latest_al_max) if not pd.isna(latest_al_max) else None
-                elif not pd.isna(latest_il_min) or not pd.isna(latest_il_max):
-                    green_min = float(latest_il_min) if not pd.isna(latest_il_min) else None
-                    green_max = float(latest_il_max) if not pd.isna(latest_il_max) else None
-                elif not pd.isna(latest_ial_min) or not pd.isna(latest_ial_max):
-                    green_min = float(latest_ial_min) if not pd.isna(latest_ial_min) else None
-                    green_max = float(latest_ial_max) if not pd.isna(latest_ial_max) else None
-
-                # Orange Range
-                orange_ranges = []
-                if not pd.isna(latest_al_min):
-                    if not pd.isna(latest_il_min):
-                        orange_ranges.append((float(latest_al_min), float(latest_il_min)))
-                    elif not pd.isna(latest_ial_min):
-                        orange_ranges.append((float(latest_al_min), float(latest_ial_min)))
-
-                if not pd.isna(latest_al_max):
-                    if not pd.isna(latest_il_max):
-                        orange_ranges.append((float(latest_al_max), float(latest_il_max)))
-                    elif not pd.isna(latest_ial_max):
-                        orange_ranges.append((float(latest_al_max), float(latest_ial_max)))
-
-                # Pink Range
-                pink_ranges = []
-                if not pd.isna(latest_ial_min) and not pd.isna(latest_il_min):
-                    pink_ranges.append((float(latest_ial_min), float(latest_il_min)))
-
-                if not pd.isna(latest_ial_max) and not pd.isna(latest_il_max):
-                    pink_ranges.append((float(latest_ial_max), float(latest_il_max)))
-
-                # Red Range
-                red_ranges = []
-                if not pd.isna(latest_ial_min):
-                    red_ranges.append((float(latest_ial_min) - 10, float(latest_ial_min)))
-                if not pd.isna(latest_ial_max):
-                    red_ranges.append((float(latest_ial_max), float(latest_ial_max) + 10))
-
-                # Determine the background color of the gauge value based on the latest_value
-                if green_min is not None and green_max is not None and green_min <= latest_value <= green_max:
-                    background_color = "green"
-                elif any(low <= latest_value <= high for low, high in orange_ranges):
-                    background_color = "orange"
-                elif any(low <= latest_value <= high for low, high in pink_ranges):
-                    background_color = "pink"
-                elif any(low <= latest_value <= high for low, high in red_ranges):
-                    background_color = "red"          
-
-
-                background_color = None
-
-                if latest_value <= float(latest_ial_min):
-                    background_color = "red"
-                elif latest_value <= float(latest_il_min):
-                    background_color = "pink"
-                elif latest_value <= float(latest_al_min):
-                    background_color = "orange"
-                elif latest_value <= float(latest_al_max):
-                    background_color = "green"
-                elif latest_value <= float(latest_il_max):
-                    background_color = "orange"
-                elif latest_value <= float(latest_ial_max):
-                    background_color = "pink"
-                else:
-                    background_color = "red"
-
-                # Create gauge chart
-                gauge_fig = go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=latest_value,
-                    number={'font': {'color': background_color}},  # Set the font color to match the background
-                    gauge={
-                        'axis': {'range': [(float(latest_ial_min)-10) if not pd.isna(latest_ial_min) else 0, 
-                                        (float(latest_ial_max)+10) if not pd.isna(latest_ial_max) else 100]},
-                        'bar': {'color': "darkblue"},
-                        'steps': [
-                            *([{'range': [low, high], 'color': "red"} for low, high in red_ranges]),
-                            *([{'range': [low, high], 'color': "pink"} for low, high in pink_ranges]),
-                            *([{'range': [low, high], 'color': "orange"} for low, high in orange_ranges]),
-                            {'range': [green_min, green_max], 'color': "green"} if green_min is not None and green_max is not None else {},
-                        ],
-                        'threshold': {
-                            'line': {'color': "red", 'width': 4},
-                            'thickness': 0.75,
-                            'value': latest_value}
-                    }
-                ))
-
-
-            elif Quote_name_general in One_end_lower_gauge:
-                background_color = "green"  # Default color if something goes wrong
-
-                # Define the color ranges
-                green_range = [0, 2000]
-                orange_range = [None, None]
-                pink_range = [None, None]
-                red_range = [None, None]
-
-                # Determine ranges based on the availability of AL_min, IL_min, and IAL_min
-
-                # Green Range (Below AL_min or up to the start of any colored sections)
-                if latest_al_min != 0.0:
-                    green_range = [0, float(latest_al_min)]
-                    orange_range = [float(latest_al_min), (float(latest_al_min)+20)]  
-                elif latest_il_min != 0.0:
-                    green_range = [0, float(latest_il_min)]
-                    pink_range = [float(latest_il_min), (float(latest_il_min)+20)]
-                elif latest_ial_min != 0.0:
-                    green_range = [0, float(latest_ial_min)]
-                    red_range = [float(latest_ial_min), (float(latest_ial_min)+20)]
-
-                # Orange Range (Between AL_min and IL_min or IAL_min or infinity)
-                if latest_al_min != 0.0:
-                    if latest_il_min != 0.0:
-                        orange_range[1] = float(latest_il_min)  # Ends at IL_min if available
-                        pink_range = [float(latest_il_min), (float(latest_il_min)+20)]
-                    elif latest_ial_min != 0.0:
-                        orange_range[1] = float(latest_ial_min)  # Ends at IAL_min if IL_min is not available
-                        red_range = [float(latest_ial_min), (float(latest_ial_min)+20)]
-                    else:
-                        orange_range[1] = (float(latest_al_min)+20)  # Ends at al+20 if neither IL_min nor IAL_min are available
-
-                # Pink Range (Between IL_min and IAL_min)
-                if latest_il_min != 0.0:
-                    if latest_ial_min != 0.0:
-                        pink_range = [float(latest_il_min), float(latest_ial_min)]
-                        red_range = [float(latest_ial_min), (float(latest_ial_min)+20)]
-                    else:
-                        pink_range = [float(latest_il_min), (float(latest_il_min)+20)]  # All remaining space is pink
-
-                # Red Range (Above IAL_min)
-                if latest_ial_min != 0.0:
-                    red_range = [float(latest_ial_min), (float(latest_ial_min)+20)]  # All remaining space is red
-
-                # Ensure ranges are correctly bounded
-                green_range[1] = min(filter(lambda x: x is not None, [green_range[1], orange_range[0], pink_range[0], red_range[0]]))
-                orange_range[1] = min(filter(lambda x: x is not None, [orange_range[1], pink_range[0], red_range[0]]))
-                pink_range[1] = min(filter(lambda x: x is not None, [pink_range[1], red_range[0]]))
-
-                # Determine the background color of the gauge value based on the latest_value
-                if green_range[0] <= latest_value < green_range[1]:
-                    background_color = "green"
-                elif orange_range[0] is not None and orange_range[0] <= latest_value < orange_range[1]:
-                    background_color = "orange"
-                elif pink_range[0] is not None and pink_range[0] <= latest_value < pink_range[1]:
-                    background_color = "pink"
-                elif red_range[0] <= latest_value:
-                    background_color = "red"
-
-                # Create gauge chart
-                gauge_fig = go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=latest_value,
-                    number={'font': {'color': background_color}}, 
-                    gauge={
-                        'axis': {'range': [max(0, float(latest_value) - 20), float(latest_ial_min) + 20] if latest_ial_min != 0.0 else [max(0, float(latest_value) - 20), float(latest_value) + 20]},
-                        'bar': {'color': "darkblue"},
-                        'steps': [
-                            {'range': green_range, 'color': "green"} if green_range[1] is not None else {},
-                            {'range': orange_range, 'color': "orange"} if orange_range[1] is not None else {},
-                            {'range': pink_range, 'color': "pink"} if pink_range[1] is not None else {},
-                            {'range': red_range, 'color': "red"} if red_range[1] is not None else {},
-                        ],
-                        'threshold': {
-                            'line': {'color': "red", 'width': 4},
-                            'thickness': 0.75,
-                            'value': latest_value}
-                    }
-                ))
-
-
-
-            elif Quote_name_general in One_end_upper_gauge:
-                background_color = "green"  # Default color if something goes wrong
-
-                # Define the color ranges
-                green_range = [None, None]
-                orange_range = [None, None]
-                pink_range = [None, None]
-                red_range = [None, None]  # Start with the assumption that everything is green
-
-                # Gauge Range (Overall Range of the Gauge)
-                start_value = 0
-                if latest_ial_max != 0.0:
-                    start_value = float(latest_ial_max) - 20
-                elif latest_il_max != 0.0:
-                    start_value = float(latest_il_max) - 20
-                elif latest_al_max != 0.0:
-                    start_value = float(latest_al_max) - 20
-                else:
-                    start_value = max(0, float(latest_value) - 20)
-
-                # Red Section
-                if latest_ial_max != 0.0:
-                    red_range = [float(latest_ial_max) - 20, float(latest_ial_max)]
-
-                # Pink Section
-                if latest_il_max != 0.0:
-                    if latest_ial_max != 0.0:
-                        pink_range = [float(latest_ial_max), float(latest_il_max)]
-                    else:
-                        pink_range = [float(latest_il_max) - 20, float(latest_il_max)]
-
-                # Orange Section
-                if latest_al_max != 0.0:
-                    if latest_il_max != 0.0:
-                        orange_range = [float(latest_il_max), float(latest_al_max)]
-                    elif latest_ial_max != 0.0:
-                        orange_range = [float(latest_ial_max), float(latest_al_max)]
-                    else:
-                        orange_range = [float(latest_al_max) - 20, float(latest_al_max)]
-
-                # Green Section
-                if latest_al_max != 0.0:
-                    green_range = [float(latest_al_max), float(latest_value) + 20]
-                elif latest_il_max != 0.0:
-                    green_range = [float(latest_il_max), float(latest_value) + 20]
-                elif latest_ial_max != 0.0:
-                    green_range = [float(latest_ial_max), float(latest_value) + 20]
-                else:
-                    green_range = [0, float(latest_value) + 20]
-
-                # Ensure ranges are correctly bounded
-                red_range[1] = min(filter(lambda x: x is not None, [red_range[1], pink_range[0], orange_range[0], green_range[0]]))
-                pink_range[1] = min(filter(lambda x: x is not None, [pink_range[1], orange_range[0], green_range[0]]))
-                orange_range[1] = min(filter(lambda x: x is not None, [orange_range[1], green_range[0]]))
-
-                # Determine the background color of the gauge value based on the latest_value
-                if red_range[0] <= latest_value < red_range[1]:
-                    background_color = "red"
-                elif pink_range[0] is not None and pink_range[0] <= latest_value < pink_range[1]:
-                    background_color = "pink"
-                elif orange_range[0] is not None and orange_range[0] <= latest_value < orange_range[1]:
-                    background_color = "orange"
-                elif green_range[0] <= latest_value:
-                    background_color = "green"
-
-                # Create gauge chart
-                gauge_fig = go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=latest_value,
-                    number={'font': {'color': background_color}}, 
-                    gauge={
-                        'axis': {'range': [start_value, float(latest_value) + 20]},
-                        'bar': {'color': "darkblue"},
-                        'steps': [
-                            {'range': red_range, 'color': "red"} if red_range[1] is not None else {},
-                            {'range': pink_range, 'color': "pink"} if pink_range[1] is not None else {},
-                            {'range': orange_range, 'color': "orange"} if orange_range[1] is not None else {},
-                            {'range': green_range, 'color': "green"} if green_range[1] is not None else {},
-                        ],
-                        'threshold': {
-                            'line': {'color': "red", 'width': 4},
-                            'thickness': 0.75,
-                            'value': latest_value}
-                    }
-                ))
-
-
-
-            else:
-                background_color = "green"  
-                gauge_fig = go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=latest_value,
-                    number={'font': {'color': background_color}}, 
-                    gauge={
-                        'bar': {'color': "darkblue"},
-                        'threshold': {
-                            'line': {'color': "red", 'width': 4},
-                            'thickness': 0.75,
-                            'value': latest_value}
-                    }
-                ))
-
-            
-
-            if len(df_filtered) > 1:
-                x_first = df_filtered['Date_control'].iloc[0]
-                x_last = df_filtered['Date_control'].iloc[-1]
-                y_first = df_filtered['Quote_measured_value'].iloc[0]
-                y_last = df_filtered['Quote_measured_value'].iloc[-1]
-
-                time_diff_months = (x_last.year - x_first.year) * 12 + (x_last.month - x_first.month)
-                if time_diff_months != 0:
-                    slope = (y_last - y_first) / time_diff_months
-
-                if len(df_filtered) > 1:
-                    x_second_last = df_filtered['Date_control'].iloc[-2]
-                    y_second_last = df_filtered['Quote_measured_value'].iloc[-2]
-
-                    time_diff_last_two_months = (x_last.year - x_second_last.year) * 12 + (x_last.month - x_second_last.month)
-                    if time_diff_last_two_months != 0:
-                        last_two_points_slope = (y_last - y_second_last) / time_diff_last_two_months
-
-            return fig, gauge_fig, f"Taux de dégradation total: changement de {slope:.2f} par mois", f"Taux de dégradation entre les deux dernières mesures: changement de {last_two_points_slope:.2f} par mois", str(int(loaded_rows) + PAGE_SIZE), f"Valeur la plus récente: {latest_value:.2f}", f"Valeur IAL max la plus récente: {latest_ial_max}", f"Valeur IAL min la plus récente: {latest_ial_min}", f"Valeur IL max la plus récente: {latest_il_max}", f"Valeur IL min la plus récente: {latest_il_min}", f"Valeur AL max la plus récente: {latest_al_max}", f"Valeur AL min la plus récente: {latest_al_min}"
-
-        else:
-            return go.Figure(), go.Figure(), "No matching data", "No matching data", loaded_rows, "No matching data", "No matching data", "No matching data", "No matching data", "No matching data", "No matching data"
+            return []
+        ranked = rank_degradation(degradation_rates(df, fit=True), top=DEGRADATION_TOP)
+        ranked['last_control'] = ranked['last_control'].dt.strftime('%d-%m-%Y')
+        return ranked[DEGRADATION_TABLE_COLUMNS].round(3).to_dict('records')
 
     except Exception as e:
-        logging.error(f"Error in update_graph: {str(e)}")
-        fig = go.Figure()
-        gauge_fig = go.Figure()
-        fig.update_layout(
-            title=f'Error: {str(e)}',
-            xaxis_title='',
-            yaxis_title='',
-            showlegend=True
-        )
-        return fig, gauge_fig, "Error: No data", "Error calculating slopes", loaded_rows, "Error: No data", "Error: No data", "Error: No data", "Error: No data", "Error: No data", "Error: No data"
+        logging.error(f"Error in update_degradation_table: {str(e)}")
+        return []
 
 if __name__ == '__main__':
     app.run_server(debug=True)
-
-
-
-
-
-
-
-
-
-
-
-
-
-[10, 11, 12, 21, 22, 23, 24, 25, 31, 32, 33, 34, 35, 41, 42, 43, 44, 45, 46, 51, 52, 53, 54, 0]
\ No newline at end of file
@@ -1,8 +1,7 @@
 import pandas as pd
-from .models import DynamicTableLoader
-from django.core.cache import cache
+from .analysis_cache import analysis_cache
+from .partition_fetch import existing_partitions, fetch_partitions
 import logging
-import hashlib
 
 def binary_search(df, column, value, start=True):
     """Perform a binary search to find the starting or ending index of a value in a sorted dataframe column."""
@@ -24,74 +23,53 @@ def binary_search(df, column, value, start=True):
 
 logger = logging.getLogger(__name__)
 
-def generate_safe_cache_key(*args):
-    """Generate a safe cache key using a hash function."""
-    key = ":".join(str(arg) for arg in args)
-    return hashlib.md5(key.encode()).hexdigest()
+# Columns of the data table, in display order
+INITIAL_COLUMNS = ['Ramses_id', 'Quote_name', 'Quote_measured_value', 'Quote_category', 'Quote_State', 'Date_control']
+ADDITIONAL_COLUMNS = [
+    'Corrected_value', 'Branch', 'Nominal_value', 'IAL_min', 'IAL_max', 'IL_min', 'IL_max', 'AL_min', 'AL_max',
+    'NEW_min', 'NEW_max', 'MAI_min', 'MAI_max', 'Quote_name_general', 'Num_ES', 'Cat_UIC', 'Stratégie', 
+    'Type_AW', 'Switch_family', 'Tangent_hart', 'Déviation', 'V_directe', 'V_déviée', 'Faisceau', 
+    'Date_dernier_renouv', 'Coeur_fissuré', 'Gare_Bifurcation', 'Ligne', 'Cat_voie', 'Voie', 
+    'Wissel_begin', 'Wisselzone_begin', 'Wissel_einde', 'Wisselzone_einde', 'Wissel_begin_KP', 'Wissel_begin_M', 
+    'Wissel_einde_KP', 'Wissel_einde_M', 'Wisselzone_begin_KP', 'Wisselzone_begin_M', 'Wisselzone_einde_KP', 
+    'Wisselzone_einde_M', 'Modèle_P1', 'Modèle_P2', 'Nombre_att_compl', 'Rayon_directe', 'Straal_afwijkende_tak', 
+    'Nom_verkanting', 'Model_halve_tongenstellen', 'Modèle_K1_K2', 'Arr', 'Poste',
+    'Date_last_control', 'Type_control', 'Tool_id', 'Périodicité', 'Author'
+]
 
-def perform_data_analysis(ramses_id=None, quote_name=None, start_date=None, end_date=None, years=None, arrondissements=None, limit=10000, initial_columns_only=False):
-    # Generate cache key based on parameters
-    cache_key = generate_safe_cache_key('data_analysis', ramses_id, quote_name, start_date, end_date, years, arrondissements, limit, initial_columns_only)
-    cached_result = cache.get(cache_key)
-
-    if cached_result is not None:
-        return cached_result
 
-    # Load data dynamically from the partitioned tables
-    data = []
-    columns = []
-    
-    if years and arrondissements:
-        for year in years:
-            for arrondissement in arrondissements:
-                cols, rows = DynamicTableLoader.load_data(year, arrondissement)
-                if not columns:
-                    columns = cols
-                data.extend(rows)
-    
-    df = pd.DataFrame(data, columns=columns)
-    
-    # Apply filters
-    if ramses_id:
-        df = df[df['Ramses_id'] == ramses_id]
-    if start_date:
-        df = df[df['Date_control'] >= start_date]
-    if end_date:
-        df = df[df['Date_control'] <= end_date]
-    if quote_name:
-        df = df[df['Quote_name'] == quote_name]
+def perform_data_analysis(ramses_id=None, quote_name=None, start_date=None, end_date=None, years=None, arrondissements=None, limit=10000, initial_columns_only=False):
+    """Filtered, sorted and limited rows of the selected partitions.
 
-    # Check if DataFrame is empty
-    if df.empty:
-        logger.warning("The DataFrame is empty after applying filters.")
-        return pd.DataFrame()  # Return an empty DataFrame to avoid further errors
+    Results are cached in the analysis cache, keyed by the canonicalized parameters and the
+    version stamps of the partitions, so a change in any of them gives a new result.
+    """
+    partitions = existing_partitions(years, arrondissements)
 
-    # Define the initial columns
-    initial_columns = ['Ramses_id', 'Quote_name', 'Quote_measured_value', 'Quote_category', 'Quote_State', 'Date_control']
+    def analyse():
+        # Load data from the partitioned tables, pushing the filters down to SQL when there are any
+        df = fetch_partitions(years, arrondissements, ramses_ids=ramses_id, quote_names=quote_name,
+                              start_date=start_date, end_date=end_date)
 
-    if initial_columns_only:
-        df = df[initial_columns]
-    else:
-        additional_columns = [
-            'Corrected_value', 'Branch', 'Nominal_value', 'IAL_min', 'IAL_max', 'IL_min', 'IL_max', 'AL_min', 'AL_max',
-            'NEW_min', 'NEW_max', 'MAI_min', 'MAI_max', 'Quote_name_general', 'Num_ES', 'Cat_UIC', 'Stratégie', 
-            'Type_AW', 'Switch_family', 'Tangent_hart', 'Déviation', 'V_directe', 'V_déviée', 'Faisceau', 
-            'Date_dernier_renouv', 'Coeur_fissuré', 'Gare_Bifurcation', 'Ligne', 'Cat_voie', 'Voie', 
-            'Wissel_begin', 'Wisselzone_begin', 'Wissel_einde', 'Wisselzone_einde', 'Wissel_begin_KP', 'Wissel_begin_M', 
-            'Wissel_einde_KP', 'Wissel_einde_M', 'Wisselzone_begin_KP', 'Wisselzone_begin_M', 'Wisselzone_einde_KP', 
-            'Wisselzone_einde_M', 'Modèle_P1', 'Modèle_P2', 'Nombre_att_compl', 'Rayon_directe', 'Straal_afwijkende_tak', 
-            'Nom_verkanting', 'Model_halve_tongenstellen', 'Modèle_K1_K2', 'Arr', 'Poste',
-            'Date_last_control', 'Type_control', 'Tool_id', 'Périodicité', 'Author'
-        ]
-        df = df[initial_columns + additional_columns]
+        # Check if DataFrame is empty
+        if df.empty:
+            logger.warning("The DataFrame is empty after applying filters.")
+            return pd.DataFrame()  # Return an empty DataFrame to avoid further errors
 
-    # Sort the DataFrame by Ramses_id, Quote_name, and Date_control
-    df = df.sort_values(by=['Ramses_id', 'Quote_name', 'Date_control'])
+        if initial_columns_only:
+            df = df[INITIAL_COLUMNS]
+        else:
+            df = df[INITIAL_COLUMNS + ADDITIONAL_COLUMNS]
 
-    # Limit the DataFrame to the specified number of rows
-    df = df.head(limit)
+        # Sort the DataFrame by Ramses_id, Quote_name, and Date_control; stable, so the
+        # result does not depend on the order the partitions were selected in
+        df = df.sort_values(by=['Ramses_id', 'Quote_name', 'Date_control'], kind='mergesort')
 
-    # Cache the result for 1 hour
-    cache.set(cache_key, df, 3600)
+        # Limit the DataFrame to the specified number of rows
+        return df.head(limit).reset_index(drop=True)
 
-    return df
+    return analysis_cache.get_or_compute(
+        'data_analysis', partitions, analyse,
+        ramses_id=ramses_id, quote_name=quote_name, start_date=start_date, end_date=end_date,
+        limit=limit, initial_columns_only=initial_columns_only,
+    )
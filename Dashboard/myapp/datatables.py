@@ -0,0 +1,195 @@
+import logging
+import threading
+
+from django.db import connection
+
+from .data_analysis import ADDITIONAL_COLUMNS, INITIAL_COLUMNS
+from .models import FIELD_COLUMNS, DynamicTableLoader, quote_identifier
+from .partition_fetch import build_union_query, existing_partitions
+
+logger = logging.getLogger(__name__)
+
+# Columns of the data table in index.html, in display order
+TABLE_COLUMNS = INITIAL_COLUMNS + ADDITIONAL_COLUMNS
+
+# Columns matched by the global search box
+GLOBAL_SEARCH_COLUMNS = ['Ramses_id', 'Quote_name', 'Quote_category', 'Quote_State']
+
+MAX_PAGE_LENGTH = 1000
+
+# Row count of every partition with the version stamp it was counted at (see partition_total)
+_partition_totals = {}
+_totals_lock = threading.Lock()
+
+
+def _search_condition(columns, value):
+    terms = [f"CAST({quote_identifier(column)} AS TEXT) ILIKE %s" for column in columns]
+    return f"({' OR '.join(terms)})", [f"%{value}%"] * len(columns)
+
+
+def _cell(value):
+    # Same as fillna(''): NULLs and NaNs become empty cells
+    if value is None or value != value:
+        return ''
+    return value
+
+
+def partition_total(year, arrondissement):
+    """Row count of one partition, counted again only when its version stamp changes."""
+    key = (str(year), str(arrondissement))
+    version = DynamicTableLoader.table_version(year, arrondissement)
+    with _totals_lock:
+        cached = _partition_totals.get(key)
+    if cached is not None and version is not None and cached[0] == version:
+        return cached[1]
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {quote_identifier(DynamicTableLoader.table_name(year, arrondissement))}")
+        total = cursor.fetchone()[0]
+    with _totals_lock:
+        _partition_totals[key] = (version, total)
+    return total
+
+
+def parse_datatables_request(params):
+    """Extract paging, ordering and search settings from DataTables server-side parameters."""
+    start = max(int(params.get('start', 0) or 0), 0)
+    length = int(params.get('length', 10) or 10)
+    if length < 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+
+    order_by = []
+    i = 0
+    while f'order[{i}][column]' in params:
+        index = int(params[f'order[{i}][column]'])
+        if 0 <= index < len(TABLE_COLUMNS):
+            prefix = '-' if params.get(f'order[{i}][dir]') == 'desc' else ''
+            order_by.append(prefix + TABLE_COLUMNS[index])
+        i += 1
+
+    column_searches = {}
+    for index, column in enumerate(TABLE_COLUMNS):
+        value = params.get(f'columns[{index}][search][value]')
+        if value:
+            column_searches[column] = value
+
+    visible_columns = []
+    for index in params.getlist('visible_columns[]') or params.getlist('visible_columns'):
+        index = int(index)
+        if 0 <= index < len(TABLE_COLUMNS):
+            visible_columns.append(TABLE_COLUMNS[index])
+
+    return {
+        'draw': int(params.get('draw', 0) or 0),
+        'start': start,
+        'length': length,
+        'order_by': order_by,
+        'search': params.get('search[value]', ''),
+        'column_searches': column_searches,
+        'visible_columns': visible_columns,
+    }
+
+
+def datatable_page(years, arrondissements, draw=0, start=0, length=10, order_by=None, search='',
+                   column_searches=None, visible_columns=None):
+    """Return one page of the data table in the DataTables server-side response format.
+
+    Paging, sorting and searching all run in SQL over a UNION ALL of the selected partitions,
+    so only the visible page leaves the database. The row key ends every ORDER BY, so that pages
+    neither repeat nor skip rows with equal sort values; recordsTotal sums partition_total.
+    Rows are objects holding the visible columns (all columns when `visible_columns` is empty)
+    and keyed by DT_RowId, the row key hidden columns are hydrated with (see fetch_columns_by_key).
+    """
+    response = {'draw': draw, 'recordsTotal': 0, 'recordsFiltered': 0, 'data': []}
+    partitions = existing_partitions(years, arrondissements)
+    if not partitions:
+        return response
+
+    # Sorted and searched columns are selected too, even when hidden
+    needed = set(visible_columns or TABLE_COLUMNS)
+    needed.update(field.lstrip('-') for field in order_by or [])
+    needed.update(column_searches or {})
+    if search:
+        needed.update(GLOBAL_SEARCH_COLUMNS)
+    columns = [column for column in TABLE_COLUMNS if column in needed]
+
+    union, params = build_union_query(partitions, columns=columns, row_key=True)
+
+    conditions = []
+    search_params = []
+    if search:
+        condition, condition_params = _search_condition(GLOBAL_SEARCH_COLUMNS, search)
+        conditions.append(condition)
+        search_params.extend(condition_params)
+    for column, value in (column_searches or {}).items():
+        condition, condition_params = _search_condition([column], value)
+        conditions.append(condition)
+        search_params.extend(condition_params)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    terms = [f"{quote_identifier(field.lstrip('-'))} {'DESC' if field.startswith('-') else 'ASC'}"
+             for field in order_by or []]
+    order = f" ORDER BY {', '.join(terms + ['row_key'])}"
+
+    response['recordsTotal'] = sum(partition_total(year, arrondissement) for year, arrondissement in partitions)
+    with connection.cursor() as cursor:
+        if conditions:
+            cursor.execute(f"SELECT COUNT(*) FROM ({union}) AS partitions{where}", params + search_params)
+            response['recordsFiltered'] = cursor.fetchone()[0]
+        else:
+            response['recordsFiltered'] = response['recordsTotal']
+
+        cursor.execute(
+            f"SELECT * FROM ({union}) AS partitions{where}{order} LIMIT %s OFFSET %s",
+            params + search_params + [length, start],
+        )
+        visible = set(visible_columns or TABLE_COLUMNS)
+        for row in cursor.fetchall():
+            record = {'DT_RowId': row[0]}
+            record.update((column, _cell(value)) for column, value in zip(columns, row[1:]) if column in visible)
+            response['data'].append(record)
+
+    logger.debug("Served rows %d-%d of %d", start, start + len(response['data']), response['recordsFiltered'])
+    return response
+
+
+def fetch_columns_by_key(columns, row_keys):
+    """Return the values of `columns` for the rows identified by `row_keys`, in columnar form.
+
+    Keys are grouped by partition and each partition is read with one projection-only query
+    on django_index. The result is {'keys': [...], 'columns': {column: [...]}} with every list
+    aligned on `keys`; keys whose row no longer exists are dropped.
+    """
+    columns = [column for column in columns if column in TABLE_COLUMNS]
+    if not columns or not row_keys:
+        return {'keys': [], 'columns': {column: [] for column in columns}}
+
+    by_partition = {}
+    for row_key in row_keys:
+        year, arrondissement, django_index = DynamicTableLoader.parse_row_key(row_key)
+        by_partition.setdefault((year, arrondissement), []).append(django_index)
+
+    found = {}
+    existing = set(existing_partitions(
+        sorted({year for year, _ in by_partition}), sorted({arr for _, arr in by_partition})))
+    with connection.cursor() as cursor:
+        for (year, arrondissement), indexes in by_partition.items():
+            if (year, arrondissement) not in existing:
+                continue
+            table_name = quote_identifier(DynamicTableLoader.table_name(year, arrondissement))
+            select_list = ", ".join(quote_identifier(FIELD_COLUMNS.get(column, column)) for column in columns)
+            cursor.execute(
+                f"SELECT django_index, {select_list} FROM {table_name} WHERE django_index = ANY(%s)",
+                [indexes],
+            )
+            prefix = DynamicTableLoader.row_key_prefix(year, arrondissement)
+            for row in cursor.fetchall():
+                found[f"{prefix}{row[0]}"] = row[1:]
+
+    keys = [row_key for row_key in row_keys if row_key in found]
+    return {
+        'keys': keys,
+        'columns': {
+            column: [_cell(found[row_key][position]) for row_key in keys]
+            for position, column in enumerate(columns)
+        },
+    }
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+GROUP_KEYS = ['Ramses_id', 'Quote_name']
+
+# Average month length, used to express least-squares slopes per month
+DAYS_PER_MONTH = 365.25 / 12
+
+
+def _group_bounds(codes):
+    # Codes are sorted: every group is one contiguous run [start, end]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)] - 1
+    return starts, ends
+
+
+def degradation_rates(df, fit=False):
+    """Compute degradation rates for every (Ramses_id, Quote_name) pair of a measurement frame.
+
+    Rows with a non-numeric Quote_measured_value or without a Date_control are ignored. Like
+    the dashboard KPIs, rates are changes per calendar month between the first and last
+    measurement (`slope_total`) and between the last two measurements (`slope_last_two`), 0.0
+    when the month difference is 0. With `fit`, `slope_fit` adds the least-squares slope per
+    month over the whole history.
+
+    Everything runs on sorted NumPy arrays, without a Python loop over the groups.
+    """
+    columns = ['Ramses_id', 'Quote_name', 'measurements', 'first_control', 'last_control',
+               'latest_value', 'slope_total', 'slope_last_two'] + (['slope_fit'] if fit else [])
+
+    values = pd.to_numeric(df['Quote_measured_value'], errors='coerce')
+    dates = pd.to_datetime(df['Date_control'], dayfirst=True)
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert(None)
+    kept = values.notna() & dates.notna()
+    df = df.loc[kept, GROUP_KEYS].assign(Quote_measured_value=values[kept])
+    dates = dates[kept]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    codes = df.groupby(GROUP_KEYS, sort=False, observed=True).ngroup().to_numpy()
+    order = np.lexsort((dates.to_numpy().view('int64'), codes))
+
+    codes = codes[order]
+    dates = pd.DatetimeIndex(dates.to_numpy()[order])
+    y = df['Quote_measured_value'].to_numpy(dtype=float)[order]
+    months = dates.year.to_numpy() * 12 + dates.month.to_numpy()
+
+    starts, ends = _group_bounds(codes)
+    previous = np.maximum(ends - 1, starts)
+    counts = ends - starts + 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_months = months[ends] - months[starts]
+        slope_total = np.where(total_months != 0, (y[ends] - y[starts]) / total_months, 0.0)
+        last_two_months = months[ends] - months[previous]
+        slope_last_two = np.where(last_two_months != 0, (y[ends] - y[previous]) / last_two_months, 0.0)
+
+    keys = df[GROUP_KEYS].to_numpy()[order][starts]
+    result = pd.DataFrame({
+        'Ramses_id': keys[:, 0],
+        'Quote_name': keys[:, 1],
+        'measurements': counts,
+        'first_control': dates[starts],
+        'last_control': dates[ends],
+        'latest_value': y[ends],
+        'slope_total': slope_total,
+        'slope_last_two': slope_last_two,
+    })
+
+    if fit:
+        # Least squares on months since each group's first control, from per-group sums
+        x = (dates.to_numpy() - dates.to_numpy()[np.repeat(starts, counts)]) / np.timedelta64(1, 'D') / DAYS_PER_MONTH
+        sum_x = np.add.reduceat(x, starts)
+        sum_y = np.add.reduceat(y, starts)
+        sum_xx = np.add.reduceat(x * x, starts)
+        sum_xy = np.add.reduceat(x * y, starts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            denominator = counts * sum_xx - sum_x * sum_x
+            result['slope_fit'] = np.where(
+                denominator > 0, (counts * sum_xy - sum_x * sum_y) / denominator, 0.0)
+
+    return result[columns]
+
+
+def rank_degradation(rates, by='slope_total', top=None):
+    """Order degradation rates by the absolute value of `by`, fastest-degrading first."""
+    ranked = rates.iloc[np.argsort(-rates[by].abs().to_numpy(), kind='stable')]
+    if top:
+        ranked = ranked.head(int(top))
+    return ranked.reset_index(drop=True)
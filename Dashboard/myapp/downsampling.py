@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+DOWNSAMPLING_METHODS = ('lttb', 'minmax')
+
+
+def _as_float(x):
+    # Datetimes, tz-aware ones included, become integer timestamps relative to the first point
+    if pd.api.types.is_datetime64_any_dtype(x) or np.asarray(x).dtype == object:
+        x = pd.DatetimeIndex(x).asi8
+    x = np.asarray(x, dtype=float)
+    return x - x[0] if len(x) else x
+
+
+def _take(x, positions):
+    # Keep pandas x values (e.g. tz-aware dates) as they are
+    return x.iloc[positions] if isinstance(x, pd.Series) else np.asarray(x)[positions]
+
+
+def lttb_indices(x, y, max_points):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets, first and last included.
+
+    The points between the first and the last are split into max_points - 2 buckets; from each
+    bucket LTTB keeps the point forming the largest triangle with the previously kept point and
+    the average of the next bucket, which preserves peaks and the overall shape of the line.
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    x, y = _as_float(x), np.asarray(y, dtype=float)
+    edges = np.append(np.linspace(1, n - 1, max_points - 1).astype(int), n)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    kept = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[kept] - avg_x) * (y[start:end] - y[kept]) - (x[kept] - x[start:end]) * (avg_y - y[kept]))
+        kept = start + int(np.argmax(area))
+        indices[bucket + 1] = kept
+    return indices
+
+
+def minmax_indices(x, y, max_points):
+    """Indices of the minimum and maximum of max_points // 2 equal-count buckets, in order."""
+    n = len(x)
+    buckets = max_points // 2
+    if max_points >= n or buckets < 1:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+    # Sort by (bucket, value): the first and last row of each bucket are its minimum and maximum
+    order = np.lexsort((y, bucket_of))
+    starts = edges[:-1]
+    ends = edges[1:] - 1
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends]]))
+
+
+def downsample(x, y, max_points, method='lttb'):
+    """Reduce a line to at most max_points points (plus the bucket extremes for 'minmax').
+
+    Missing y values are dropped first, like gaps would be in the full-resolution line.
+    Returns the kept x (a Series when x is one) and y (an array).
+    """
+    if method not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"Unknown downsampling method {method!r}, expected one of {DOWNSAMPLING_METHODS}")
+    y = np.asarray(y, dtype=float)
+    present = np.flatnonzero(~np.isnan(y))
+    x, y = _take(x, present), y[present]
+
+    indices = lttb_indices(x, y, max_points) if method == 'lttb' else minmax_indices(x, y, max_points)
+    return _take(x, indices), y[indices]
+
+
+def step_points(x, y):
+    """Collapse a piecewise-constant line to the points around each change of value.
+
+    The first and last point of every run of equal values (missing values form runs too) are
+    kept, so a line drawn through the result is identical to the full-resolution one.
+    """
+    y = np.asarray(y, dtype=float)
+    if len(y) <= 2:
+        return x, y
+    same = (y[1:] == y[:-1]) | (np.isnan(y[1:]) & np.isnan(y[:-1]))
+    changes = np.flatnonzero(~same)
+    keep = np.unique(np.concatenate([[0, len(y) - 1], changes, changes + 1]))
+    return _take(x, keep), y[keep]
+
+
+def reduce_trace(x, y, max_points, method='lttb', steps=False):
+    """Downsample a trace to at most max_points points.
+
+    With `steps`, meant for piecewise-constant traces such as the thresholds, a trace that only
+    changes at a few points is collapsed to the points around each change instead. Measured
+    traces keep all their points (and markers) up to max_points.
+    """
+    y_values = pd.to_numeric(pd.Series(y), errors='coerce').to_numpy(dtype=float)
+    if steps:
+        step_x, step_y = step_points(x, y_values)
+        if len(step_x) <= max_points:
+            return step_x, step_y
+    return downsample(x, y_values, max_points, method)
@@ -0,0 +1,165 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from django.conf import settings
+
+from .models import CompleteFinalCleanedData, DynamicTableLoader
+
+logger = logging.getLogger(__name__)
+
+# Text columns become categoricals when they have at most this many distinct values per row
+CATEGORY_MAX_RATIO = 0.5
+
+TEXT_FIELDS = ('TextField', 'CharField')
+FLOAT_FIELDS = ('FloatField',)
+INTEGER_FIELDS = ('IntegerField', 'BigIntegerField', 'AutoField')
+DATETIME_FIELDS = ('DateTimeField',)
+
+
+def frame_schema():
+    """Map every CompleteFinalCleanedData field name to its Django field type."""
+    return {field.name: field.get_internal_type() for field in CompleteFinalCleanedData._meta.fields}
+
+
+def _float(series):
+    # float32 only when every value survives the round trip, so limits and measurements compare as before
+    values = pd.to_numeric(series, errors='coerce')
+    if values.isna().sum() != series.isna().sum():
+        return series
+    values = values.astype('float64')
+    narrow = values.astype('float32')
+    if np.array_equal(narrow.to_numpy(dtype='float64'), values.to_numpy(), equal_nan=True):
+        return narrow
+    return values
+
+
+def _integer(series):
+    values = pd.to_numeric(series, errors='coerce')
+    if values.isna().sum() != series.isna().sum():
+        return series
+    if values.isna().any():
+        # Missing values: keep a float column, which is exact for integers below 2**24
+        return _float(values)
+    return pd.to_numeric(values, downcast='integer')
+
+
+def _datetime(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # Naive datetimes (e.g. read from the Arrow mirror) are UTC, like the parsed ones
+        return series.dt.tz_localize('UTC') if series.dt.tz is None else series.dt.tz_convert('UTC')
+    values = pd.to_datetime(series, errors='coerce', utc=True, dayfirst=True)
+    if values.isna().sum() != series.isna().sum():
+        return series
+    return values
+
+
+def _text(series):
+    if series.empty:
+        return series
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Chunks are categorized unconditionally; undo it for high-cardinality columns, back to the
+        # object dtype of a whole load (categories may be strings on recent pandas)
+        if len(series.cat.categories) > CATEGORY_MAX_RATIO * len(series):
+            return series.astype(object)
+        # Sorted categories, so that sorting on the column is lexical (Arrow dictionaries are not)
+        return series.cat.set_categories(series.cat.categories.sort_values())
+    if series.nunique(dropna=True) > CATEGORY_MAX_RATIO * len(series):
+        return series
+    return series.astype('category')
+
+
+def _category(series):
+    return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+
+
+def _convert(df, text_converter):
+    converters = {}
+    for column, field_type in frame_schema().items():
+        if field_type in TEXT_FIELDS:
+            converters[column] = text_converter
+        elif field_type in FLOAT_FIELDS:
+            converters[column] = _float
+        elif field_type in INTEGER_FIELDS:
+            converters[column] = _integer
+        elif field_type in DATETIME_FIELDS:
+            converters[column] = _datetime
+
+    return df.assign(**{
+        column: converter(df[column]) for column, converter in converters.items() if column in df.columns
+    })
+
+
+def normalize_frame(df, label=None):
+    """Convert the model columns of a loaded frame to compact dtypes, once, at load time.
+
+    Driven by the CompleteFinalCleanedData field types: low-cardinality text columns become
+    categoricals, numeric columns are downcast (float32 and small integers when no value
+    changes) and datetime columns are parsed to UTC datetime64. Columns whose values do not all
+    convert are left as they are. Logs the memory use before and after.
+    """
+    if df.empty:
+        return df
+
+    before = int(df.memory_usage(deep=True).sum())
+    df = _convert(df, _text)
+    after = int(df.memory_usage(deep=True).sum())
+    logger.info("Normalized %s: %.1f MB -> %.1f MB (%.1fx)", label or 'frame',
+                before / 2**20, after / 2**20, before / after if after else 0.0)
+    return df
+
+
+def normalize_chunk(df):
+    """Compact one chunk of a streamed partition; every text column becomes a categorical.
+
+    Categorical chunks concatenate with concat_frames without going through object arrays;
+    normalize_frame on the combined frame then settles the final dtypes.
+    """
+    return _convert(df, _category) if not df.empty else df
+
+
+def load_compact_frame(year, arrondissement, chunk_size=None):
+    """Load one partition with compact dtypes, converting it chunk by chunk as it is streamed.
+
+    Only one chunk of rows is held as Python objects at a time, instead of the whole partition
+    as row tuples plus an object DataFrame. With PARTITION_STREAMING_LOAD off, the partition is
+    fetched at once and normalized afterwards.
+    """
+    label = DynamicTableLoader.table_name(year, arrondissement)
+    if not getattr(settings, 'PARTITION_STREAMING_LOAD', True):
+        return normalize_frame(DynamicTableLoader.load_frame(year, arrondissement), label=label)
+
+    chunks = [normalize_chunk(chunk)
+              for chunk in DynamicTableLoader.iter_frames(year, arrondissement, chunk_size=chunk_size)]
+    return normalize_frame(concat_frames(chunks), label=label)
+
+
+def memory_report(before, after):
+    """Per-column memory use and dtype of a frame before and after normalize_frame, largest first."""
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(deep=True, index=False),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_after': after.memory_usage(deep=True, index=False),
+    })
+    return report.sort_values('bytes_before', ascending=False)
+
+
+def concat_frames(frames):
+    """pd.concat that keeps categorical columns categorical across frames with different categories."""
+    frames = [df for df in frames if not df.empty] or frames[:1]
+    if len(frames) > 1:
+        categorical = [
+            column for column in frames[0].columns
+            if all(column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames)
+        ]
+        for column in categorical:
+            categories = union_categoricals([df[column] for df in frames], sort_categories=True).categories
+            frames = [df.assign(**{column: df[column].cat.set_categories(categories)}) for df in frames]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def display_values(df):
+    """Rows of a frame as lists of plain Python values, '' for missing ones, for JSON responses."""
+    return df.astype(object).where(df.notna(), '').values.tolist()
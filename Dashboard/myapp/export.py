@@ -0,0 +1,114 @@
+import csv
+import io
+import logging
+
+from django.conf import settings
+
+from .datatables import TABLE_COLUMNS
+from .models import CompleteFinalCleanedData, iter_cursor_chunks
+from .partition_fetch import build_union_query, existing_partitions
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+
+def export_chunks(years, arrondissements, columns=None, chunk_size=None, **filters):
+    """Yield (columns, rows) chunks of the filtered selection, read on a server-side cursor.
+
+    Accepts the filters of DynamicTableLoader.build_query; rows come ordered by Ramses_id,
+    Quote_name and Date_control like the data table.
+    """
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 10000)
+    columns = [column for column in columns or TABLE_COLUMNS if column in TABLE_COLUMNS] or TABLE_COLUMNS
+    partitions = existing_partitions(years, arrondissements)
+    if not partitions:
+        return
+
+    query, params = build_union_query(
+        partitions, columns=columns, order_by=['Ramses_id', 'Quote_name', 'Date_control'], **filters)
+    yield from iter_cursor_chunks(query, params, chunk_size)
+
+
+class _Echo:
+    # File-like object whose write() hands the line back to the csv writer's caller
+    def write(self, value):
+        return value
+
+
+def stream_csv(chunks, columns):
+    """Yield CSV text line by line; memory stays bounded by one chunk."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for _, rows in chunks:
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class _DrainableSink(io.RawIOBase):
+    # Write-only stream collecting what the Parquet writer produced since the last drain
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def arrow_schema(columns):
+    """Arrow schema of model fields, from their CompleteFinalCleanedData field types."""
+    # Integer columns of the partitions hold NULLs and were loaded from pandas floats: keep them float
+    types = {
+        'FloatField': pa.float64(),
+        'IntegerField': pa.float64(),
+        'DateTimeField': pa.timestamp('us', tz='UTC'),
+    }
+    fields = []
+    for column in columns:
+        field_type = CompleteFinalCleanedData._meta.get_field(column).get_internal_type()
+        fields.append(pa.field(column, types.get(field_type, pa.string())))
+    return pa.schema(fields)
+
+
+def _arrow_array(values, arrow_type):
+    # Text columns may hold numbers or other values; like the partition mirror, write them as strings
+    if pa.types.is_string(arrow_type):
+        values = [None if value is None else str(value) for value in values]
+    return pa.array(values, type=arrow_type)
+
+
+def stream_parquet(chunks, columns):
+    """Yield a Parquet file as bytes, writing one row group per chunk."""
+    if pq is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+
+    schema = arrow_schema(columns)
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for _, rows in chunks:
+        arrays = [_arrow_array(values, field.type) for values, field in zip(zip(*rows), schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
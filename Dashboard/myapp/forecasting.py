@@ -0,0 +1,220 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+
+from .analysis_cache import analysis_cache
+from .degradation import DAYS_PER_MONTH, GROUP_KEYS, _group_bounds
+from .gauges import BANDS, LIMIT_COLUMNS, classify, gauge_category
+from .partition_catalog import partition_catalog
+from .partition_fetch import fetch_partitions
+
+logger = logging.getLogger(__name__)
+
+# Partition columns read to forecast limit breaches
+FORECAST_COLUMNS = ['Ramses_id', 'Quote_name', 'Quote_name_general', 'Quote_measured_value',
+                    'Date_control'] + LIMIT_COLUMNS
+
+FORECAST_RESULT_COLUMNS = ['Ramses_id', 'Quote_name', 'Quote_name_general', 'measurements', 'last_control',
+                           'latest_value', 'fitted_value', 'slope', 'current_band', 'next_limit', 'limit_value',
+                           'band_after', 'months_to_breach', 'breach_date']
+
+# Huber tuning constant and reweighting passes of the robust fit
+HUBER_K = 1.345
+ROBUST_ITERATIONS = 5
+
+# Breaches further out than this are not forecast; also keeps near-flat trends within datetime range
+FORECAST_HORIZON_MONTHS = 100 * 12
+
+
+def _weighted_fit(x, y, w, starts):
+    # Weighted least squares of every group from per-group sums; flat (0.0) slope without spread in x
+    sum_w = np.add.reduceat(w, starts)
+    sum_x = np.add.reduceat(w * x, starts)
+    sum_y = np.add.reduceat(w * y, starts)
+    sum_xx = np.add.reduceat(w * x * x, starts)
+    sum_xy = np.add.reduceat(w * x * y, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = sum_w * sum_xx - sum_x * sum_x
+        slope = np.where(denominator > 1e-12, (sum_w * sum_xy - sum_x * sum_y) / denominator, 0.0)
+        intercept = np.where(sum_w > 0, (sum_y - slope * sum_x) / sum_w, 0.0)
+    return slope, intercept
+
+
+def _huber_weights(residuals, groups):
+    # Residuals scaled by each group's MAD; points beyond HUBER_K scales are downweighted
+    absolute = np.abs(residuals)
+    scale = 1.4826 * pd.Series(absolute).groupby(groups).median().to_numpy()[groups]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = absolute / (HUBER_K * scale)
+        return np.where((scale > 0) & (u > 1), 1 / u, 1.0)
+
+
+def _next_limits(limits, category, fitted, direction):
+    # Closest limit strictly beyond the fitted value in the direction of the trend. Like the
+    # gauges, one-end layouts only use their min (lower) or max (upper) limits and treat 0.0 as
+    # absent; quotes without a layout have no band to cross.
+    limits = np.nan_to_num(limits, nan=0.0)
+    limits = np.where((category[:, None] != 'both_ends') & (limits == 0.0), np.nan, limits)
+    is_max = np.array([column.endswith('_max') for column in LIMIT_COLUMNS])
+    limits[np.ix_(category == 'lower', is_max)] = np.nan
+    limits[np.ix_(category == 'upper', ~is_max)] = np.nan
+    limits[category == 'none'] = np.nan
+    with np.errstate(invalid='ignore'):
+        distance = (limits - fitted[:, None]) * direction[:, None]
+        distance = np.where(distance > 0, distance, np.inf)
+    column = np.argmin(distance, axis=1)
+    found = np.isfinite(distance[np.arange(len(column)), column])
+    return column, found
+
+
+def forecast_breaches(df, robust=False):
+    """Forecast when every (Ramses_id, Quote_name) of a measurement frame crosses its next limit.
+
+    A linear trend is fitted per quote over months since its first control, by least squares or,
+    with `robust`, by Huber-weighted least squares so isolated outliers do not swing the slope.
+    From the fitted value at the last control, the series is extended to the closest IAL/IL/AL
+    limit in the direction of the trend; `band_after` is the band reached past it. Quotes with a
+    flat trend, no limit ahead or a breach beyond FORECAST_HORIZON_MONTHS get no `breach_date`.
+    Limits are those of the latest control; controls without a value or a date are ignored.
+
+    Everything runs on sorted NumPy arrays, without a Python loop over the groups.
+    """
+    values = pd.to_numeric(df['Quote_measured_value'], errors='coerce')
+    dates = pd.to_datetime(df['Date_control'], dayfirst=True)
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert(None)
+    kept = values.notna() & dates.notna()
+    df = df.loc[kept].assign(Quote_measured_value=values[kept])
+    dates = dates[kept]
+    if df.empty:
+        return pd.DataFrame(columns=FORECAST_RESULT_COLUMNS)
+
+    codes = df.groupby(GROUP_KEYS, sort=False, observed=True).ngroup().to_numpy()
+    order = np.lexsort((dates.to_numpy().view('int64'), codes))
+
+    codes = codes[order]
+    dates = dates.to_numpy()[order]
+    y = df['Quote_measured_value'].to_numpy(dtype=float)[order]
+    starts, ends = _group_bounds(codes)
+    counts = ends - starts + 1
+    groups = np.repeat(np.arange(len(starts)), counts)
+    x = (dates - dates[starts][groups]) / np.timedelta64(1, 'D') / DAYS_PER_MONTH
+
+    weights = np.ones_like(y)
+    slope, intercept = _weighted_fit(x, y, weights, starts)
+    for _ in range(ROBUST_ITERATIONS if robust else 0):
+        weights = _huber_weights(y - (intercept[groups] + slope[groups] * x), groups)
+        slope, intercept = _weighted_fit(x, y, weights, starts)
+
+    latest = df.iloc[order[ends]]
+    fitted = intercept + slope * x[ends]
+    limits = latest[LIMIT_COLUMNS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    general = latest['Quote_name_general'].to_numpy(dtype=object)
+    category = gauge_category(general)
+    direction = np.sign(slope)
+    column, found = _next_limits(limits, category, fitted, direction)
+
+    rows = np.arange(len(column))
+    limit_value = np.nan_to_num(limits, nan=0.0)[rows, column]
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        months_to_breach = (limit_value - fitted) / slope
+    found &= np.isfinite(months_to_breach) & (months_to_breach <= FORECAST_HORIZON_MONTHS)
+    months_to_breach = np.where(found, months_to_breach, np.nan)
+    limit_value = np.where(found, limit_value, np.nan)
+    breach_date = pd.DatetimeIndex(dates[ends]) + pd.to_timedelta(months_to_breach * DAYS_PER_MONTH, unit='D')
+
+    def bands(values):
+        # LIMIT_COLUMNS follow the order of classify's limit arguments
+        return classify(values, *limits.T, general)['band'].to_numpy()
+
+    # The band just past the limit; band boundaries are inclusive on the inner side
+    past_limit = limit_value + direction * np.maximum(np.abs(limit_value), 1.0) * 1e-9
+    band_after = np.where(found, bands(np.nan_to_num(past_limit)), None)
+
+    result = pd.DataFrame({
+        'Ramses_id': latest['Ramses_id'].to_numpy(),
+        'Quote_name': latest['Quote_name'].to_numpy(),
+        'Quote_name_general': general,
+        'measurements': counts,
+        'last_control': dates[ends],
+        'latest_value': y[ends],
+        'fitted_value': fitted,
+        'slope': slope,
+        'current_band': bands(y[ends]),
+        'next_limit': np.where(found, np.asarray(LIMIT_COLUMNS, dtype=object)[column], None),
+        'limit_value': limit_value,
+        'band_after': band_after,
+        'months_to_breach': months_to_breach,
+        'breach_date': breach_date,
+    })
+    return result[FORECAST_RESULT_COLUMNS]
+
+
+def arrondissement_forecast(arrondissement, robust=False):
+    """Breach forecast of one arrondissement over all its partitions, cached per partition version.
+
+    The cached result only changes when one of the arrondissement's partitions does, so a daily
+    run over the fleet recomputes the arrondissements that received new controls. A forecast
+    has a row per quote of the arrondissement, so it gets its own size limit in the cache.
+    """
+    years = [table['year'] for table in partition_catalog.tables().values()
+             if table['arrondissement'] == int(arrondissement) and not table['empty']]
+    partitions = [(year, arrondissement) for year in sorted(years)]
+    if not partitions:
+        return pd.DataFrame(columns=FORECAST_RESULT_COLUMNS)
+
+    def compute():
+        history = fetch_partitions(sorted(years), [arrondissement], columns=FORECAST_COLUMNS)
+        if history.empty:
+            return pd.DataFrame(columns=FORECAST_RESULT_COLUMNS)
+        logger.info("Forecasting limit breaches of arrondissement %s: %d rows", arrondissement, len(history))
+        return forecast_breaches(history, robust=robust).assign(arrondissement=int(arrondissement))
+
+    return analysis_cache.get_or_compute(
+        'breach_forecast', partitions, compute,
+        timeout=getattr(settings, 'FORECAST_CACHE_TIMEOUT', 7 * 24 * 3600),
+        max_bytes=getattr(settings, 'FORECAST_CACHE_MAX_BYTES', 256 * 1024 * 1024), robust=bool(robust),
+    )
+
+
+def rank_breaches(forecast, now=None, within_days=None, top=None):
+    """Quotes with a forecast breach, most urgent first: earliest breach, then the most severe band reached.
+
+    `days_to_breach` is negative when the trend has already crossed the limit since the last control.
+    """
+    now = pd.Timestamp(now or timezone.now())
+    now = now.tz_convert(None) if now.tzinfo is not None else now
+    ranked = forecast.dropna(subset=['breach_date'])
+    days = (pd.to_datetime(ranked['breach_date']) - now) / pd.Timedelta(days=1)
+    ranked = ranked.assign(
+        days_to_breach=days.to_numpy(),
+        severity=pd.Categorical(ranked['band_after'], categories=BANDS, ordered=True).codes,
+    )
+    if within_days is not None:
+        ranked = ranked[ranked['days_to_breach'] <= float(within_days)]
+    ranked = ranked.sort_values(['days_to_breach', 'severity'], ascending=[True, False], kind='mergesort')
+    if top:
+        ranked = ranked.head(int(top))
+    return ranked.drop(columns='severity').reset_index(drop=True)
+
+
+def fleet_forecast(arrondissements=None, robust=False):
+    """Breach forecasts of the given arrondissements (all with data by default), concatenated."""
+    arrondissements = arrondissements or partition_catalog.arrondissements()
+    frames = [arrondissement_forecast(arrondissement, robust=robust) for arrondissement in arrondissements]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=FORECAST_RESULT_COLUMNS + ['arrondissement'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def switch_urgency(ranked):
+    """One row per switch from ranked breaches: its most urgent quote and how many quotes are forecast to breach."""
+    if ranked.empty:
+        return ranked.assign(quotes_breaching=pd.Series(dtype=int))
+    first = ranked.drop_duplicates('Ramses_id', keep='first')
+    counts = ranked.groupby('Ramses_id', sort=False).size()
+    return first.assign(quotes_breaching=counts.reindex(first['Ramses_id']).to_numpy()).reset_index(drop=True)
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+# Quote_name_general values per gauge layout. 'X' is listed twice; the both-ends layout wins.
+BOTH_ENDS_GAUGE = ['E', 'Ebis', 'CE', 'Ec', 'X', 'Tx', 'T', 'Ecartement ']
+ONE_END_LOWER_GAUGE = ['A', 'D', 'F', 'J', 'L', 'S', 'Dp ()',
+                       'DwrL', 'DwrR', 'M', 'M_value', 'Z', 'Fbis',
+                       'Jbis', 'Z jeu max mm', 'Ua', 'Uca', 'Ud', 's',
+                       'Jeux aiguilles/coussinets', 'M_value_value', 'Dpl D', 'Dpl G', 'Dvr L', 'Dvr R']
+ONE_END_UPPER_GAUGE = ['B', 'C', 'K', 'k', 'X']
+
+BANDS = ['green', 'orange', 'pink', 'red']
+
+# Colour steps of a gauge, in drawing order: (colour, slot). Both-ends gauges use the 'min'
+# and 'max' slots on either side of the green band, one-end gauges only the 'min' slot.
+STEP_SLOTS = [('red', 'min'), ('red', 'max'), ('pink', 'min'), ('pink', 'max'),
+              ('orange', 'min'), ('orange', 'max'), ('green', 'min')]
+
+LIMIT_COLUMNS = ['IAL_min', 'IAL_max', 'IL_min', 'IL_max', 'AL_min', 'AL_max']
+
+
+def gauge_category(quote_name_general):
+    """Map Quote_name_general values to 'both_ends', 'lower', 'upper' or 'none'."""
+    names = pd.Series(np.asarray(quote_name_general, dtype=object))
+    return np.select(
+        [names.isin(BOTH_ENDS_GAUGE), names.isin(ONE_END_LOWER_GAUGE), names.isin(ONE_END_UPPER_GAUGE)],
+        ['both_ends', 'lower', 'upper'],
+        'none',
+    )
+
+
+def _limit(values):
+    # Missing limits count as 0.0, like the latest limit values shown by the dashboard KPIs
+    return np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+
+
+def _present(flag, values):
+    return np.where(flag, values, np.nan)
+
+
+def classify(values, ial_min, ial_max, il_min, il_max, al_min, al_max, quote_name_general):
+    """Classify measured values against their IAL/IL/AL limits, one row per value.
+
+    All arguments are array-likes of the same length. Returns a DataFrame with the gauge
+    `category`, the colour `band` of the value, the gauge axis range (`axis_min`/`axis_max`,
+    NaN when the gauge has no fixed range) and the start/end of every colour step in
+    STEP_SLOTS (`<colour>_<slot>_start`/`_end`, NaN when the gauge has no such step).
+    Rows with a missing value get no band.
+    """
+    v = np.asarray(values, dtype=float)
+    ial_min, ial_max = _limit(ial_min), _limit(ial_max)
+    il_min, il_max = _limit(il_min), _limit(il_max)
+    al_min, al_max = _limit(al_min), _limit(al_max)
+    category = gauge_category(quote_name_general)
+
+    n = len(v)
+    band = np.full(n, 'green', dtype=object)
+    axis_min = np.full(n, np.nan)
+    axis_max = np.full(n, np.nan)
+    steps = {(colour, slot): (np.full(n, np.nan), np.full(n, np.nan)) for colour, slot in STEP_SLOTS}
+
+    def set_step(mask, colour, slot, start, end):
+        steps[(colour, slot)][0][mask] = np.broadcast_to(start, n)[mask]
+        steps[(colour, slot)][1][mask] = np.broadcast_to(end, n)[mask]
+
+    # Both ends: green between the AL limits, then orange, pink and red outwards on each side
+    m = category == 'both_ends'
+    band[m] = np.select(
+        [v <= ial_min, v <= il_min, v <= al_min, v <= al_max, v <= il_max, v <= ial_max],
+        ['red', 'pink', 'orange', 'green', 'orange', 'pink'],
+        'red',
+    )[m]
+    axis_min[m] = (ial_min - 10)[m]
+    axis_max[m] = (ial_max + 10)[m]
+    set_step(m, 'red', 'min', ial_min - 10, ial_min)
+    set_step(m, 'red', 'max', ial_max, ial_max + 10)
+    set_step(m, 'pink', 'min', ial_min, il_min)
+    set_step(m, 'pink', 'max', ial_max, il_max)
+    set_step(m, 'orange', 'min', al_min, il_min)
+    set_step(m, 'orange', 'max', al_max, il_max)
+    set_step(m, 'green', 'min', al_min, al_max)
+
+    # One end, lower limits: green from 0 up to the first limit, then orange, pink and red upwards
+    m = category == 'lower'
+    has_al, has_il, has_ial = al_min != 0.0, il_min != 0.0, ial_min != 0.0
+    al, il, ial = _present(has_al, al_min), _present(has_il, il_min), _present(has_ial, ial_min)
+    green_end = np.fmin(np.fmin(al, il), ial)
+    green_end = np.where(np.isnan(green_end), 2000.0, green_end)
+    orange_end = np.fmin(il, ial)
+    orange_end = np.where(np.isnan(orange_end), al_min + 20, orange_end)
+    pink_end = np.where(has_ial, ial_min, il_min + 20)
+    band[m] = np.select(
+        [(0 <= v) & (v < green_end),
+         has_al & (al_min <= v) & (v < orange_end),
+         has_il & (il_min <= v) & (v < pink_end),
+         has_ial & (ial_min <= v)],
+        ['green', 'orange', 'pink', 'red'],
+        'green',
+    )[m]
+    axis_min[m] = np.maximum(0, v - 20)[m]
+    axis_max[m] = np.where(has_ial, ial_min + 20, v + 20)[m]
+    set_step(m, 'green', 'min', 0.0, green_end)
+    set_step(m & has_al, 'orange', 'min', al_min, orange_end)
+    set_step(m & has_il, 'pink', 'min', il_min, pink_end)
+    set_step(m & has_ial, 'red', 'min', ial_min, ial_min + 20)
+
+    # One end, upper limits: red just below IAL max, then pink, orange and green upwards
+    m = category == 'upper'
+    has_al, has_il, has_ial = al_max != 0.0, il_max != 0.0, ial_max != 0.0
+    red_start = ial_max - 20
+    pink_start = np.where(has_ial, ial_max, il_max - 20)
+    orange_start = np.where(has_il, il_max, np.where(has_ial, ial_max, al_max - 20))
+    green_start = np.where(has_al, al_max, np.where(has_il, il_max, np.where(has_ial, ial_max, 0.0)))
+    pink, orange = _present(has_il, pink_start), _present(has_al, orange_start)
+    red_end = np.fmin(np.fmin(np.fmin(ial_max, pink), orange), green_start)
+    pink_end = np.fmin(np.fmin(il_max, orange), green_start)
+    orange_end = np.fmin(al_max, green_start)
+    band[m] = np.select(
+        [has_ial & (red_start <= v) & (v < red_end),
+         has_il & (pink_start <= v) & (v < pink_end),
+         has_al & (orange_start <= v) & (v < orange_end),
+         green_start <= v],
+        ['red', 'pink', 'orange', 'green'],
+        'green',
+    )[m]
+    axis_min[m] = np.where(has_ial, ial_max - 20,
+                           np.where(has_il, il_max - 20,
+                                    np.where(has_al, al_max - 20, np.maximum(0, v - 20))))[m]
+    axis_max[m] = (v + 20)[m]
+    set_step(m & has_ial, 'red', 'min', red_start, red_end)
+    set_step(m & has_il, 'pink', 'min', pink_start, pink_end)
+    set_step(m & has_al, 'orange', 'min', orange_start, orange_end)
+    set_step(m, 'green', 'min', green_start, v + 20)
+
+    band[np.isnan(v)] = None
+
+    result = pd.DataFrame({'category': category, 'band': band, 'axis_min': axis_min, 'axis_max': axis_max})
+    for (colour, slot), (start, end) in steps.items():
+        result[f'{colour}_{slot}_start'] = start
+        result[f'{colour}_{slot}_end'] = end
+    return result
+
+
+def classify_frame(df, value_column='Quote_measured_value'):
+    """Classify every row of a DataFrame holding the model's value and limit columns."""
+    result = classify(
+        pd.to_numeric(df[value_column], errors='coerce'),
+        *(pd.to_numeric(df[column], errors='coerce') for column in LIMIT_COLUMNS),
+        df['Quote_name_general'],
+    )
+    result.index = df.index
+    return result
+
+
+def gauge_steps(gauge):
+    """Turn one row of classify() into the 'steps' list of a Plotly gauge."""
+    steps = []
+    for colour, slot in STEP_SLOTS:
+        start, end = gauge[f'{colour}_{slot}_start'], gauge[f'{colour}_{slot}_end']
+        if not np.isnan(start) and not np.isnan(end):
+            steps.append({'range': [float(start), float(end)], 'color': colour})
+    return steps
+
+
+def band_counts(df, by=None, value_column='Quote_measured_value'):
+    """Count rows per gauge band, optionally per group, e.g. over the latest value of every switch.
+
+    Returns a DataFrame with one column per band in BANDS, indexed by the `by` columns
+    (a single row when `by` is None).
+    """
+    bands = classify_frame(df, value_column)['band']
+    if by is None:
+        counts = bands.value_counts().reindex(BANDS, fill_value=0)
+        return counts.to_frame().T.reset_index(drop=True)
+    keys = [df[column] for column in ([by] if isinstance(by, str) else by)]
+    return pd.crosstab(keys, bands).reindex(columns=BANDS, fill_value=0)
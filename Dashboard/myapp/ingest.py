@@ -0,0 +1,289 @@
+import csv
+import io
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .models import CompleteFinalCleanedData, DynamicTableLoader, IngestWatermark, quote_identifier
+from .partition_admin import PARTITION_KEY_COLUMNS, create_indexes
+from .partition_catalog import partition_catalog
+
+logger = logging.getLogger(__name__)
+
+# Cleaned source tables produced by the fiche extraction, joined on "Section" (one fiche)
+CONTROL_INFOS_TABLE = 'clean_control_infos_field'
+MEASUREMENT_RESULTS_TABLE = 'clean_df_measurement_results_field'
+SWITCH_CHARACTERISTICS_TABLE = 'clean_switch_characteristics_field'
+
+# Partition columns, in table order: (source table alias, source column, partition column). Aliases
+# are c(ontrol infos), m(easurement results) and s(witch); the partition columns follow COLUMN_RENAMES
+PARTITION_SOURCE_COLUMNS = [
+    ('c', 'No. Ident.', 'No. Ident.'), ('s', 'Numéro ES', 'Numéro ES'), ('m', 'Quote_name', 'Quote_name'),
+    ('m', 'Quote_measured_value', 'Quote_measured_value'), ('m', 'Corrected_value', 'Corrected_value'),
+    ('m', 'Nominal_value', 'Nominal_value'), ('m', 'IAL_min', 'IAL_min'), ('m', 'IAL_max', 'IAL_max'),
+    ('m', 'IL_min', 'IL_min'), ('m', 'IL_max', 'IL_max'), ('m', 'AL_min', 'AL_min'), ('m', 'AL_max', 'AL_max'),
+    ('m', 'NEW_min', 'NEW_min'), ('m', 'NEW_max', 'NEW_max'), ('m', 'MAI_min', 'MAI_min'),
+    ('m', 'MAI_max', 'MAI_max'), ('m', 'Quote_category', 'Quote_category'), ('m', 'Quote_State', 'Quote_State'),
+    ('m', 'Branch', 'Branch'), ('m', 'Quote_name_general', 'Quote_name_general'),
+    ('c', 'Date de contrôle', 'Date de contrôle'), ('c', 'Date dernier contrôle', 'Date dernier contrôle'),
+    ('c', 'Type de contrôle', 'Type de contrôle'), ('c', 'Règle 1', 'Règle 1'), ('c', 'Périodicité', 'Périodicité'),
+    ('c', 'Fiche remplie par:', 'Fiche remplie par:'),
+    ('s', 'Catégorie UIC', 'Catégorie UIC'), ('s', 'Stratégie', 'Stratégie'),
+    ('s', "Type d'appareil", "Type d'appareil"), ('s', 'Switch_family', 'Switch_family'),
+    ('s', 'Tangent_hart', 'Tangent_hart'), ('s', 'Déviation', 'Déviation'),
+    ('s', 'Vitesse branche directe', 'Vitesse branche directe'),
+    ('s', 'Vitesse branche déviée', 'Vitesse branche déviée'), ('s', 'Faisceau', 'Faisceau'),
+    ('s', 'Date dernier renouv.', 'Date_dernier_renouv'), ('s', 'Coeur(s) fissuré(s)', 'Coeur(s) fissuré(s)'),
+    ('s', 'Gare / Bifurcation', 'Gare / Bifurcation'), ('s', 'Ligne', 'Ligne'),
+    ('s', 'Catégorie de voie', 'Catégorie de voie'), ('s', 'Voie', 'Voie'), ('s', 'Wissel_begin', 'Wissel_begin'),
+    ('s', 'Wisselzone_begin', 'Wisselzone_begin'), ('s', 'Wissel_einde', 'Wissel_einde'),
+    ('s', 'Wisselzone_einde', 'Wisselzone_einde'), ('s', 'Wissel_begin_KP', 'Wissel_begin_KP'),
+    ('s', 'Wissel_begin_M', 'Wissel_begin_M'), ('s', 'Wissel_einde_KP', 'Wissel_einde_KP'),
+    ('s', 'Wissel_einde_M', 'Wissel_einde_M'), ('s', 'Wisselzone_begin_KP', 'Wisselzone_begin_KP'),
+    ('s', 'Wisselzone_begin_M', 'Wisselzone_begin_M'), ('s', 'Wisselzone_einde_KP', 'Wisselzone_einde_KP'),
+    ('s', 'Wisselzone_einde_M', 'Wisselzone_einde_M'), ('s', 'Modèle coeur P1', 'Modèle coeur P1'),
+    ('s', 'Modèle coeur P2', 'Modèle coeur P2'), ('s', "Nombre d'attaques compl.", "Nombre d'attaques compl."),
+    ('s', 'Rayon voie directe', 'Rayon voie directe'), ('s', 'Straal_afwijkende_tak', 'Straal_afwijkende_tak'),
+    ('s', 'Nominale verkanting', 'Nominale verkanting'),
+    ('s', 'Model halve tongenstellen', 'Model halve tongenstellen'),
+    ('s', 'Modèle coeur K1/K2', 'Modèle coeur K1/K2'), ('s', 'Arrond.:', 'Arrond.'), ('s', 'Poste:', 'Poste'),
+]
+
+INGESTED_COLUMNS = [column for _, _, column in PARTITION_SOURCE_COLUMNS]
+
+# Partition columns (models.PARTITION_COLUMNS) no source table provides; they keep their default in appended rows
+UNSOURCED_COLUMNS = ['django_index', 'Path', 'Date validation SMS', *PARTITION_KEY_COLUMNS]
+
+# Unsourced text columns written with their model default, e.g. ' ' for Date validation SMS
+UNSOURCED_DEFAULTS = {field.column: field.get_default() for field in CompleteFinalCleanedData._meta.fields
+                      if field.column in UNSOURCED_COLUMNS and not field.primary_key}
+
+COPY_NULL = '\\N'
+
+
+def _column(alias, column):
+    return f"{alias}.{quote_identifier(column)}"
+
+
+def _text(alias, column):
+    return f"NULLIF(BTRIM(CAST({alias}.{quote_identifier(column)} AS TEXT)), '')"
+
+
+def _timestamp(alias, column):
+    # Dates come as dd/mm/yyyy text from the fiches, or already typed
+    value = _text(alias, column)
+    return (f"CASE WHEN {value} ~ '^\\d{{4}}-' THEN CAST({value} AS TIMESTAMP) "
+            f"ELSE TO_TIMESTAMP({value}, 'DD/MM/YYYY')::TIMESTAMP END")
+
+
+def _number(alias, column):
+    # Like pd.to_numeric(errors='coerce'), decimal commas included
+    value = _text(alias, column)
+    return (f"CASE WHEN {value} ~ '^[-+]?[0-9]*[.,]?[0-9]+$' "
+            f"THEN CAST(REPLACE({value}, ',', '.') AS DOUBLE PRECISION) END")
+
+
+# Cleaning done in SQL; the other columns are copied as they are
+SOURCE_EXPRESSIONS = {
+    'No. Ident.': _text,
+    'Quote_name': _text,
+    'Quote_measured_value': _number,
+    'Date de contrôle': _timestamp,
+}
+
+
+def build_source_query(after_section=None):
+    """Join the three cleaned tables on Section, cleaned like the data_testing notebook did in pandas.
+
+    Returns (query, params). Each row carries its partition year, arrondissement and Section
+    first, then the INGESTED_COLUMNS renamed from their source columns; rows
+    without a control date or an arrondissement cannot be placed in a partition and are left out,
+    so inner joins replace the notebook's outer merges. Rows are ordered by partition, then by
+    switch, quote and control date. With `after_section`, only the fiches (controls) with a
+    higher Section are read.
+    """
+    section = "CAST(c.\"Section\" AS INTEGER)"
+    select_list = ", ".join(
+        f"{SOURCE_EXPRESSIONS.get(source, _column)(alias, source)} AS {quote_identifier(column)}"
+        for alias, source, column in PARTITION_SOURCE_COLUMNS
+    )
+    query = (
+        f"SELECT * FROM ("
+        f"SELECT CAST(EXTRACT(YEAR FROM {_timestamp('c', 'Date de contrôle')}) AS INTEGER) AS partition_year, "
+        f"CAST(CAST({_text('s', 'Arrond.:')} AS NUMERIC) AS INTEGER) AS partition_arrondissement, "
+        f"{section} AS source_section, {select_list} "
+        f"FROM {quote_identifier(CONTROL_INFOS_TABLE)} AS c "
+        f"JOIN {quote_identifier(MEASUREMENT_RESULTS_TABLE)} AS m ON CAST(m.\"Section\" AS INTEGER) = {section} "
+        f"JOIN {quote_identifier(SWITCH_CHARACTERISTICS_TABLE)} AS s ON CAST(s.\"Section\" AS INTEGER) = {section}"
+    )
+    params = []
+    if after_section is not None:
+        query += f" WHERE {section} > %s"
+        params.append(int(after_section))
+    query += (
+        ") AS source WHERE partition_year IS NOT NULL AND partition_arrondissement IS NOT NULL "
+        "ORDER BY partition_year, partition_arrondissement, \"No. Ident.\", \"Quote_name\", \"Date de contrôle\""
+    )
+    return query, params
+
+
+def ingested_section():
+    """Highest Section already copied into the partitions, the watermark of incremental ingestion (None before any).
+
+    The partitions have no Section column; ingest() records the watermark in IngestWatermark.
+    """
+    return IngestWatermark.objects.aggregate(section=Max('section'))['section']
+
+
+def _table_columns(table_name):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT * FROM {quote_identifier(table_name)} LIMIT 0")
+        return [col[0] for col in cursor.description]
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _ensure_partition(table_name, query, params):
+    """Create a missing partition table; returns True when it was created.
+
+    New tables copy the columns of an existing partition (defaults included), or, for the very
+    first one, the column types of the source query plus a django_index primary key and the
+    UNSOURCED_DEFAULTS columns, so that the table has every PARTITION_COLUMNS column.
+    """
+    table = quote_identifier(table_name)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [table])
+        if cursor.fetchone()[0] is not None:
+            return False
+        template = next(iter(partition_catalog.tables()), None)
+        if template:
+            cursor.execute(f"CREATE TABLE {table} (LIKE {quote_identifier(template)} INCLUDING DEFAULTS)")
+            # The partition key columns of an attached template hold its own year and arrondissement
+            cursor.execute(f"ALTER TABLE {table} " + ", ".join(
+                f"DROP COLUMN IF EXISTS {quote_identifier(column)}" for column in PARTITION_KEY_COLUMNS))
+        else:
+            columns = ", ".join(quote_identifier(column) for column in INGESTED_COLUMNS)
+            cursor.execute(f"CREATE TABLE {table} AS SELECT {columns} FROM ({query}) AS source "
+                           f"WITH NO DATA", params)
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN django_index BIGINT PRIMARY KEY, " + ", ".join(
+                f"ADD COLUMN {quote_identifier(column)} TEXT NOT NULL DEFAULT {_literal(default)}"
+                for column, default in UNSOURCED_DEFAULTS.items()))
+    logger.info("Created partition table %s", table_name)
+    return True
+
+
+class _PartitionWriter:
+    """Buffers the rows of one partition as CSV and sends them with COPY FROM STDIN.
+
+    Rows get increasing django_index values above the table's current maximum, so incremental
+    readers (the latest-measurement snapshot) see them as appended rows.
+    """
+
+    def __init__(self, table_name, buffer_rows):
+        self.table_name = table_name
+        self.buffer_rows = buffer_rows
+        table_columns = _table_columns(table_name)
+        # Every value of the source must land in a column, and every column must get a value,
+        # or the rows would be appended with NULLs where the dashboard expects data
+        missing = [column for column in INGESTED_COLUMNS if column not in table_columns]
+        unsourced = [column for column in table_columns
+                     if column not in INGESTED_COLUMNS and column not in UNSOURCED_COLUMNS]
+        if missing or unsourced:
+            raise ValueError(f"{table_name} does not match the ingested columns: missing {missing}, "
+                             f"without a source column {unsourced}")
+        self.columns = [column for column in table_columns if column in INGESTED_COLUMNS]
+        self.positions = [INGESTED_COLUMNS.index(column) for column in self.columns]
+        # Written explicitly: a partition used as template may have these columns without a default
+        self.defaults = {column: default for column, default in UNSOURCED_DEFAULTS.items() if column in table_columns}
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COALESCE(MAX(django_index), 0) FROM {quote_identifier(table_name)}")
+            self.next_index = cursor.fetchone()[0] + 1
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+        self.written = 0
+
+    def add(self, values):
+        row = [self.next_index] + [values[position] for position in self.positions] + list(self.defaults.values())
+        self.writer.writerow([COPY_NULL if value is None else value for value in row])
+        self.next_index += 1
+        self.pending += 1
+        if self.pending >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        columns = ", ".join(quote_identifier(column)
+                            for column in ['django_index'] + self.columns + list(self.defaults))
+        sql = (f"COPY {quote_identifier(self.table_name)} ({columns}) FROM STDIN "
+               f"WITH (FORMAT csv, NULL '{COPY_NULL}')")
+        self.buffer.seek(0)
+        with connection.cursor() as cursor:
+            if hasattr(cursor, 'copy_expert'):  # psycopg2
+                cursor.copy_expert(sql, self.buffer)
+            else:  # psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(self.buffer.getvalue())
+        self.written += self.pending
+        logger.debug("Copied %d rows into %s", self.pending, self.table_name)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+
+
+def ingest(after_section=None, buffer_rows=None, fetch_rows=None, index=True):
+    """Build or extend the cleaned_data partitions from the three cleaned source tables.
+
+    The join runs in PostgreSQL and its rows are streamed from a server-side cursor, split per
+    year/arrondissement and loaded with COPY, `buffer_rows` rows at a time. With `after_section`,
+    only the fiches above that Section are appended (see ingested_section). Everything runs in
+    one transaction, the new Section watermark included. Returns {table name: appended rows}.
+    """
+    buffer_rows = buffer_rows or getattr(settings, 'INGEST_COPY_ROWS', 50000)
+    fetch_rows = fetch_rows or getattr(settings, 'PARTITION_LOAD_CHUNK_SIZE', 50000)
+    query, params = build_source_query(after_section)
+    writers = {}
+    created = []
+    max_section = None
+
+    with transaction.atomic():
+        writer = None
+        with connection.chunked_cursor() as source:
+            source.execute(query, params)
+            while True:
+                rows = source.fetchmany(fetch_rows)
+                if not rows:
+                    break
+                for row in rows:
+                    if row[2] is not None and (max_section is None or row[2] > max_section):
+                        max_section = row[2]
+                    table_name = DynamicTableLoader.table_name(row[0], row[1])
+                    if writer is None or writer.table_name != table_name:
+                        if writer is not None:
+                            writer.flush()
+                        if _ensure_partition(table_name, query, params):
+                            created.append((row[0], row[1]))
+                            partition_catalog.refresh()
+                        writer = writers[table_name] = _PartitionWriter(table_name, buffer_rows)
+                    writer.add(row[3:])
+        if writer is not None:
+            writer.flush()
+        if max_section is not None and (after_section is None or max_section > after_section):
+            IngestWatermark.objects.update_or_create(pk=1, defaults={'section': max_section})
+
+        with connection.cursor() as cursor:
+            for table_name in writers:
+                cursor.execute(f"ANALYZE {quote_identifier(table_name)}")
+
+    partition_catalog.refresh()
+    if index:
+        # Outside the transaction: the indexes of new partitions are built concurrently
+        for year, arrondissement in created:
+            create_indexes(year, arrondissement)
+
+    return {table_name: writer.written for table_name, writer in writers.items()}
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .models import FIELD_COLUMNS, DynamicTableLoader, quote_identifier
+from .partition_fetch import existing_partitions
+
+logger = logging.getLogger(__name__)
+
+RAMSES_COLUMN = quote_identifier(FIELD_COLUMNS.get('Ramses_id', 'Ramses_id'))
+QUOTE_COLUMN = quote_identifier(FIELD_COLUMNS.get('Quote_name', 'Quote_name'))
+DATE_COLUMN = quote_identifier(FIELD_COLUMNS.get('Date_control', 'Date_control'))
+
+
+def _earliest(a, b):
+    return b if a is None or (b is not None and b < a) else a
+
+
+def _latest(a, b):
+    return b if a is None or (b is not None and b > a) else a
+
+
+class PartitionLookup:
+    """Ramses_id → Quote_name → [row count, first control, last control] for one partition."""
+
+    def __init__(self, version):
+        self.version = version
+        self.max_index = None
+        self.quotes = {}
+        self.checked_at = time.monotonic()
+
+    def copy(self, version):
+        """A copy under a new version, to merge rows into without touching this lookup."""
+        lookup = PartitionLookup(version)
+        lookup.max_index = self.max_index
+        lookup.quotes = {ramses_id: {quote_name: list(entry) for quote_name, entry in quotes.items()}
+                         for ramses_id, quotes in self.quotes.items()}
+        return lookup
+
+    def merge(self, rows):
+        for ramses_id, quote_name, count, first, last, max_index in rows:
+            entry = self.quotes.setdefault(ramses_id, {}).get(quote_name)
+            if entry is None:
+                self.quotes[ramses_id][quote_name] = [count, first, last]
+            else:
+                entry[0] += count
+                entry[1] = _earliest(entry[1], first)
+                entry[2] = _latest(entry[2], last)
+            if max_index is not None and (self.max_index is None or max_index > self.max_index):
+                self.max_index = max_index
+
+
+class LookupIndex:
+    """Lightweight per-partition index answering the Ramses ID and Quote name dropdowns.
+
+    Built with one GROUP BY over the key columns, never touching the measurement columns.
+    When a partition's version changes and rows were only appended (of the table_version
+    counters, only the insert count moved), only the rows above the last seen django_index are
+    aggregated and merged; anything else triggers a rebuild.
+
+    A published PartitionLookup is never modified: appended rows are merged into a copy that
+    replaces it, so readers in other threads can iterate it without the lock.
+    """
+
+    def __init__(self, version_ttl=30):
+        self.version_ttl = version_ttl
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _aggregate(year, arrondissement, after_index=None):
+        table_name = quote_identifier(DynamicTableLoader.table_name(year, arrondissement))
+        query = (
+            f"SELECT {RAMSES_COLUMN}, {QUOTE_COLUMN}, COUNT(*), MIN({DATE_COLUMN}), MAX({DATE_COLUMN}), "
+            f"MAX(django_index) FROM {table_name}"
+        )
+        params = []
+        if after_index is not None:
+            query += " WHERE django_index > %s"
+            params.append(after_index)
+        query += " GROUP BY 1, 2"
+
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def partition(self, year, arrondissement):
+        key = (str(year), str(arrondissement))
+        with self._lock:
+            lookup = self._partitions.get(key)
+        if lookup is not None and time.monotonic() - lookup.checked_at < self.version_ttl:
+            return lookup
+
+        version = DynamicTableLoader.table_version(year, arrondissement)
+        if lookup is not None and lookup.version == version:
+            with self._lock:
+                lookup.checked_at = time.monotonic()
+            return lookup
+
+        # (max django_index, inserted, updated, deleted): same updates and deletes means appends only
+        if (lookup is not None and lookup.max_index is not None and version and len(version) == 4
+                and lookup.version and len(lookup.version) == 4 and version[2:] == lookup.version[2:]):
+            rows = self._aggregate(year, arrondissement, after_index=lookup.max_index)
+            merged = lookup.copy(version)
+            merged.merge(rows)
+            self._publish(key, merged)
+            logger.debug("Appended %d groups to the lookup index of %s", len(rows), key)
+            return merged
+
+        lookup = PartitionLookup(version)
+        lookup.merge(self._aggregate(year, arrondissement))
+        self._publish(key, lookup)
+        logger.debug("Built the lookup index of %s", key)
+        return lookup
+
+    def _publish(self, key, lookup):
+        # Concurrent refreshes each build a complete lookup from a published one; the last one wins
+        with self._lock:
+            self._partitions[key] = lookup
+
+    def _lookups(self, years, arrondissements):
+        return [self.partition(year, arrondissement)
+                for year, arrondissement in existing_partitions(years, arrondissements)]
+
+    def ramses_ids(self, years, arrondissements):
+        ids = set()
+        for lookup in self._lookups(years, arrondissements):
+            ids.update(lookup.quotes)
+        return sorted(ids, key=str)
+
+    def quote_names(self, ramses_id, years, arrondissements):
+        names = set()
+        for lookup in self._lookups(years, arrondissements):
+            names.update(lookup.quotes.get(ramses_id, {}))
+        return sorted(names, key=str)
+
+    def summary(self, ramses_id, years, arrondissements):
+        """Return {quote_name: {'count', 'first_control', 'last_control'}} for one switch."""
+        summary = {}
+        for lookup in self._lookups(years, arrondissements):
+            for quote_name, (count, first, last) in lookup.quotes.get(ramses_id, {}).items():
+                entry = summary.setdefault(quote_name, {'count': 0, 'first_control': first, 'last_control': last})
+                entry['count'] += count
+                entry['first_control'] = _earliest(entry['first_control'], first)
+                entry['last_control'] = _latest(entry['last_control'], last)
+        return summary
+
+
+lookup_index = LookupIndex(version_ttl=getattr(settings, 'PARTITION_CACHE_VERSION_TTL', 30))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.partition_fetch import FETCH_MODES, existing_partitions, fetch_partitions
+
+
+class Command(BaseCommand):
+    help = "Compare sequential, UNION ALL and parallel fetch times over year × arrondissement partitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', nargs='+', required=True)
+        parser.add_argument('--arrondissements', nargs='+', required=True)
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per mode; the best time is reported.")
+        parser.add_argument('--ramses-id', help="Benchmark a filtered fetch for one switch instead of whole partitions.")
+        parser.add_argument('--quote-name')
+
+    def handle(self, *args, **options):
+        years = options['years']
+        arrondissements = options['arrondissements']
+        filters = {
+            'ramses_ids': options['ramses_id'],
+            'quote_names': options['quote_name'],
+        }
+
+        partitions = existing_partitions(years, arrondissements)
+        self.stdout.write(
+            f"{len(partitions)} of {len(years) * len(arrondissements)} selected partitions exist"
+        )
+
+        results = {}
+        for mode in FETCH_MODES:
+            timings = []
+            rows = 0
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                df = fetch_partitions(years, arrondissements, mode=mode, use_cache=False, **filters)
+                timings.append(time.perf_counter() - start)
+                rows = len(df)
+            results[mode] = min(timings)
+            self.stdout.write(f"{mode:>10}: {min(timings):8.3f}s best of {len(timings)} ({rows} rows)")
+
+        baseline = results['sequential']
+        for mode in ('union', 'parallel'):
+            if results[mode]:
+                self.stdout.write(f"{mode:>10}: {baseline / results[mode]:.2f}x vs sequential")
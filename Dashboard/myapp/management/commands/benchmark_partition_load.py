@@ -0,0 +1,105 @@
+import multiprocessing
+import resource
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from myapp.dtypes import load_compact_frame, normalize_frame
+from myapp.models import COLUMN_RENAMES, DynamicTableLoader, quote_identifier
+
+SYNTHETIC_YEAR = 9999
+SYNTHETIC_ARRONDISSEMENT = 0
+
+
+def _load_fetchall(year, arrondissement, chunk_size):
+    # The former path: every row as a tuple, then an object DataFrame, then the compact one
+    columns, rows = DynamicTableLoader.load_data(year, arrondissement)
+    return normalize_frame(pd.DataFrame(rows, columns=columns).rename(columns=COLUMN_RENAMES))
+
+
+def _load_streaming(year, arrondissement, chunk_size):
+    return load_compact_frame(year, arrondissement, chunk_size=chunk_size)
+
+
+LOADERS = {'fetchall': _load_fetchall, 'streaming': _load_streaming}
+
+
+def _measure(mode, year, arrondissement, chunk_size, results):
+    # Runs in a forked process: ru_maxrss only grows, so each mode needs its own process
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    df = LOADERS[mode](year, arrondissement, chunk_size)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put({
+        'mode': mode,
+        'seconds': elapsed,
+        'rows': len(df),
+        'peak_kib': peak - baseline,
+        'frame_bytes': int(df.memory_usage(deep=True).sum()),
+    })
+
+
+class Command(BaseCommand):
+    help = ("Compare the peak memory (RSS) and time of loading one partition with fetchall and with the "
+            "streaming chunked loader, optionally on a synthetic partition of --synthetic-rows rows.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('year')
+        parser.add_argument('arrondissement')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--synthetic-rows', type=int,
+                            help="Build a temporary partition of this many rows by repeating the given one, "
+                                 "benchmark it and drop it.")
+
+    def handle(self, *args, **options):
+        year, arrondissement = options['year'], options['arrondissement']
+        synthetic = options['synthetic_rows']
+        if synthetic:
+            self._create_synthetic(year, arrondissement, synthetic)
+            year, arrondissement = SYNTHETIC_YEAR, SYNTHETIC_ARRONDISSEMENT
+
+        try:
+            context = multiprocessing.get_context('fork')
+            for mode in LOADERS:
+                # Forked children must not share the parent's connection
+                connections.close_all()
+                results = context.Queue()
+                process = context.Process(target=_measure,
+                                          args=(mode, year, arrondissement, options['chunk_size'], results))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    raise CommandError(f"The {mode} load failed (exit code {process.exitcode})")
+                result = results.get()
+                self.stdout.write(
+                    f"{mode:>10}: {result['seconds']:8.2f}s, {result['rows']} rows, "
+                    f"peak RSS +{result['peak_kib'] / 1024:,.0f} MB, frame {result['frame_bytes'] / 2**20:,.0f} MB"
+                )
+        finally:
+            if synthetic:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {self._synthetic_table()}")
+
+    @staticmethod
+    def _synthetic_table():
+        return quote_identifier(DynamicTableLoader.table_name(SYNTHETIC_YEAR, SYNTHETIC_ARRONDISSEMENT))
+
+    def _create_synthetic(self, year, arrondissement, rows):
+        source = quote_identifier(DynamicTableLoader.table_name(year, arrondissement))
+        table = self._synthetic_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {source}")
+            source_rows = cursor.fetchone()[0]
+            if not source_rows:
+                raise CommandError(f"{source} is empty")
+            repeats = -(-rows // source_rows)
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(
+                f"CREATE TABLE {table} AS SELECT source.* FROM {source} AS source "
+                f"CROSS JOIN generate_series(1, %s) LIMIT %s",
+                [repeats, rows],
+            )
+        self.stdout.write(f"Built {table} with {rows} rows from {source}")
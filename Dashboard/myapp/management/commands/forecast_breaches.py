@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.forecasting import fleet_forecast, rank_breaches, switch_urgency
+from myapp.partition_catalog import partition_catalog
+
+
+class Command(BaseCommand):
+    help = ("Forecast when every switch quote crosses its next IAL/IL/AL limit and list the most urgent "
+            "switches. Forecasts are cached per arrondissement and partition version, so a daily run "
+            "only recomputes the arrondissements that received new controls.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arrondissements', type=int, nargs='+',
+                            help="Arrondissements to forecast (default: all with data).")
+        parser.add_argument('--robust', action='store_true',
+                            help="Fit the trends with Huber-weighted least squares instead of plain least squares.")
+        parser.add_argument('--within-days', type=int, help="Only list breaches forecast within this many days.")
+        parser.add_argument('--top', type=int, default=20, help="Switches to list (default 20).")
+
+    def handle(self, *args, **options):
+        partition_catalog.refresh()
+        start = time.perf_counter()
+        forecast = fleet_forecast(options['arrondissements'], robust=options['robust'])
+        ranked = rank_breaches(forecast, within_days=options['within_days'])
+        elapsed = time.perf_counter() - start
+
+        for row in switch_urgency(ranked).head(options['top']).itertuples(index=False):
+            self.stdout.write(
+                f"{row.Ramses_id} {row.Quote_name}: {row.next_limit} {row.limit_value:g} on "
+                f"{row.breach_date:%d-%m-%Y} ({row.days_to_breach:.0f} days, {row.band_after}), "
+                f"{row.quotes_breaching} quotes breaching"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(forecast)} quotes forecast, {len(ranked)} breaching, "
+            f"{ranked['Ramses_id'].nunique()} switches in {elapsed:.1f}s"
+        ))
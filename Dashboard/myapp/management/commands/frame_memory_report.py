@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from myapp.dtypes import memory_report, normalize_frame
+from myapp.models import DynamicTableLoader
+
+
+class Command(BaseCommand):
+    help = "Load one partition and compare its per-column memory use before and after dtype normalization."
+
+    def add_arguments(self, parser):
+        parser.add_argument('year')
+        parser.add_argument('arrondissement')
+
+    def handle(self, *args, **options):
+        raw = DynamicTableLoader.load_frame(options['year'], options['arrondissement'])
+        normalized = normalize_frame(raw)
+        report = memory_report(raw, normalized)
+
+        self.stdout.write(report.to_string())
+        before, after = report['bytes_before'].sum(), report['bytes_after'].sum()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(raw)} rows: {before / 2**20:.1f} MB -> {after / 2**20:.1f} MB "
+            f"({before / after if after else 0:.1f}x smaller)"
+        ))
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ingest import ingest, ingested_section
+from myapp.partition_catalog import partition_catalog
+
+
+class Command(BaseCommand):
+    help = ("Build the cleaned_data partitions from clean_control_infos_field, clean_df_measurement_results_field "
+            "and clean_switch_characteristics_field with COPY. By default only the fiches newer than the "
+            "highest Section already ingested are appended.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since-section', type=int,
+                            help="Append the fiches above this Section instead of the ingested watermark.")
+        parser.add_argument('--full', action='store_true',
+                            help="Ingest every fiche; the partitions must not hold any rows yet.")
+        parser.add_argument('--buffer-rows', type=int, help="Rows per COPY (default INGEST_COPY_ROWS).")
+        parser.add_argument('--no-indexes', action='store_true', help="Do not index the partitions created.")
+
+    def handle(self, *args, **options):
+        partition_catalog.refresh()
+        if options['full']:
+            if any(not table['empty'] for table in partition_catalog.tables().values()):
+                raise CommandError("The partitions already hold rows; drop or truncate them before a full ingestion")
+            after_section = None
+        elif options['since_section'] is not None:
+            after_section = options['since_section']
+        else:
+            after_section = ingested_section()
+            if after_section is None and any(not table['empty'] for table in partition_catalog.tables().values()):
+                raise CommandError("No Section watermark is recorded for the existing partitions; "
+                                   "pass --since-section with the last Section they hold")
+        self.stdout.write(f"Ingesting fiches above Section {after_section}" if after_section is not None
+                          else "Ingesting every fiche")
+
+        start = time.perf_counter()
+        appended = ingest(after_section=after_section, buffer_rows=options['buffer_rows'],
+                          index=not options['no_indexes'])
+        elapsed = time.perf_counter() - start
+
+        for table_name, rows in appended.items():
+            self.stdout.write(f"{table_name}: {rows} rows")
+        total = sum(appended.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Appended {total} rows to {len(appended)} partitions in {elapsed:.1f}s "
+            f"({total / elapsed if elapsed else 0:,.0f} rows/s)"
+        ))
@@ -0,0 +1,58 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ("Measure throughput and latency of the sync and async data views at several numbers of "
+            "concurrent clients, against a running server (e.g. `uvicorn Dashboard.asgi:application`).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--years', nargs='+', required=True)
+        parser.add_argument('--arrondissements', nargs='+', required=True)
+        parser.add_argument('--paths', nargs='+', default=['/load_data_view/', '/async/load_data_view/'],
+                            help="View paths to compare; the selection is passed as the query string.")
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 10, 50])
+        parser.add_argument('--requests-per-client', type=int, default=5)
+        parser.add_argument('--timeout', type=float, default=120.0)
+
+    def handle(self, *args, **options):
+        query = urlencode({'years': options['years'], 'arrondissements': options['arrondissements']}, doseq=True)
+
+        for path in options['paths']:
+            url = f"{options['base_url'].rstrip('/')}{path}?{query}"
+            self.stdout.write(f"{path}")
+            for clients in options['concurrency']:
+                total = clients * options['requests_per_client']
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=clients) as executor:
+                    results = list(executor.map(lambda _: self._request(url, options['timeout']), range(total)))
+                elapsed = time.perf_counter() - start
+
+                latencies = sorted(latency for ok, latency in results if ok)
+                errors = total - len(latencies)
+                if not latencies:
+                    self.stdout.write(self.style.ERROR(f"{clients:>5} clients: all {total} requests failed"))
+                    continue
+                p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+                self.stdout.write(
+                    f"{clients:>5} clients: {len(latencies) / elapsed:8.2f} req/s, "
+                    f"p50 {statistics.median(latencies) * 1000:8.1f} ms, p95 {p95 * 1000:8.1f} ms, "
+                    f"{errors} errors"
+                )
+
+    @staticmethod
+    def _request(url, timeout):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                response.read()
+        except (urllib.error.URLError, OSError):
+            return False, time.perf_counter() - start
+        return True, time.perf_counter() - start
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from myapp.models import DynamicTableLoader
+from myapp.partition_admin import attach_partition, check_indexes, create_indexes, parent_table
+from myapp.partition_fetch import all_partitions
+
+
+class Command(BaseCommand):
+    help = ("Check or create the composite indexes of every cleaned_data partition, and optionally "
+            "attach the partitions to a native partitioned parent table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', nargs='+', type=int, help="Only handle these years.")
+        parser.add_argument('--arrondissements', nargs='+', type=int, help="Only handle these arrondissements.")
+        parser.add_argument('--create-indexes', action='store_true',
+                            help="Create missing indexes and rebuild invalid ones (default: only report them).")
+        parser.add_argument('--no-concurrently', action='store_true',
+                            help="Build indexes with a plain CREATE INDEX, which blocks writes but is faster.")
+        parser.add_argument('--attach', action='store_true',
+                            help="Attach the partitions to the partitioned parent table (PARTITION_PARENT_TABLE).")
+
+    def handle(self, *args, **options):
+        partitions = [
+            (year, arrondissement) for year, arrondissement in all_partitions()
+            if (not options['years'] or year in options['years'])
+            and (not options['arrondissements'] or arrondissement in options['arrondissements'])
+        ]
+        self.stdout.write(f"{len(partitions)} partition tables")
+
+        missing = created = attached = failed = 0
+        for year, arrondissement in partitions:
+            table_name = DynamicTableLoader.table_name(year, arrondissement)
+            for name, fields, status in check_indexes(year, arrondissement):
+                if status != 'ok':
+                    missing += 1
+                    self.stdout.write(f"{table_name}: {name} ({', '.join(fields)}) is {status}")
+
+            try:
+                if options['create_indexes']:
+                    created += len(create_indexes(year, arrondissement, concurrently=not options['no_concurrently']))
+                if options['attach'] and attach_partition(year, arrondissement):
+                    attached += 1
+            except DatabaseError as e:
+                failed += 1
+                self.stderr.write(f"{table_name}: {e}")
+
+        summary = f"{missing} missing or invalid indexes"
+        if options['create_indexes']:
+            summary += f", {created} created"
+        if options['attach']:
+            summary += f", {attached} partitions attached to {parent_table()}"
+        if failed:
+            summary += f", {failed} partitions failed"
+        self.stdout.write((self.style.WARNING if failed else self.style.SUCCESS)(summary))
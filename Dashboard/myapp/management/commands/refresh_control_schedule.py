@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from myapp.control_schedule import refresh_control_schedule
+from myapp.snapshot import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = ("Recompute the next control date of every switch (last control plus Périodicité months) "
+            "from the latest-measurement snapshot. Meant to run daily.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-snapshot', action='store_true',
+                            help="Do not merge new controls into the snapshot first.")
+
+    def handle(self, *args, **options):
+        if not options['skip_snapshot']:
+            refresh_snapshot()
+        switches = refresh_control_schedule()
+        self.stdout.write(self.style.SUCCESS(f"Control schedule refreshed: {switches} switches"))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.rollups import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = ("Refresh the latest-measurement snapshot, the degradation rates of the arrondissements whose "
+            "partitions changed and the fleet overview rollup. Meant to run periodically (e.g. from cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Recompute the degradation rates of every arrondissement.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        changed = refresh_rollups(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Fleet rollup refreshed in {time.perf_counter() - start:.1f}s "
+            f"({changed} arrondissements recomputed)"
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from myapp.snapshot import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = "Merge new controls from the cleaned_data partitions into the latest-measurement snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Rebuild the snapshot from scratch instead of reading new rows only.")
+
+    def handle(self, *args, **options):
+        upserted = refresh_snapshot(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"Snapshot refreshed: {upserted} rows upserted"))
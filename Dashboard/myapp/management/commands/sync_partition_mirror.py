@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from myapp.partition_fetch import all_partitions
+from myapp.partition_mirror import mirrored_partitions, remove_partition, sync_partition
+
+
+class Command(BaseCommand):
+    help = "Mirror the cleaned_data partitions into local Arrow files, rewriting only the partitions that changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', nargs='+', type=int, help="Only sync these years.")
+        parser.add_argument('--arrondissements', nargs='+', type=int, help="Only sync these arrondissements.")
+        parser.add_argument('--force', action='store_true', help="Rewrite the selected partitions even when unchanged.")
+        parser.add_argument('--prune', action='store_true',
+                            help="Remove mirrored partitions whose table no longer exists.")
+
+    def handle(self, *args, **options):
+        partitions = all_partitions()
+        selected = [
+            (year, arrondissement) for year, arrondissement in partitions
+            if (not options['years'] or year in options['years'])
+            and (not options['arrondissements'] or arrondissement in options['arrondissements'])
+        ]
+
+        synced = 0
+        for year, arrondissement in selected:
+            if sync_partition(year, arrondissement, force=options['force']):
+                synced += 1
+                self.stdout.write(f"Synced {year}/{arrondissement}")
+
+        removed = 0
+        if options['prune']:
+            for partition in set(mirrored_partitions()) - set(partitions):
+                remove_partition(*partition)
+                removed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{synced} of {len(selected)} partitions rewritten, {len(selected) - synced} unchanged"
+            + (f", {removed} removed" if options['prune'] else "")
+        ))
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_delete_completefinalcleaneddata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestMeasurement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Ramses_id', models.TextField()),
+                ('Quote_name', models.TextField()),
+                ('Quote_name_general', models.TextField(null=True)),
+                ('Quote_measured_value', models.FloatField(null=True)),
+                ('IAL_min', models.FloatField(null=True)),
+                ('IAL_max', models.FloatField(null=True)),
+                ('IL_min', models.FloatField(null=True)),
+                ('IL_max', models.FloatField(null=True)),
+                ('AL_min', models.FloatField(null=True)),
+                ('AL_max', models.FloatField(null=True)),
+                ('Date_control', models.DateTimeField(null=True)),
+                ('Date_last_control', models.DateTimeField(null=True)),
+                ('Périodicité', models.IntegerField(null=True)),
+                ('Ligne', models.TextField(null=True)),
+                ('Poste', models.TextField(null=True)),
+                ('year', models.IntegerField()),
+                ('arrondissement', models.IntegerField(db_index=True)),
+                ('source_index', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('Ramses_id', 'Quote_name'), name='latest_measurement_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=255, unique=True)),
+                ('version', models.TextField(default='')),
+                ('max_index', models.BigIntegerField(null=True)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-17 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_latestmeasurement_snapshotwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.IntegerField()),
+                ('ingested_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
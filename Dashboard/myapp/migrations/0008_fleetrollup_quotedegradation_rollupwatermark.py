@@ -0,0 +1,56 @@
+# Generated by Django 5.0.6 on 2026-10-17 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_ingestwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arrondissement', models.IntegerField(db_index=True)),
+                ('Ligne', models.TextField()),
+                ('Poste', models.TextField()),
+                ('switches', models.IntegerField()),
+                ('quotes', models.IntegerField()),
+                ('green', models.IntegerField()),
+                ('orange', models.IntegerField()),
+                ('pink', models.IntegerField()),
+                ('red', models.IntegerField()),
+                ('median_degradation', models.FloatField(null=True)),
+                ('overdue', models.IntegerField()),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuoteDegradation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Ramses_id', models.TextField()),
+                ('Quote_name', models.TextField()),
+                ('arrondissement', models.IntegerField(db_index=True)),
+                ('measurements', models.IntegerField()),
+                ('last_control', models.DateTimeField(null=True)),
+                ('slope_total', models.FloatField(null=True)),
+                ('slope_last_two', models.FloatField(null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('Ramses_id', 'Quote_name'), name='quote_degradation_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arrondissement', models.IntegerField(unique=True)),
+                ('version', models.TextField()),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-17 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_fleetrollup_quotedegradation_rollupwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ControlDue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Ramses_id', models.TextField(unique=True)),
+                ('arrondissement', models.IntegerField(db_index=True)),
+                ('Ligne', models.TextField(null=True)),
+                ('Poste', models.TextField(null=True)),
+                ('last_control', models.DateTimeField(null=True)),
+                ('periodicity', models.IntegerField(null=True)),
+                ('due_date', models.DateTimeField(db_index=True, null=True)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['arrondissement', 'due_date'], name='control_due_arr_date_idx')],
+            },
+        ),
+    ]
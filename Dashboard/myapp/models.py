@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.db import models
 from django.db import connection
 import logging
+import re
 import pandas as pd
 
 class CompleteFinalCleanedData(models.Model):
@@ -59,8 +61,8 @@ class CompleteFinalCleanedData(models.Model):
     Nom_verkanting = models.CharField(db_column='Nominale verkanting', max_length=255)
     Model_halve_tongenstellen = models.TextField(db_column='Model halve tongenstellen')
     Modèle_K1_K2 = models.TextField(db_column='Modèle coeur K1/K2')
-    Arr = models.IntegerField(db_column='Arrond.:')
-    Poste = models.IntegerField(db_column='Poste:')
+    Arr = models.IntegerField(db_column='Arrond.')
+    Poste = models.IntegerField(db_column='Poste')
     Ramses_id = models.TextField(db_column='No. Ident.', db_index=True)
     Date_control = models.DateTimeField(db_column='Date de contrôle', db_index=True)
     Date_last_control = models.DateTimeField(db_column='Date dernier contrôle')
@@ -76,23 +78,359 @@ class CompleteFinalCleanedData(models.Model):
 
     
 
+class LatestMeasurement(models.Model):
+    """Latest control of every (Ramses_id, Quote_name) across the cleaned_data partitions.
+
+    Maintained by myapp.snapshot from the partition tables; year and arrondissement name
+    the partition the row was taken from and source_index its django_index there.
+    """
+    Ramses_id = models.TextField()
+    Quote_name = models.TextField()
+    Quote_name_general = models.TextField(null=True)
+    Quote_measured_value = models.FloatField(null=True)
+    IAL_min = models.FloatField(null=True)
+    IAL_max = models.FloatField(null=True)
+    IL_min = models.FloatField(null=True)
+    IL_max = models.FloatField(null=True)
+    AL_min = models.FloatField(null=True)
+    AL_max = models.FloatField(null=True)
+    Date_control = models.DateTimeField(null=True)
+    Date_last_control = models.DateTimeField(null=True)
+    Périodicité = models.IntegerField(null=True)
+    Ligne = models.TextField(null=True)
+    Poste = models.TextField(null=True)
+    year = models.IntegerField()
+    arrondissement = models.IntegerField(db_index=True)
+    source_index = models.BigIntegerField()
+    updated_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['Ramses_id', 'Quote_name'], name='latest_measurement_key'),
+        ]
+
+
+class SnapshotWatermark(models.Model):
+    """How far LatestMeasurement has read each partition table."""
+    table_name = models.CharField(max_length=255, unique=True)
+    version = models.TextField(default='')
+    max_index = models.BigIntegerField(null=True)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+
+class IngestWatermark(models.Model):
+    """Highest source Section copied into the partitions by myapp.ingest (a single row)."""
+    section = models.IntegerField()
+    ingested_at = models.DateTimeField(auto_now=True)
+
+
+class QuoteDegradation(models.Model):
+    """Degradation rates of every (Ramses_id, Quote_name) over all years of its arrondissement.
+
+    Maintained by myapp.rollups, one arrondissement at a time when one of its partitions changed.
+    """
+    Ramses_id = models.TextField()
+    Quote_name = models.TextField()
+    arrondissement = models.IntegerField(db_index=True)
+    measurements = models.IntegerField()
+    last_control = models.DateTimeField(null=True)
+    slope_total = models.FloatField(null=True)
+    slope_last_two = models.FloatField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['Ramses_id', 'Quote_name'], name='quote_degradation_key'),
+        ]
+
+
+class FleetRollup(models.Model):
+    """Fleet overview per arrondissement, Ligne and Poste, rebuilt by myapp.rollups.
+
+    Switches are counted in the worst gauge band of their latest measurements; overdue switches
+    are those whose last control plus Périodicité months lies in the past.
+    """
+    arrondissement = models.IntegerField(db_index=True)
+    Ligne = models.TextField()
+    Poste = models.TextField()
+    switches = models.IntegerField()
+    quotes = models.IntegerField()
+    green = models.IntegerField()
+    orange = models.IntegerField()
+    pink = models.IntegerField()
+    red = models.IntegerField()
+    median_degradation = models.FloatField(null=True)
+    overdue = models.IntegerField()
+    refreshed_at = models.DateTimeField()
+
+
+class ControlDue(models.Model):
+    """Next control of every switch: its last control plus Périodicité months, maintained by myapp.control_schedule."""
+    Ramses_id = models.TextField(unique=True)
+    arrondissement = models.IntegerField(db_index=True)
+    Ligne = models.TextField(null=True)
+    Poste = models.TextField(null=True)
+    last_control = models.DateTimeField(null=True)
+    periodicity = models.IntegerField(null=True)
+    due_date = models.DateTimeField(null=True, db_index=True)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['arrondissement', 'due_date'], name='control_due_arr_date_idx'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Partition versions (snapshot watermarks) of an arrondissement when its degradation rates were computed."""
+    arrondissement = models.IntegerField(unique=True)
+    version = models.TextField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+
+# Columns of a partition table, in table order. Partitions attached to the partitioned parent
+# table also carry partition_admin.PARTITION_KEY_COLUMNS, which queries leave out.
+PARTITION_COLUMNS = [field.column for field in CompleteFinalCleanedData._meta.fields]
+
+# Mapping from the raw partition table column names to the Django model field names
+COLUMN_RENAMES = {
+    'Numéro ES': 'Num_ES',
+    'Catégorie UIC': 'Cat_UIC',
+    "Type d'appareil": 'Type_AW',
+    'Vitesse branche directe': 'V_directe',
+    'Vitesse branche déviée': 'V_déviée',
+    'Coeur(s) fissuré(s)': 'Coeur_fissuré',
+    'Gare / Bifurcation': 'Gare_Bifurcation',
+    'Catégorie de voie': 'Cat_voie',
+    'Modèle coeur P1': 'Modèle_P1',
+    'Modèle coeur P2': 'Modèle_P2',
+    "Nombre d'attaques compl.": 'Nombre_att_compl',
+    'Rayon voie directe': 'Rayon_directe',
+    'Nominale verkanting': 'Nom_verkanting',
+    'Model halve tongenstellen': 'Model_halve_tongenstellen',
+    'Modèle coeur K1/K2': 'Modèle_K1_K2',
+    'Arrond.': 'Arr',
+    'Poste': 'Poste',
+    'No. Ident.': 'Ramses_id',
+    'Date de contrôle': 'Date_control',
+    'Date dernier contrôle': 'Date_last_control',
+    'Type de contrôle': 'Type_control',
+    'Règle 1': 'Tool_id',
+    'Périodicité': 'Périodicité',
+    'Fiche remplie par:': 'Author',
+    'Date validation SMS': 'Date_validation_SMS'
+}
+
+# Mapping from the model field names back to the raw partition table column names
+FIELD_COLUMNS = {field: column for column, field in COLUMN_RENAMES.items()}
+
+# cleaned_data_{year}.0_arr_{arrondissement}
+PARTITION_TABLE_PATTERN = re.compile(r'^cleaned_data_(\d+)\.0_arr_(\d+)$')
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def build_where(ramses_ids=None, quote_names=None, start_date=None, end_date=None):
+    """Build a parameterized WHERE clause for the usual dashboard filters.
+
+    `ramses_ids` and `quote_names` accept a single value (equality) or a list (IN).
+    Returns the clause (empty string when there is no filter) and its parameters.
+    """
+    conditions = []
+    params = []
+
+    for field, values in (('Ramses_id', ramses_ids), ('Quote_name', quote_names)):
+        if values is None or (isinstance(values, (list, tuple, set)) and not values):
+            continue
+        column = quote_identifier(FIELD_COLUMNS.get(field, field))
+        if isinstance(values, (list, tuple, set)):
+            values = list(values)
+            conditions.append(f"{column} IN ({', '.join(['%s'] * len(values))})")
+            params.extend(values)
+        else:
+            conditions.append(f"{column} = %s")
+            params.append(values)
+
+    date_column = quote_identifier(FIELD_COLUMNS['Date_control'])
+    if start_date:
+        conditions.append(f"{date_column} >= %s")
+        params.append(start_date)
+    if end_date:
+        conditions.append(f"{date_column} <= %s")
+        params.append(end_date)
+
+    clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return clause, params
+
+
+def build_select_list(columns=None):
+    """Turn model field names into a SELECT list aliased back to the field names.
+
+    Without `columns`, every PARTITION_COLUMNS column is selected under its raw name.
+    """
+    if not columns:
+        # Not *: attached and unattached partitions must give the same columns to a UNION
+        return ", ".join(quote_identifier(column) for column in PARTITION_COLUMNS)
+    return ", ".join(
+        f"{quote_identifier(FIELD_COLUMNS.get(field, field))} AS {quote_identifier(field)}"
+        for field in columns
+    )
+
+
+def build_order_by(order_by=None, aliased=False):
+    """Turn field names (prefixed with '-' for descending order) into an ORDER BY clause.
+
+    With `aliased`, the field names are used as is, for queries whose SELECT list was built
+    by build_select_list.
+    """
+    if not order_by:
+        return ""
+    terms = []
+    for field in order_by:
+        direction = "DESC" if field.startswith('-') else "ASC"
+        field = field.lstrip('-')
+        column = field if aliased else FIELD_COLUMNS.get(field, field)
+        terms.append(f"{quote_identifier(column)} {direction}")
+    return f" ORDER BY {', '.join(terms)}"
+
+
+def iter_cursor_chunks(query, params=None, chunk_size=10000):
+    """Run a query on a server-side cursor and yield (columns, rows) chunks of at most chunk_size rows."""
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(query, params)
+        columns = [col[0] for col in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, rows
+
+
 class DynamicTableLoader:
+    @staticmethod
+    def table_name(year, arrondissement):
+        return f'cleaned_data_{str(year)}.0_arr_{str(arrondissement)}'
+
+    @staticmethod
+    def row_key_prefix(year, arrondissement):
+        return f'{year}:{arrondissement}:'
+
+    @staticmethod
+    def parse_row_key(row_key):
+        """Split a row key built by build_query(row_key=True) into (year, arrondissement, django_index)."""
+        year, arrondissement, django_index = str(row_key).split(':')
+        return year, arrondissement, int(django_index)
+
+    @staticmethod
+    def build_query(year, arrondissement, columns=None, ramses_ids=None, quote_names=None,
+                    start_date=None, end_date=None, order_by=None, limit=None, row_key=False):
+        """Build the parameterized SELECT for one partition with the filters pushed down.
+
+        With `row_key`, a leading row_key column ("year:arrondissement:django_index") identifies
+        every row across partitions.
+        """
+        table_name = quote_identifier(DynamicTableLoader.table_name(year, arrondissement))
+        where, params = build_where(ramses_ids, quote_names, start_date, end_date)
+        select_list = build_select_list(columns)
+        if row_key:
+            select_list = f"%s || CAST(django_index AS TEXT) AS row_key, {select_list}"
+            params.insert(0, DynamicTableLoader.row_key_prefix(year, arrondissement))
+        query = f"SELECT {select_list} FROM {table_name}{where}{build_order_by(order_by)}"
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(int(limit))
+        return query, params
+
+    @staticmethod
+    def query(year, arrondissement, **filters):
+        """Run a filtered, projected query on one partition and return a renamed DataFrame.
+
+        Accepts the keyword arguments of build_query; column names are model field names.
+        """
+        query, params = DynamicTableLoader.build_query(year, arrondissement, **filters)
+
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            columns = [col[0] for col in cursor.description]
+            rows = cursor.fetchall()
+
+        logging.debug("Fetched %d rows with %s", len(rows), query)
+        return pd.DataFrame(rows, columns=columns).rename(columns=COLUMN_RENAMES)
+
     @staticmethod
     def load_data(year, arrondissement):
-        table_name = f'"cleaned_data_{str(year)}.0_arr_{str(arrondissement)}"'
-        query = f"SELECT * FROM {table_name}"
+        """Fetch a whole partition at once; returns the raw column names and row tuples."""
+        table_name = quote_identifier(DynamicTableLoader.table_name(year, arrondissement))
+        query = f"SELECT {build_select_list()} FROM {table_name}"
 
         with connection.cursor() as cursor:
             cursor.execute(query)
             columns = [col[0] for col in cursor.description]
             rows = cursor.fetchall()
 
-        df = pd.DataFrame(rows, columns=columns)
+        logging.debug("Loaded %d rows and %d columns from %s", len(rows), len(columns), table_name)
+        return columns, rows
 
-        # Log the DataFrame shape and column names
-        logging.info(f"Loaded data from {table_name} with shape {df.shape}")
-        logging.info(f"Columns: {df.columns.tolist()}")
-        logging.info(f"Sample Data:\n{df.head()}")
+    @staticmethod
+    def iter_frames(year, arrondissement, chunk_size=None, **filters):
+        """Stream one partition from a server-side cursor as renamed DataFrame chunks.
 
-        return columns, rows
-    
+        Accepts the keyword arguments of build_query. Only `chunk_size` rows
+        (PARTITION_LOAD_CHUNK_SIZE by default) are held as Python tuples at a time. A partition
+        without matching rows yields one empty frame with its columns.
+        """
+        chunk_size = chunk_size or getattr(settings, 'PARTITION_LOAD_CHUNK_SIZE', 50000)
+        query, params = DynamicTableLoader.build_query(year, arrondissement, **filters)
+
+        chunks = 0
+        for columns, rows in iter_cursor_chunks(query, params, chunk_size):
+            chunks += 1
+            yield pd.DataFrame.from_records(rows, columns=columns).rename(columns=COLUMN_RENAMES)
+
+        if not chunks:
+            yield DynamicTableLoader.query(year, arrondissement, **{**filters, 'limit': 0})
+        logging.debug("Streamed %s in %d chunks of up to %d rows", query, chunks, chunk_size)
+
+    @staticmethod
+    def load_frame(year, arrondissement, chunk_size=None):
+        """Load one partition as a DataFrame with the columns renamed to the model field names.
+
+        The rows are streamed in chunks (see iter_frames) unless PARTITION_STREAMING_LOAD is off.
+        """
+        if not getattr(settings, 'PARTITION_STREAMING_LOAD', True):
+            columns, rows = DynamicTableLoader.load_data(year, arrondissement)
+            return pd.DataFrame(rows, columns=columns).rename(columns=COLUMN_RENAMES)
+        chunks = DynamicTableLoader.iter_frames(year, arrondissement, chunk_size=chunk_size)
+        return pd.concat(list(chunks), ignore_index=True)
+
+    @staticmethod
+    def table_version(year, arrondissement):
+        """Return a cheap stamp that changes whenever the partition table changes.
+
+        Uses the version table configured in PARTITION_VERSION_TABLE when there is one,
+        otherwise the highest django_index (read from the primary key index) and the insert,
+        update and delete counters of pg_stat_user_tables, without scanning the table. Backends
+        publish those counters shortly after committing, so an update or delete can take about a
+        second to change the stamp; appended rows change it at once through django_index.
+        """
+        table_name = DynamicTableLoader.table_name(year, arrondissement)
+        version_table = getattr(settings, 'PARTITION_VERSION_TABLE', None)
+
+        with connection.cursor() as cursor:
+            if version_table:
+                cursor.execute(f'SELECT version FROM "{version_table}" WHERE table_name = %s', [table_name])
+                row = cursor.fetchone()
+                return (row[0],) if row else None
+            table = quote_identifier(table_name)
+            cursor.execute(
+                f"SELECT (SELECT MAX(django_index) FROM {table}), n_tup_ins, n_tup_upd, n_tup_del "
+                f"FROM pg_stat_user_tables WHERE relid = to_regclass(%s)",
+                [table],
+            )
+            row = cursor.fetchone()
+            if row is None:
+                # Statistics not collected for this table
+                cursor.execute(f"SELECT MAX(django_index) FROM {table}")
+                row = cursor.fetchone()
+            return tuple(row)
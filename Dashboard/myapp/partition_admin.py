@@ -0,0 +1,157 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from .models import FIELD_COLUMNS, DynamicTableLoader, quote_identifier
+
+logger = logging.getLogger(__name__)
+
+# Indexes every cleaned_data partition should have: (name suffix, model fields). The first one
+# serves the dashboard's switch/quote filters ordered by date, and the snapshot's DISTINCT ON.
+PARTITION_INDEXES = [
+    ('ramses_quote_date', ['Ramses_id', 'Quote_name', 'Date_control']),
+    ('quote_date', ['Quote_name', 'Date_control']),
+    ('date', ['Date_control']),
+]
+
+# Constant columns added to the partitions attached to the partitioned parent table
+PARTITION_KEY_COLUMNS = ('partition_year', 'partition_arrondissement')
+
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def index_name(table_name, suffix, kind='idx'):
+    """Name of a partition index or constraint, shortened with a hash past PostgreSQL's identifier limit."""
+    name = f'{table_name}_{suffix}_{kind}'
+    if len(name.encode()) <= MAX_IDENTIFIER_LENGTH:
+        return name
+    digest = hashlib.md5(name.encode()).hexdigest()[:8]
+    return f'{table_name[:MAX_IDENTIFIER_LENGTH - len(suffix) - len(kind) - 12]}_{suffix}_{digest}_{kind}'
+
+
+def _index_columns(fields):
+    return ", ".join(quote_identifier(FIELD_COLUMNS.get(field, field)) for field in fields)
+
+
+def _table_indexes(table_name):
+    # {index name: valid} of one table; CREATE INDEX CONCURRENTLY leaves invalid indexes behind when it fails
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT index_class.relname, pg_index.indisvalid FROM pg_index "
+            "JOIN pg_class AS index_class ON index_class.oid = pg_index.indexrelid "
+            "JOIN pg_class AS table_class ON table_class.oid = pg_index.indrelid "
+            "WHERE table_class.relname = %s AND table_class.relnamespace = current_schema()::regnamespace",
+            [table_name],
+        )
+        return dict(cursor.fetchall())
+
+
+def check_indexes(year, arrondissement):
+    """Return (index name, fields, status) for every PARTITION_INDEXES entry of one partition.
+
+    The status is 'ok', 'missing' or 'invalid'.
+    """
+    table_name = DynamicTableLoader.table_name(year, arrondissement)
+    existing = _table_indexes(table_name)
+    report = []
+    for suffix, fields in PARTITION_INDEXES:
+        name = index_name(table_name, suffix)
+        status = 'missing' if name not in existing else ('ok' if existing[name] else 'invalid')
+        report.append((name, fields, status))
+    return report
+
+
+def create_indexes(year, arrondissement, concurrently=True):
+    """Create the missing PARTITION_INDEXES of one partition and rebuild invalid ones.
+
+    With `concurrently`, the indexes are built without blocking writes to the table; this
+    needs autocommit, so it must not run inside a transaction. Returns the created index names.
+    """
+    table_name = DynamicTableLoader.table_name(year, arrondissement)
+    option = " CONCURRENTLY" if concurrently else ""
+    created = []
+
+    with connection.cursor() as cursor:
+        for name, fields, status in check_indexes(year, arrondissement):
+            if status == 'ok':
+                continue
+            if status == 'invalid':
+                cursor.execute(f"DROP INDEX{option} IF EXISTS {quote_identifier(name)}")
+            cursor.execute(
+                f"CREATE INDEX{option} IF NOT EXISTS {quote_identifier(name)} "
+                f"ON {quote_identifier(table_name)} ({_index_columns(fields)})"
+            )
+            created.append(name)
+            logger.info("Created index %s on %s", name, table_name)
+        if created:
+            cursor.execute(f"ANALYZE {quote_identifier(table_name)}")
+    return created
+
+
+def parent_table():
+    return getattr(settings, 'PARTITION_PARENT_TABLE', 'cleaned_data')
+
+
+def attached_partitions():
+    """Return the names of the tables currently attached to the partitioned parent table."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s AND parent.relnamespace = current_schema()::regnamespace",
+            [parent_table()],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _ensure_parent(template_table):
+    # The parent copies the columns of a partition, partition key columns included
+    parent = quote_identifier(parent_table())
+    key = ", ".join(quote_identifier(column) for column in PARTITION_KEY_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {parent} (LIKE {quote_identifier(template_table)}) PARTITION BY RANGE ({key})"
+        )
+
+
+def attach_partition(year, arrondissement):
+    """Attach one partition to the parent table, range-partitioned on (year, arrondissement).
+
+    The partition gets constant partition_year/partition_arrondissement columns (a metadata-only
+    change) and a CHECK constraint matching its bounds, validated without blocking reads or
+    writes, so that ATTACH PARTITION itself does not scan the table under an exclusive lock. Queries on the parent filtering on those columns only read the matching partitions.
+    Returns False when the partition was already attached.
+    """
+    table_name = DynamicTableLoader.table_name(year, arrondissement)
+    if table_name in attached_partitions():
+        return False
+
+    year, arrondissement = int(float(year)), int(arrondissement)
+    table = quote_identifier(table_name)
+    year_column, arrondissement_column = (quote_identifier(column) for column in PARTITION_KEY_COLUMNS)
+    check_name = quote_identifier(index_name(table_name, 'partition_key', kind='check'))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {table} "
+            f"ADD COLUMN IF NOT EXISTS {year_column} integer NOT NULL DEFAULT {year}, "
+            f"ADD COLUMN IF NOT EXISTS {arrondissement_column} integer NOT NULL DEFAULT {arrondissement}"
+        )
+        cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check_name}")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {check_name} "
+            f"CHECK ({year_column} = {year} AND {arrondissement_column} = {arrondissement}) NOT VALID"
+        )
+        cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check_name}")
+
+    _ensure_parent(table_name)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {quote_identifier(parent_table())} ATTACH PARTITION {table} "
+            f"FOR VALUES FROM ({year}, {arrondissement}) TO ({year}, {arrondissement + 1})"
+        )
+    logger.info("Attached %s to %s", table_name, parent_table())
+    return True
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .dtypes import load_compact_frame
+from .models import DynamicTableLoader
+from .singleflight import singleflight
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionCache:
+    """Process-wide LRU cache of renamed partition DataFrames, bounded by a byte budget.
+
+    Entries are keyed by (year, arrondissement) and stored with compact dtypes (see
+    dtypes.load_compact_frame). Every entry remembers the version stamp of its table (see
+    DynamicTableLoader.table_version) and is reloaded when that stamp changes. The stamp is
+    rechecked at most once every `version_ttl` seconds per partition. Concurrent misses on the
+    same partition are coalesced into one load (see singleflight).
+    """
+
+    def __init__(self, max_bytes, version_ttl=30):
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        self._entries = OrderedDict()  # key -> [version, df, nbytes, checked_at]
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(year, arrondissement):
+        return (str(year), str(arrondissement))
+
+    def get(self, year, arrondissement):
+        """Return the DataFrame of a partition, loading it on a miss. Callers must not mutate it."""
+        key = self.make_key(year, arrondissement)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[3] < self.version_ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        version = DynamicTableLoader.table_version(year, arrondissement)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    entry[3] = now
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+                self.invalidations += 1
+            self.misses += 1
+
+        # Concurrent misses on the same partition version share one load, across workers too
+        df = singleflight.do(('partition', *key, version),
+                             lambda: load_compact_frame(year, arrondissement), shared=True)
+        self.put(key, version, df)
+        return df
+
+    def put(self, key, version, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            logger.warning("Partition %s (%d bytes) exceeds the cache budget, not caching it", key, nbytes)
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = [version, df, nbytes, time.monotonic()]
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                evicted_key, _ = next(iter(self._entries.items()))
+                self._remove(evicted_key)
+                self.evictions += 1
+                logger.debug("Evicted partition %s from the cache", evicted_key)
+
+    def invalidate(self, year=None, arrondissement=None):
+        """Drop one partition, or every cached partition when called without arguments."""
+        with self._lock:
+            if year is None and arrondissement is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self.current_bytes = 0
+                return
+            key = self.make_key(year, arrondissement)
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+partition_cache = PartitionCache(
+    max_bytes=getattr(settings, 'PARTITION_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+    version_ttl=getattr(settings, 'PARTITION_CACHE_VERSION_TTL', 30),
+)
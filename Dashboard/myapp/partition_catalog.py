@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .models import PARTITION_TABLE_PATTERN, DynamicTableLoader
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionCatalog:
+    """Process-wide catalog of the cleaned_data partition tables, read from pg_class.
+
+    Every table is listed with its (year, arrondissement), a row estimate (pg_class.reltuples,
+    None until the table has been analyzed) and its size on disk. The catalog is reloaded when
+    it is older than `ttl` seconds, so selections, dropdowns and loaders share one cheap query.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._tables = {}  # table name -> {'year', 'arrondissement', 'rows', 'bytes', 'empty'}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def tables(self):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._tables = self._load()
+                self._loaded_at = time.monotonic()
+            return self._tables
+
+    def refresh(self):
+        """Reload the catalog on the next access."""
+        with self._lock:
+            self._loaded_at = None
+
+    @staticmethod
+    def _load():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname, reltuples, pg_relation_size(oid), pg_total_relation_size(oid) FROM pg_class "
+                "WHERE relnamespace = current_schema()::regnamespace AND relkind = 'r' AND relname LIKE %s",
+                ['cleaned\\_data\\_%'],
+            )
+            rows = cursor.fetchall()
+
+        tables = {}
+        for name, reltuples, data_bytes, total_bytes in rows:
+            match = PARTITION_TABLE_PATTERN.match(name)
+            if not match:
+                continue
+            tables[name] = {
+                'year': int(match.group(1)),
+                'arrondissement': int(match.group(2)),
+                # reltuples is -1 (0 before PostgreSQL 14) until the first VACUUM or ANALYZE
+                'rows': int(reltuples) if reltuples > 0 or (reltuples == 0 and data_bytes == 0) else None,
+                'bytes': int(total_bytes),
+                'empty': data_bytes == 0,
+            }
+        logger.debug("Partition catalog loaded: %d tables", len(tables))
+        return tables
+
+    def years(self):
+        return sorted({table['year'] for table in self.tables().values() if not table['empty']})
+
+    def arrondissements(self, years=None):
+        """Arrondissements with a non-empty partition, in any of `years` when given."""
+        years = {int(float(year)) for year in years} if years else None
+        return sorted({
+            table['arrondissement'] for table in self.tables().values()
+            if not table['empty'] and (years is None or table['year'] in years)
+        })
+
+    def select(self, years, arrondissements):
+        """Return the selected (year, arrondissement) combinations that have a non-empty table.
+
+        Combinations keep the caller's values and order. Returns (partitions, missing, empty),
+        the last two being the table names that were skipped.
+        """
+        tables = self.tables()
+        partitions, missing, empty = [], [], []
+        for year in years or []:
+            for arrondissement in arrondissements or []:
+                name = DynamicTableLoader.table_name(year, arrondissement)
+                if name not in tables:
+                    missing.append(name)
+                elif tables[name]['empty']:
+                    empty.append(name)
+                else:
+                    partitions.append((year, arrondissement))
+        return partitions, missing, empty
+
+    def estimate(self, years, arrondissements):
+        """Estimated rows and bytes of a selection; rows of tables never analyzed are counted as unknown."""
+        tables = self.tables()
+        partitions, _, _ = self.select(years, arrondissements)
+        names = [DynamicTableLoader.table_name(year, arrondissement) for year, arrondissement in partitions]
+        return {
+            'partitions': len(names),
+            'rows': sum(tables[name]['rows'] or 0 for name in names),
+            'unknown_rows': sum(1 for name in names if tables[name]['rows'] is None),
+            'bytes': sum(tables[name]['bytes'] for name in names),
+        }
+
+    def selection_warning(self, years, arrondissements):
+        """Return a warning when a selection skips tables or exceeds PARTITION_ROW_WARNING rows, else None."""
+        partitions, missing, empty = self.select(years, arrondissements)
+        messages = []
+        if missing or empty:
+            messages.append(f"{len(missing) + len(empty)} of the selected year/arrondissement combinations "
+                            f"have no data and will be skipped.")
+        estimate = self.estimate(years, arrondissements)
+        limit = getattr(settings, 'PARTITION_ROW_WARNING', 2000000)
+        if estimate['rows'] > limit:
+            messages.append(f"This selection covers about {estimate['rows']:,} rows in {estimate['partitions']} "
+                            f"tables ({estimate['bytes'] / 2**20:,.0f} MB); loading it may be slow.")
+        return " ".join(messages) or None
+
+
+partition_catalog = PartitionCatalog(ttl=getattr(settings, 'PARTITION_CATALOG_TTL', 300))
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections
+
+from .models import COLUMN_RENAMES, PARTITION_TABLE_PATTERN, DynamicTableLoader, build_order_by
+from . import partition_mirror
+from .dtypes import concat_frames, normalize_frame
+from .partition_cache import partition_cache
+from .partition_catalog import partition_catalog
+
+logger = logging.getLogger(__name__)
+
+FETCH_MODES = ('sequential', 'union', 'parallel')
+
+BACKENDS = ('postgres', 'mirror')
+
+# Every worker thread runs its queries on its own Django connection, so the executor also bounds
+# the number of connections open at once
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PARTITION_FETCH_WORKERS', 8),
+    thread_name_prefix='partition-fetch',
+)
+
+# Separate bounded pool for the async views, so that concurrent requests cannot exhaust the connections
+_async_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_DB_WORKERS', 16),
+    thread_name_prefix='async-db',
+)
+
+
+def existing_partitions(years, arrondissements):
+    """Return the (year, arrondissement) combinations that have a non-empty partition table, in selection order.
+
+    Tables are looked up in the partition catalog, so missing or empty ones cost no query.
+    """
+    partitions, missing, empty = partition_catalog.select(years, arrondissements)
+    if missing:
+        logger.info("Skipping missing partitions: %s", ", ".join(missing))
+    if empty:
+        logger.info("Skipping empty partitions: %s", ", ".join(empty))
+    return partitions
+
+
+def all_partitions():
+    """Return (year, arrondissement) of every cleaned_data partition table, sorted."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_schema = current_schema() AND table_name LIKE %s",
+            ['cleaned\\_data\\_%'],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_TABLE_PATTERN.match(name)
+        if match:
+            partitions.append((int(match.group(1)), int(match.group(2))))
+    return sorted(partitions)
+
+
+def _in_worker(func, *args, **kwargs):
+    # Worker threads outlive requests: a task's connections are closed when it ends, not left to the thread
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def build_union_query(partitions, order_by=None, limit=None, **filters):
+    """Build one UNION ALL query over several partitions, ordered and limited as a whole."""
+    parts = []
+    params = []
+    for year, arrondissement in partitions:
+        query, part_params = DynamicTableLoader.build_query(year, arrondissement, **filters)
+        parts.append(f"({query})")
+        params.extend(part_params)
+
+    query = " UNION ALL ".join(parts)
+    if order_by or limit is not None:
+        order = build_order_by(order_by, aliased=bool(filters.get('columns')))
+        query = f"SELECT * FROM ({query}) AS partitions{order}"
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(int(limit))
+    return query, params
+
+
+def _fetch_union(partitions, **filters):
+    query, params = build_union_query(partitions, **filters)
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        columns = [col[0] for col in cursor.description]
+        rows = cursor.fetchall()
+    return pd.DataFrame(rows, columns=columns).rename(columns=COLUMN_RENAMES)
+
+
+def _apply_order_and_limit(df, order_by=None, limit=None):
+    # Per-partition results are each ordered and limited; redo both on the combined frame
+    if order_by and not df.empty:
+        df = df.sort_values(
+            by=[field.lstrip('-') for field in order_by],
+            ascending=[not field.startswith('-') for field in order_by],
+            kind='mergesort',
+        ).reset_index(drop=True)
+    if limit is not None:
+        df = df.head(int(limit))
+    return df
+
+
+def fetch_partitions(years, arrondissements, mode=None, use_cache=True, backend=None, **filters):
+    """Load several year × arrondissement partitions as one renamed DataFrame.
+
+    Missing partitions are skipped. With the 'mirror' backend, partitions synced to the local
+    Arrow mirror (see partition_mirror) are read from their memory-mapped files and only the
+    other ones go to PostgreSQL. The default backend comes from the PARTITION_BACKEND setting.
+
+    Without filters and with `use_cache`, whole partitions are taken from the partition cache,
+    concurrently for the ones that have to be loaded. Otherwise `mode` picks how the partition
+    queries run:
+
+    - 'sequential': one query per partition on the calling thread,
+    - 'union': a single UNION ALL query,
+    - 'parallel': one query per partition on the bounded worker pool.
+
+    The default mode comes from the PARTITION_FETCH_MODE setting.
+    """
+    mode = mode or getattr(settings, 'PARTITION_FETCH_MODE', 'union')
+    if mode not in FETCH_MODES:
+        raise ValueError(f"Unknown fetch mode {mode!r}, expected one of {FETCH_MODES}")
+    backend = backend or getattr(settings, 'PARTITION_BACKEND', 'postgres')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown partition backend {backend!r}, expected one of {BACKENDS}")
+
+    filters = {key: value for key, value in filters.items() if value is not None and value != [] and value != ''}
+
+    if backend == 'mirror':
+        wanted = [(year, arrondissement) for year in years or [] for arrondissement in arrondissements or []]
+        mirrored = [partition for partition in wanted if partition_mirror.is_mirrored(*partition)]
+        remaining = [partition for partition in wanted if partition not in mirrored]
+        if mirrored:
+            order_by = filters.pop('order_by', None)
+            limit = filters.pop('limit', None)
+            # Per-partition order and limit keep each result small; both are redone on the combined frame
+            frames = [partition_mirror.read_partition(year, arrondissement, order_by=order_by, limit=limit, **filters)
+                      for year, arrondissement in mirrored]
+            if remaining:
+                database = _fetch_database(
+                    [partition for partition in existing_partitions(years, arrondissements) if partition in remaining],
+                    mode, use_cache, filters)
+                # Rows queried from the database are plain objects; give them the dtypes of the mirror frames
+                frames.append(database if use_cache and not filters else normalize_frame(database))
+            return _apply_order_and_limit(concat_frames(frames), order_by, limit)
+
+    return _fetch_database(existing_partitions(years, arrondissements), mode, use_cache, filters)
+
+
+def _fetch_database(partitions, mode, use_cache, filters):
+    if not partitions:
+        return pd.DataFrame()
+
+    if use_cache and not filters:
+        if mode == 'sequential' or len(partitions) == 1:
+            frames = [partition_cache.get(year, arrondissement) for year, arrondissement in partitions]
+        else:
+            frames = list(_executor.map(lambda partition: _in_worker(partition_cache.get, *partition), partitions))
+        return concat_frames(frames)
+
+    if mode == 'union':
+        return _fetch_union(partitions, **filters)
+
+    order_by = filters.get('order_by')
+    limit = filters.get('limit')
+    if mode == 'parallel' and len(partitions) > 1:
+        frames = list(_executor.map(
+            lambda partition: _in_worker(DynamicTableLoader.query, *partition, **filters), partitions))
+    else:
+        frames = [DynamicTableLoader.query(year, arrondissement, **filters) for year, arrondissement in partitions]
+    return _apply_order_and_limit(pd.concat(frames, ignore_index=True), order_by, limit)
+
+
+def run_in_db_thread(func, *args, **kwargs):
+    """Await a blocking database call on the bounded async pool, with its own connection."""
+    return sync_to_async(_in_worker, thread_sensitive=False, executor=_async_executor)(func, *args, **kwargs)
+
+
+async def fetch_partitions_async(years, arrondissements, use_cache=True, backend=None, **filters):
+    """Async counterpart of fetch_partitions for the ASGI views.
+
+    One task per partition runs on the bounded async pool, so the partition queries of a request
+    run concurrently and the event loop keeps serving other requests meanwhile. Whole partitions
+    come from the partition cache, filtered ones are queried per partition and the combined frame
+    is ordered and limited like fetch_partitions does.
+    """
+    backend = backend or getattr(settings, 'PARTITION_BACKEND', 'postgres')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown partition backend {backend!r}, expected one of {BACKENDS}")
+
+    filters = {key: value for key, value in filters.items() if value is not None and value != [] and value != ''}
+    order_by = filters.pop('order_by', None)
+    limit = filters.pop('limit', None)
+    partitions = await run_in_db_thread(existing_partitions, years, arrondissements)
+
+    def load(year, arrondissement):
+        # Per-partition order and limit keep each result small; both are redone on the combined frame
+        if backend == 'mirror' and partition_mirror.is_mirrored(year, arrondissement):
+            return partition_mirror.read_partition(year, arrondissement, order_by=order_by, limit=limit, **filters)
+        if use_cache and not filters:
+            return partition_cache.get(year, arrondissement)
+        frame = DynamicTableLoader.query(year, arrondissement, order_by=order_by, limit=limit, **filters)
+        # Combined with mirror frames, which have compact dtypes
+        return normalize_frame(frame) if backend == 'mirror' else frame
+
+    frames = await asyncio.gather(*(run_in_db_thread(load, *partition) for partition in partitions))
+    if not frames:
+        return pd.DataFrame()
+    return _apply_order_and_limit(concat_frames(frames), order_by, limit)
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection
+
+from .dtypes import normalize_frame
+from .models import COLUMN_RENAMES, PARTITION_TABLE_PATTERN, DynamicTableLoader, iter_cursor_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # The mirror backend is optional
+    pa = None
+    pc = None
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality text columns stored dictionary-encoded in the mirror files
+DICTIONARY_COLUMNS = ['Ramses_id', 'Quote_name', 'Quote_name_general', 'Quote_category', 'Quote_State']
+
+# Mirror rows are sorted on these fields, so that record batches cover narrow Ramses_id ranges
+MIRROR_ORDER = ['Ramses_id', 'Quote_name', 'Date_control']
+
+
+def mirror_dir():
+    return str(getattr(settings, 'PARTITION_MIRROR_DIR', settings.BASE_DIR / 'partition_mirror'))
+
+
+def mirror_paths(year, arrondissement):
+    """Return the Arrow IPC file and JSON manifest paths of one partition."""
+    base = os.path.join(mirror_dir(), DynamicTableLoader.table_name(year, arrondissement))
+    return base + '.arrow', base + '.json'
+
+
+def read_manifest(year, arrondissement):
+    """Return the manifest of a mirrored partition, None when it has not been synced."""
+    data_path, manifest_path = mirror_paths(year, arrondissement)
+    if not os.path.exists(data_path) or not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def partition_version(year, arrondissement):
+    # DynamicTableLoader.table_version as recorded in the manifest (a JSON list of strings)
+    return [str(part) for part in DynamicTableLoader.table_version(year, arrondissement) or []]
+
+
+def is_mirrored(year, arrondissement):
+    """True when the partition's mirror was synced at its current version stamp; stale ones are not read."""
+    if pa is None:
+        return False
+    manifest = read_manifest(year, arrondissement)
+    return manifest is not None and manifest['version'] == partition_version(year, arrondissement)
+
+
+def _arrow_type(type_code):
+    # PostgreSQL type OIDs of the cursor description; anything else is mirrored as text
+    if type_code in (20, 21, 23):
+        return pa.int64()
+    if type_code in (700, 701):
+        return pa.float64()
+    if type_code == 16:
+        return pa.bool_()
+    if type_code == 1082:
+        return pa.date32()
+    if type_code == 1114:
+        return pa.timestamp('us')
+    if type_code == 1184:
+        return pa.timestamp('us', tz='UTC')
+    return None
+
+
+def _chunk_table(columns, types, rows):
+    arrays = []
+    for values, arrow_type in zip(zip(*rows) if rows else [[]] * len(columns), types):
+        if arrow_type is None:
+            arrays.append(pa.array([None if value is None else str(value) for value in values], type=pa.string()))
+        else:
+            arrays.append(pa.array(values, type=arrow_type))
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def _describe(year, arrondissement):
+    # Column names and type codes of a partition, without reading any row
+    query, params = DynamicTableLoader.build_query(year, arrondissement, limit=0)
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        return [col[0] for col in cursor.description], [col[1] for col in cursor.description]
+
+
+def sync_partition(year, arrondissement, force=False, batch_rows=None):
+    """Mirror one partition table into an Arrow IPC file; return True when it was rewritten.
+
+    The partition is skipped when its version stamp (DynamicTableLoader.table_version) matches
+    the one recorded in the manifest. Rows are read on a server-side cursor, sorted by
+    MIRROR_ORDER and written in record batches of `batch_rows` rows, whose Ramses_id ranges
+    go to the manifest for batch pruning at read time.
+    """
+    if pa is None:
+        raise RuntimeError("The partition mirror requires pyarrow")
+
+    version = partition_version(year, arrondissement)
+    manifest = read_manifest(year, arrondissement)
+    if not force and manifest is not None and manifest['version'] == version:
+        return False
+
+    batch_rows = batch_rows or getattr(settings, 'PARTITION_MIRROR_BATCH_ROWS', 65536)
+    raw_columns, type_codes = _describe(year, arrondissement)
+    columns = [COLUMN_RENAMES.get(column, column) for column in raw_columns]
+    types = [_arrow_type(type_code) for type_code in type_codes]
+
+    query, params = DynamicTableLoader.build_query(year, arrondissement, order_by=MIRROR_ORDER)
+    chunks = [_chunk_table(columns, types, rows) for _, rows in iter_cursor_chunks(query, params)]
+    table = pa.concat_tables(chunks) if chunks else _chunk_table(columns, types, [])
+
+    for name in DICTIONARY_COLUMNS:
+        if name in table.column_names:
+            index = table.column_names.index(name)
+            table = table.set_column(index, name, pc.dictionary_encode(table.column(name).cast(pa.string())))
+    # The IPC file format needs one dictionary per column for the whole file
+    table = table.unify_dictionaries().combine_chunks()
+
+    batches = table.to_batches(max_chunksize=batch_rows)
+    ramses_ranges = []
+    for batch in batches:
+        if 'Ramses_id' in batch.schema.names:
+            bounds = pc.min_max(_decoded(batch.column('Ramses_id')))
+            ramses_ranges.append([bounds['min'].as_py(), bounds['max'].as_py()])
+        else:
+            ramses_ranges.append([None, None])
+
+    data_path, manifest_path = mirror_paths(year, arrondissement)
+    os.makedirs(mirror_dir(), exist_ok=True)
+    with pa.OSFile(data_path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    os.replace(data_path + '.tmp', data_path)
+
+    manifest = {
+        'table_name': DynamicTableLoader.table_name(year, arrondissement),
+        'version': version,
+        'rows': table.num_rows,
+        'columns': table.column_names,
+        'batches': ramses_ranges,
+        'synced_at': datetime.now(timezone.utc).isoformat(),
+    }
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    logger.info("Mirrored %s: %d rows in %d batches", manifest['table_name'], table.num_rows, len(batches))
+    return True
+
+
+def remove_partition(year, arrondissement):
+    for path in mirror_paths(year, arrondissement):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def mirrored_partitions():
+    """Return (year, arrondissement) of every partition present in the mirror directory."""
+    if not os.path.isdir(mirror_dir()):
+        return []
+    partitions = []
+    for name in os.listdir(mirror_dir()):
+        match = PARTITION_TABLE_PATTERN.match(name[:-len('.json')]) if name.endswith('.json') else None
+        if match:
+            partitions.append((int(match.group(1)), int(match.group(2))))
+    return sorted(partitions)
+
+
+def _decoded(array):
+    return array.dictionary_decode() if pa.types.is_dictionary(array.type) else array
+
+
+def _values(values):
+    if values is None or (isinstance(values, (list, tuple, set)) and not values):
+        return None
+    return [str(value) for value in values] if isinstance(values, (list, tuple, set)) else [str(values)]
+
+
+def _timestamp(value, arrow_type):
+    # Naive filter dates are UTC, like the database session of a USE_TZ project
+    value = pd.Timestamp(value)
+    if getattr(arrow_type, 'tz', None):
+        value = value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+    elif value.tzinfo is not None:
+        value = value.tz_convert('UTC').tz_localize(None)
+    return pa.scalar(value.to_pydatetime(), type=arrow_type)
+
+
+def _batch_mask(batch, ramses_ids, quote_names, start_date, end_date):
+    mask = None
+    conditions = []
+    if ramses_ids is not None:
+        conditions.append(pc.is_in(_decoded(batch.column('Ramses_id')), value_set=pa.array(ramses_ids)))
+    if quote_names is not None:
+        conditions.append(pc.is_in(_decoded(batch.column('Quote_name')), value_set=pa.array(quote_names)))
+    if start_date or end_date:
+        dates = batch.column('Date_control')
+        if start_date:
+            conditions.append(pc.greater_equal(dates, _timestamp(start_date, dates.type)))
+        if end_date:
+            conditions.append(pc.less_equal(dates, _timestamp(end_date, dates.type)))
+    for condition in conditions:
+        mask = condition if mask is None else pc.and_kleene(mask, condition)
+    return mask
+
+
+def read_partition(year, arrondissement, columns=None, ramses_ids=None, quote_names=None,
+                   start_date=None, end_date=None, order_by=None, limit=None, row_key=False):
+    """Read one mirrored partition as a renamed DataFrame; takes the arguments of DynamicTableLoader.query.
+
+    The file is memory-mapped: only the record batches whose Ramses_id range can match and
+    only the requested columns are paged in, and the filters run on Arrow arrays before
+    anything is converted to pandas. The frame gets the compact dtypes of cached partitions
+    (see dtypes.normalize_frame). With `row_key`, a leading row_key column is built from django_index like build_query does.
+    """
+    manifest = read_manifest(year, arrondissement)
+    if manifest is None:
+        raise FileNotFoundError(f"Partition {year}/{arrondissement} is not mirrored")
+
+    ramses_ids = _values(ramses_ids)
+    quote_names = _values(quote_names)
+    wanted = set(ramses_ids) if ramses_ids is not None else None
+    selected = list(columns) if columns else manifest['columns']
+    sort_fields = [field.lstrip('-') for field in order_by or []]
+    read = list(dict.fromkeys(selected + sort_fields + (['django_index'] if row_key else [])))
+    data_path, _ = mirror_paths(year, arrondissement)
+
+    batches = []
+    with pa.memory_map(data_path, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for index, (low, high) in enumerate(manifest['batches']):
+            if wanted is not None and low is not None and not any(low <= value <= high for value in wanted):
+                continue
+            batch = reader.get_batch(index)
+            mask = _batch_mask(batch, ramses_ids, quote_names, start_date, end_date)
+            batch = batch.select(read)
+            batches.append(batch.filter(mask) if mask is not None else batch)
+
+        schema = pa.schema([reader.schema.field(name) for name in read])
+        table = pa.Table.from_batches(batches, schema=schema)
+        if order_by:
+            # Sorted on the decoded values, so dictionary columns sort like text in PostgreSQL
+            keys = pa.table({name: _decoded(table.column(name).combine_chunks()) for name in sort_fields})
+            table = table.take(pc.sort_indices(keys, sort_keys=[
+                (field.lstrip('-'), 'descending' if field.startswith('-') else 'ascending') for field in order_by]))
+        if limit is not None:
+            table = table.slice(0, int(limit))
+        df = table.to_pandas()
+
+    if row_key:
+        prefix = DynamicTableLoader.row_key_prefix(year, arrondissement)
+        df = df.assign(row_key=prefix + df['django_index'].astype(str))
+        selected = ['row_key'] + selected
+    return normalize_frame(df[selected], label=manifest.get('table_name'))
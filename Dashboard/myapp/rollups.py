@@ -0,0 +1,146 @@
+import json
+import logging
+
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from .control_schedule import switch_controls
+from .degradation import degradation_rates
+from .gauges import BANDS, LIMIT_COLUMNS, classify_frame
+from .models import (PARTITION_TABLE_PATTERN, FleetRollup, QuoteDegradation, RollupWatermark,
+                     SnapshotWatermark)
+from .partition_fetch import fetch_partitions
+from .snapshot import refresh_snapshot, snapshot_frame
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEYS = ['arrondissement', 'Ligne', 'Poste']
+
+# Partition columns read to compute degradation rates
+HISTORY_COLUMNS = ['Ramses_id', 'Quote_name', 'Quote_measured_value', 'Date_control']
+
+ROLLUP_SNAPSHOT_FIELDS = ['Ramses_id', 'Quote_name', 'Quote_name_general', 'Quote_measured_value'] + LIMIT_COLUMNS + [
+    'Date_control', 'Date_last_control', 'Périodicité', 'Ligne', 'Poste', 'arrondissement']
+
+
+def _arrondissement_versions():
+    # {arrondissement: version}, from the watermarks the snapshot refresh keeps for every partition
+    partitions = {}
+    for table_name, version in SnapshotWatermark.objects.values_list('table_name', 'version'):
+        match = PARTITION_TABLE_PATTERN.match(table_name)
+        if match:
+            partitions.setdefault(int(match.group(2)), []).append((int(match.group(1)), table_name, version))
+    return {arrondissement: json.dumps(sorted(tables)) for arrondissement, tables in partitions.items()}
+
+
+def refresh_degradation(arrondissement, years):
+    """Recompute the degradation rates of one arrondissement over the given years; returns the quote count."""
+    history = fetch_partitions(years, [arrondissement], columns=HISTORY_COLUMNS)
+    rates = degradation_rates(history if not history.empty else pd.DataFrame(columns=HISTORY_COLUMNS))
+    # degradation_rates returns naive UTC dates
+    last_controls = pd.to_datetime(rates['last_control']).dt.tz_localize('UTC')
+    rows = [
+        QuoteDegradation(
+            Ramses_id=rate.Ramses_id, Quote_name=rate.Quote_name, arrondissement=arrondissement,
+            measurements=int(rate.measurements),
+            last_control=None if pd.isna(last_control) else last_control.to_pydatetime(),
+            slope_total=float(rate.slope_total), slope_last_two=float(rate.slope_last_two),
+        )
+        for rate, last_control in zip(rates.itertuples(index=False), last_controls)
+    ]
+    with transaction.atomic():
+        QuoteDegradation.objects.filter(arrondissement=arrondissement).delete()
+        # A quote moved to another arrondissement keeps a single row
+        QuoteDegradation.objects.filter(Ramses_id__in=rates['Ramses_id'].unique().tolist()).delete()
+        QuoteDegradation.objects.bulk_create(rows, batch_size=5000)
+    return len(rows)
+
+
+def rollup_frame(now=None):
+    """Compute the fleet rollup rows from the snapshot and the stored degradation rates."""
+    now = now or timezone.now()
+    latest = snapshot_frame(fields=ROLLUP_SNAPSHOT_FIELDS)
+    if latest.empty:
+        return pd.DataFrame(columns=ROLLUP_KEYS)
+    latest[['Ligne', 'Poste']] = latest[['Ligne', 'Poste']].fillna('')
+
+    # Band index of each quote's latest value, -1 without a value; a switch is in its worst band
+    bands = classify_frame(latest)['band']
+    latest['band_rank'] = pd.Categorical(bands, categories=BANDS, ordered=True).codes
+    switches = switch_controls(latest)
+    grouped = latest.groupby('Ramses_id', sort=False)
+    switches['quotes'] = grouped.size()
+    switches['band_rank'] = grouped['band_rank'].max()
+    switches['overdue'] = (switches['due_date'] < now).to_numpy()
+    for rank, band in enumerate(BANDS):
+        switches[band] = switches['band_rank'] == rank
+
+    rollup = switches.groupby(ROLLUP_KEYS, sort=True).agg(
+        switches=('quotes', 'size'),
+        quotes=('quotes', 'sum'),
+        overdue=('overdue', 'sum'),
+        **{band: (band, 'sum') for band in BANDS},
+    )
+
+    # Median absolute monthly degradation over the quotes of each group
+    rates = pd.DataFrame.from_records(QuoteDegradation.objects.values_list('Ramses_id', 'slope_total'),
+                                      columns=['Ramses_id', 'slope_total'])
+    rates = rates.join(switches[ROLLUP_KEYS], on='Ramses_id', how='inner')
+    rollup['median_degradation'] = rates['slope_total'].abs().groupby(
+        [rates[key] for key in ROLLUP_KEYS]).median().reindex(rollup.index)
+    return rollup.reset_index()
+
+
+def refresh_rollups(full=False):
+    """Bring the fleet overview up to date; returns the number of arrondissements whose rates were recomputed.
+
+    The latest-measurement snapshot is refreshed first. Degradation rates are then recomputed
+    only for the arrondissements with a changed partition (all of them with `full`), and the
+    rollup rows are rebuilt from the snapshot, which also moves overdue controls forward in time.
+    """
+    refresh_snapshot()
+
+    versions = _arrondissement_versions()
+    stored = dict(RollupWatermark.objects.values_list('arrondissement', 'version'))
+    changed = [arrondissement for arrondissement, version in sorted(versions.items())
+               if full or stored.get(arrondissement) != version]
+    for arrondissement in changed:
+        years = [year for year, *_ in json.loads(versions[arrondissement])]
+        quotes = refresh_degradation(arrondissement, years)
+        RollupWatermark.objects.update_or_create(arrondissement=arrondissement,
+                                                 defaults={'version': versions[arrondissement]})
+        logger.info("Degradation rates of arrondissement %s recomputed: %d quotes", arrondissement, quotes)
+
+    removed = set(stored) - set(versions)
+    if removed:
+        QuoteDegradation.objects.filter(arrondissement__in=removed).delete()
+        RollupWatermark.objects.filter(arrondissement__in=removed).delete()
+
+    now = timezone.now()
+    rollup = rollup_frame(now)
+    rows = [
+        FleetRollup(
+            arrondissement=int(row.arrondissement), Ligne=row.Ligne, Poste=row.Poste,
+            switches=int(row.switches), quotes=int(row.quotes), overdue=int(row.overdue),
+            median_degradation=None if pd.isna(row.median_degradation) else float(row.median_degradation),
+            refreshed_at=now, **{band: int(getattr(row, band)) for band in BANDS},
+        )
+        for row in rollup.itertuples(index=False)
+    ]
+    with transaction.atomic():
+        FleetRollup.objects.all().delete()
+        FleetRollup.objects.bulk_create(rows, batch_size=5000)
+    logger.info("Fleet rollup rebuilt: %d rows", len(rows))
+    return len(changed)
+
+
+def fleet_overview(arrondissements=None):
+    """Rollup rows as dicts ordered by arrondissement, Ligne and Poste, with the network totals."""
+    queryset = FleetRollup.objects.order_by(*ROLLUP_KEYS)
+    if arrondissements:
+        queryset = queryset.filter(arrondissement__in=[int(arr) for arr in arrondissements])
+    rows = list(queryset.values())
+    totals = {column: sum(row[column] for row in rows)
+              for column in ['switches', 'quotes', 'overdue'] + BANDS}
+    return rows, totals
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Published instead of a result that cannot be shared (too large): the waiting workers load it themselves at once
+_TOO_LARGE = 'singleflight:too-large'
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent loads of the same key into one.
+
+    In a process, the first caller of `do` for a key runs the load and the callers arriving
+    while it runs wait for it and get the same result (or exception). With `shared=True` and a
+    cache alias, processes coordinate through a lock taken with cache.add: the process holding
+    it loads and publishes the result in the cache for `result_ttl` seconds, the others wait for
+    that result and only load themselves when it does not come (lock expired). A result larger
+    than `share_max_bytes` is not published; a marker tells the others to load it in parallel.
+    This needs a cache backend shared by the workers; keys of shared loads must identify the
+    data version, since their result is reused for `result_ttl` seconds.
+
+    Results are shared between callers, which must not mutate them.
+    """
+
+    def __init__(self, cache_alias=None, lock_timeout=300, result_ttl=60, poll_interval=0.2,
+                 share_max_bytes=64 * 1024 * 1024):
+        self.cache_alias = cache_alias
+        self.lock_timeout = lock_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.share_max_bytes = share_max_bytes
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    def do(self, key, func, shared=False):
+        """Return func(), running it once for all the concurrent callers with the same key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if shared and self.cache_alias:
+                call.result = self._load_shared(key, func)
+            else:
+                call.result = self._load(func)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _load(self, func):
+        with self._lock:
+            self.loads += 1
+        return func()
+
+    @staticmethod
+    def _cache_key(key, kind):
+        return f"singleflight:{kind}:{hashlib.md5(repr(key).encode()).hexdigest()}"
+
+    def _load_shared(self, key, func):
+        cache = caches[self.cache_alias]
+        lock_key, result_key = self._cache_key(key, 'lock'), self._cache_key(key, 'result')
+
+        deadline = time.monotonic() + self.lock_timeout
+        token = uuid.uuid4().hex
+        while True:
+            result = cache.get(result_key)
+            if isinstance(result, str) and result == _TOO_LARGE:
+                return self._load(func)
+            if result is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                return result
+            if cache.add(lock_key, token, self.lock_timeout):
+                break
+            if time.monotonic() >= deadline:
+                logger.warning("Gave up waiting for the shared load of %r, loading it here", key)
+                return self._load(func)
+            time.sleep(self.poll_interval)
+
+        try:
+            result = self._load(func)
+            self._publish(cache, result_key, key, result)
+            return result
+        finally:
+            # Only release our own lock; an expired one may have been taken by another worker
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def _publish(self, cache, result_key, key, result):
+        nbytes = result.memory_usage(deep=True).sum() if hasattr(result, 'memory_usage') else 0
+        if nbytes > self.share_max_bytes:
+            logger.info("Not sharing the result of %r (%d bytes) through the cache", key, nbytes)
+        else:
+            try:
+                cache.set(result_key, result, self.result_ttl)
+                return
+            except Exception as e:
+                logger.warning("Could not share the result of %r: %s", key, e)
+        # The load itself succeeded; release the waiting workers so they load on their own
+        try:
+            cache.set(result_key, _TOO_LARGE, self.result_ttl)
+        except Exception as e:
+            logger.warning("Could not release the workers waiting for %r: %s", key, e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'loads': self.loads,
+                'coalesced': self.coalesced,
+                'shared_hits': self.shared_hits,
+            }
+
+
+singleflight = SingleFlight(
+    cache_alias=getattr(settings, 'SINGLEFLIGHT_CACHE_ALIAS', None),
+    lock_timeout=getattr(settings, 'SINGLEFLIGHT_LOCK_TIMEOUT', 300),
+    result_ttl=getattr(settings, 'SINGLEFLIGHT_RESULT_TTL', 60),
+    share_max_bytes=getattr(settings, 'SINGLEFLIGHT_SHARE_MAX_BYTES', 64 * 1024 * 1024),
+)
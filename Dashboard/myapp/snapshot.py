@@ -0,0 +1,170 @@
+import json
+import logging
+
+import pandas as pd
+from django.db import connection, transaction
+
+from .models import FIELD_COLUMNS, DynamicTableLoader, LatestMeasurement, SnapshotWatermark, quote_identifier
+from .partition_fetch import all_partitions
+
+logger = logging.getLogger(__name__)
+
+# Fields copied from the partition tables into LatestMeasurement
+SNAPSHOT_FIELDS = ['Ramses_id', 'Quote_name', 'Quote_name_general', 'Quote_measured_value',
+                   'IAL_min', 'IAL_max', 'IL_min', 'IL_max', 'AL_min', 'AL_max',
+                   'Date_control', 'Date_last_control', 'Périodicité', 'Ligne', 'Poste']
+
+
+def _source(field):
+    return quote_identifier(FIELD_COLUMNS.get(field, field))
+
+
+def _upsert_query(table_name, after_index, keys=None):
+    """Build the INSERT ... ON CONFLICT merging the latest control per key of one partition.
+
+    Only rows above `after_index` are read (all rows when it is None), and only the given
+    (Ramses_id, Quote_name) `keys` when there are some. An existing snapshot row is replaced
+    only by a control that is at least as recent.
+    """
+    snapshot = quote_identifier(LatestMeasurement._meta.db_table)
+    target = ", ".join(quote_identifier(field) for field in SNAPSHOT_FIELDS)
+    source = ", ".join(
+        f"CAST({_source(field)} AS TEXT)" if field == 'Poste' else _source(field) for field in SNAPSHOT_FIELDS
+    )
+    updates = ", ".join(
+        f"{quote_identifier(field)} = EXCLUDED.{quote_identifier(field)}"
+        for field in SNAPSHOT_FIELDS[2:] + ['year', 'arrondissement', 'source_index', 'updated_at']
+    )
+    ramses, quote, date = _source('Ramses_id'), _source('Quote_name'), _source('Date_control')
+
+    conditions = [f"{_source('Quote_measured_value')} IS NOT NULL"]
+    params = []
+    if after_index is not None:
+        conditions.append("django_index > %s")
+        params.append(after_index)
+    if keys is not None:
+        conditions.append(f"(CAST({ramses} AS TEXT), CAST({quote} AS TEXT)) IN "
+                          f"(SELECT * FROM unnest(%s::text[], %s::text[]))")
+        params.extend([[ramses_id for ramses_id, _ in keys], [quote_name for _, quote_name in keys]])
+
+    query = (
+        f"INSERT INTO {snapshot} ({target}, year, arrondissement, source_index, updated_at) "
+        f"SELECT DISTINCT ON ({ramses}, {quote}) {source}, %s, %s, django_index, NOW() "
+        f"FROM {quote_identifier(table_name)} WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {ramses}, {quote}, {date} DESC NULLS LAST, django_index DESC "
+        f"ON CONFLICT ({quote_identifier('Ramses_id')}, {quote_identifier('Quote_name')}) DO UPDATE SET {updates} "
+        f"WHERE {snapshot}.{quote_identifier('Date_control')} IS NULL "
+        f"OR EXCLUDED.{quote_identifier('Date_control')} >= {snapshot}.{quote_identifier('Date_control')}"
+    )
+    return query, params
+
+
+def partition_stamp(year, arrondissement):
+    """DynamicTableLoader.table_version of a partition as stored in its watermark (a JSON list of strings)."""
+    version = DynamicTableLoader.table_version(year, arrondissement)
+    return json.dumps([str(part) for part in version or ()])
+
+
+def refresh_partition(year, arrondissement, full=False):
+    """Merge new controls of one partition into the snapshot; return the number of upserted rows.
+
+    The partition's watermark (table version and highest django_index) decides what to read:
+    nothing when the version is unchanged, only the rows above the watermark when rows were
+    only appended, the whole partition otherwise or with `full`. A whole-partition refresh
+    first removes the partition's snapshot rows, so that deleted controls disappear, and lets
+    the other partitions provide the keys this partition no longer has.
+    """
+    table_name = DynamicTableLoader.table_name(year, arrondissement)
+    stamp = partition_stamp(year, arrondissement)
+    watermark = SnapshotWatermark.objects.filter(table_name=table_name).first()
+
+    after_index = None
+    if watermark is not None and not full:
+        if watermark.version == stamp:
+            return 0
+        # (max django_index, inserted, updated, deleted): same updates and deletes means appends only
+        version, previous = json.loads(stamp), json.loads(watermark.version or '[]')
+        if watermark.max_index is not None and len(version) == 4 and version[2:] == previous[2:]:
+            after_index = watermark.max_index
+
+    query, params = _upsert_query(table_name, after_index)
+    with transaction.atomic():
+        removed = _remove_partition(year, arrondissement) if after_index is None and watermark is not None else []
+        with connection.cursor() as cursor:
+            cursor.execute(query, [year, arrondissement] + params)
+            upserted = cursor.rowcount
+            cursor.execute(f"SELECT MAX(django_index) FROM {quote_identifier(table_name)}")
+            max_index = cursor.fetchone()[0]
+        if removed:
+            upserted += _restore_keys(removed, exclude=(year, arrondissement))
+        SnapshotWatermark.objects.update_or_create(
+            table_name=table_name, defaults={'version': stamp, 'max_index': max_index})
+
+    logger.info("Snapshot refresh of %s: %d rows upserted (%s)", table_name, upserted,
+                'incremental' if after_index is not None else 'full scan')
+    return upserted
+
+
+def _remove_partition(year, arrondissement):
+    # Delete the snapshot rows read from one partition; returns their (Ramses_id, Quote_name) keys
+    snapshot = quote_identifier(LatestMeasurement._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {snapshot} WHERE year = %s AND arrondissement = %s "
+            f"RETURNING {quote_identifier('Ramses_id')}, {quote_identifier('Quote_name')}",
+            [year, arrondissement],
+        )
+        return cursor.fetchall()
+
+
+def _restore_keys(keys, exclude):
+    # Upsert the removed keys that the refreshed partition no longer has from the other partitions
+    snapshot = quote_identifier(LatestMeasurement._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT k.r, k.q FROM unnest(%s::text[], %s::text[]) AS k(r, q) WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {snapshot} s WHERE s.{quote_identifier('Ramses_id')} = k.r "
+            f"AND s.{quote_identifier('Quote_name')} = k.q)",
+            [[ramses_id for ramses_id, _ in keys], [quote_name for _, quote_name in keys]],
+        )
+        missing = cursor.fetchall()
+        restored = 0
+        for year, arrondissement in all_partitions() if missing else []:
+            if (year, arrondissement) == exclude:
+                continue
+            query, params = _upsert_query(DynamicTableLoader.table_name(year, arrondissement), None, keys=missing)
+            cursor.execute(query, [year, arrondissement] + params)
+            restored += cursor.rowcount
+    return restored
+
+
+def refresh_snapshot(partitions=None, full=False):
+    """Refresh the snapshot from the given (year, arrondissement) partitions, all of them by default.
+
+    A full refresh of every partition rebuilds the snapshot from empty in one transaction, so
+    readers keep seeing the previous snapshot until it commits. Returns the total number of
+    upserted rows.
+    """
+    if full and partitions is None:
+        with transaction.atomic():
+            LatestMeasurement.objects.all().delete()
+            SnapshotWatermark.objects.all().delete()
+            return sum(refresh_partition(year, arrondissement, full=True)
+                       for year, arrondissement in all_partitions())
+
+    partitions = all_partitions() if partitions is None else partitions
+    return sum(refresh_partition(year, arrondissement, full=full) for year, arrondissement in partitions)
+
+
+def latest_measurement(ramses_id, quote_name):
+    """Point lookup of the latest control of one switch quote, None when it is not in the snapshot."""
+    return LatestMeasurement.objects.filter(Ramses_id=ramses_id, Quote_name=quote_name).first()
+
+
+def snapshot_frame(arrondissements=None, fields=None):
+    """Load the snapshot, optionally for some arrondissements only, as a DataFrame."""
+    queryset = LatestMeasurement.objects.all()
+    if arrondissements:
+        queryset = queryset.filter(arrondissement__in=[int(arr) for arr in arrondissements])
+    fields = fields or SNAPSHOT_FIELDS + ['year', 'arrondissement', 'updated_at']
+    return pd.DataFrame.from_records(queryset.values_list(*fields), columns=fields)
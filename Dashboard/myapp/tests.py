@@ -1,3 +1,560 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock, skipIf
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.core.cache import caches
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import datatables, export, partition_fetch, partition_mirror
+from .analysis_cache import AnalysisCache
+from .dash_app import switch_store
+from .degradation import DAYS_PER_MONTH, degradation_rates
+from .downsampling import lttb_indices, reduce_trace
+from .dtypes import CATEGORY_MAX_RATIO, concat_frames, load_compact_frame, normalize_chunk, normalize_frame
+from .forecasting import FORECAST_COLUMNS, forecast_breaches
+from .gauges import LIMIT_COLUMNS, classify, classify_frame, gauge_steps
+from .ingest import INGESTED_COLUMNS, UNSOURCED_COLUMNS, _ensure_partition, _PartitionWriter, build_source_query
+from .models import COLUMN_RENAMES, PARTITION_COLUMNS, DynamicTableLoader, build_select_list
+from .partition_admin import PARTITION_KEY_COLUMNS
+from .partition_catalog import partition_catalog
+from .singleflight import SingleFlight
+from .snapshot import refresh_partition
+from .views import fetch_column_data_async
+
+
+class WorkerConnectionTests(SimpleTestCase):
+    def test_worker_closes_its_connections_after_each_task(self):
+        with mock.patch('myapp.partition_fetch.connections') as connections:
+            self.assertEqual(partition_fetch._executor.submit(partition_fetch._in_worker, len, 'abc').result(), 3)
+            with self.assertRaises(ZeroDivisionError):
+                partition_fetch._executor.submit(partition_fetch._in_worker, divmod, 1, 0).result()
+        self.assertEqual(connections.close_all.call_count, 2)
+
+
+class DatatablePageTests(SimpleTestCase):
+    def page(self, version, **kwargs):
+        connection = mock.MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (7,)
+        cursor.fetchall.return_value = []
+        with mock.patch('myapp.datatables.connection', connection), \
+                mock.patch('myapp.datatables.existing_partitions', return_value=[('2020', '1'), ('2021', '1')]), \
+                mock.patch.object(DynamicTableLoader, 'table_version', return_value=version):
+            response = datatables.datatable_page(['2020', '2021'], ['1'], **kwargs)
+        return response, [call.args[0] for call in cursor.execute.call_args_list]
+
+    def setUp(self):
+        datatables._partition_totals.clear()
+
+    def test_row_key_ends_the_order(self):
+        _, queries = self.page((5, 1, 0, 0), order_by=['-Quote_name'])
+        self.assertTrue(queries[-1].endswith('ORDER BY "Quote_name" DESC, row_key LIMIT %s OFFSET %s'))
+        _, queries = self.page((5, 1, 0, 0))
+        self.assertIn('ORDER BY row_key LIMIT', queries[-1])
+
+    def test_total_is_counted_once_per_version(self):
+        response, queries = self.page((5, 1, 0, 0))
+        self.assertEqual(response['recordsTotal'], 14)
+        self.assertEqual(sum(query.startswith('SELECT COUNT(*)') for query in queries), 2)
+        response, queries = self.page((5, 1, 0, 0))
+        self.assertEqual(response['recordsTotal'], 14)
+        self.assertFalse(any(query.startswith('SELECT COUNT(*)') for query in queries))
+        _, queries = self.page((6, 2, 0, 0))
+        self.assertEqual(sum(query.startswith('SELECT COUNT(*)') for query in queries), 2)
+
+
+class AppImportTests(SimpleTestCase):
+    def test_modules_import(self):
+        # apps.ready() imports dash_app, which pulls in the lookup index and the partition modules
+        for module in ('myapp.dash_app', 'myapp.lookup_index', 'myapp.views', 'myapp.urls'):
+            with self.subTest(module=module):
+                importlib.import_module(module)
+
+
+class GaugeClassifyTests(SimpleTestCase):
+    # (case, Quote_name_general, limits in LIMIT_COLUMNS order, [(value, band)])
+    bands = [
+        ('both ends', 'E', (-6, 6, -4, 4, -2, 2),
+         [(-7, 'red'), (-6, 'red'), (-5, 'pink'), (-3, 'orange'), (-2, 'orange'), (0, 'green'),
+          (2, 'green'), (3, 'orange'), (5, 'pink'), (7, 'red')]),
+        ('X uses both ends', 'X', (-6, 6, -4, 4, -2, 2), [(0, 'green'), (7, 'red')]),
+        ('lower', 'A', (30, 0, 20, 0, 10, 0), [(5, 'green'), (10, 'orange'), (25, 'pink'), (30, 'red'), (35, 'red')]),
+        ('lower, zero limits', 'A', (0, 0, 0, 0, 0, 0), [(50, 'green'), (1999, 'green')]),
+        ('lower, NaN limits', 'A', (np.nan, 0, 20, 0, np.nan, 0), [(10, 'green'), (25, 'pink')]),
+        ('upper', 'B', (0, 10, 0, 20, 0, 30), [(5, 'red'), (15, 'pink'), (25, 'orange'), (35, 'green')]),
+        ('upper, zero limits', 'B', (0, 0, 0, 0, 0, 0), [(5, 'green')]),
+        ('upper, NaN limits', 'B', (np.nan, np.nan, np.nan, 20, np.nan, np.nan), [(5, 'pink'), (25, 'green')]),
+        ('no layout', 'Q', (-6, 6, -4, 4, -2, 2), [(100, 'green')]),
+        ('missing value', 'E', (-6, 6, -4, 4, -2, 2), [(np.nan, None)]),
+    ]
+
+    def test_bands(self):
+        for case, general, limits, expected in self.bands:
+            values = [value for value, _ in expected]
+            with self.subTest(case):
+                result = classify(values, *([limit] * len(values) for limit in limits), [general] * len(values))
+                self.assertEqual(result['band'].where(result['band'].notna(), None).tolist(),
+                                 [band for _, band in expected])
+
+    def test_classify_frame_coerces_strings_and_keeps_the_index(self):
+        df = pd.DataFrame({'Quote_measured_value': ['-3', 'n/a'], 'Quote_name_general': ['E', 'A'],
+                           **dict(zip(LIMIT_COLUMNS, zip(*[('-6', '6', '-4', '4', '-2', '2')] * 2)))},
+                          index=[10, 11])
+        result = classify_frame(df)
+        self.assertEqual(list(result.index), [10, 11])
+        self.assertEqual(result['category'].tolist(), ['both_ends', 'lower'])
+        self.assertEqual(result['band'].iloc[0], 'orange')
+        self.assertTrue(pd.isna(result['band'].iloc[1]))
+
+    def test_gauge_steps(self):
+        cases = [
+            ('both ends', 0, 'E', (-6, 6, -4, 4, -2, 2),
+             [([-16, -6], 'red'), ([6, 16], 'red'), ([-6, -4], 'pink'), ([6, 4], 'pink'),
+              ([-2, -4], 'orange'), ([2, 4], 'orange'), ([-2, 2], 'green')]),
+            ('lower, IL only', 30, 'A', (0, 0, 20, 0, 0, 0), [([20, 40], 'pink'), ([0, 20], 'green')]),
+            ('lower, zero limits', 30, 'A', (0, 0, 0, 0, 0, 0), [([0, 2000], 'green')]),
+            ('upper', 35, 'B', (0, 10, 0, 20, 0, 30),
+             [([-10, 10], 'red'), ([10, 20], 'pink'), ([20, 30], 'orange'), ([30, 55], 'green')]),
+            ('upper, NaN limits', 5, 'B', (np.nan,) * 6, [([0, 25], 'green')]),
+            ('no layout', 5, 'Q', (-6, 6, -4, 4, -2, 2), []),
+        ]
+        for case, value, general, limits, expected in cases:
+            with self.subTest(case):
+                gauge = classify([value], *([limit] for limit in limits), [general]).iloc[0]
+                self.assertEqual(gauge_steps(gauge), [{'range': [float(start), float(end)], 'color': colour}
+                                                      for (start, end), colour in expected])
+
+
+class DegradationRatesTests(SimpleTestCase):
+    def frame(self, rows):
+        return pd.DataFrame(rows, columns=['Ramses_id', 'Quote_name', 'Date_control', 'Quote_measured_value'])
+
+    def test_rates_per_calendar_month(self):
+        # Out of order on purpose; a switch with two quotes and a second switch
+        rates = degradation_rates(self.frame([
+            ('R1', 'q1', '01/06/2020', '7'), ('R1', 'q1', '01/01/2020', '1'), ('R1', 'q1', '15/03/2020', '3'),
+            ('R1', 'q2', '01/01/2020', 5.0), ('R1', 'q2', '28/01/2020', 6.0),
+            ('R2', 'q1', '01/01/2020', 2.0), ('R2', 'q1', '01/01/2021', 0.8),
+        ])).set_index(['Ramses_id', 'Quote_name'])
+        self.assertEqual(rates['measurements'].tolist(), [3, 2, 2])
+        self.assertEqual(rates.loc[('R1', 'q1'), 'first_control'], pd.Timestamp('2020-01-01'))
+        self.assertEqual(rates.loc[('R1', 'q1'), 'latest_value'], 7.0)
+        self.assertAlmostEqual(rates.loc[('R1', 'q1'), 'slope_total'], 6 / 5)
+        self.assertAlmostEqual(rates.loc[('R1', 'q1'), 'slope_last_two'], 4 / 3)
+        # Same calendar month: no month difference, so a 0.0 rate
+        self.assertEqual(rates.loc[('R1', 'q2'), 'slope_total'], 0.0)
+        self.assertAlmostEqual(rates.loc[('R2', 'q1'), 'slope_total'], -0.1)
+
+    def test_single_measurement_has_flat_rates(self):
+        rates = degradation_rates(self.frame([('R1', 'q1', '01/01/2020', 4.0)]), fit=True).iloc[0]
+        self.assertEqual((rates['slope_total'], rates['slope_last_two'], rates['slope_fit']), (0.0, 0.0, 0.0))
+        self.assertEqual(rates['first_control'], rates['last_control'])
+
+    def test_rows_without_value_or_date_are_ignored(self):
+        df = self.frame([('R1', 'q1', '01/01/2020', 1.0), ('R1', 'q1', None, 9.0), ('R1', 'q1', '01/03/2020', 'n/a'),
+                         ('R1', 'q1', '01/05/2020', 3.0), ('R2', 'q1', None, 1.0)])
+        rates = degradation_rates(df, fit=True)
+        self.assertEqual(rates['Ramses_id'].tolist(), ['R1'])
+        self.assertEqual(rates['measurements'].tolist(), [2])
+        self.assertAlmostEqual(rates['slope_total'].iloc[0], 0.5)
+        self.assertFalse(rates.isna().any().any())
+        self.assertTrue(degradation_rates(df.iloc[[1, 4]]).empty)
+
+    def test_fit_is_the_least_squares_slope_per_month(self):
+        dates = pd.to_datetime(['2020-01-01', '2020-02-10', '2020-04-20', '2020-09-05'])
+        values = [1.0, 1.5, 1.4, 2.6]
+        rates = degradation_rates(self.frame([('R1', 'q1', date, value) for date, value in zip(dates, values)]),
+                                  fit=True)
+        x = (dates - dates[0]).days / DAYS_PER_MONTH
+        self.assertIn('slope_fit', rates.columns)
+        self.assertAlmostEqual(rates['slope_fit'].iloc[0], np.polyfit(x, values, 1)[0])
+        self.assertNotIn('slope_fit', degradation_rates(self.frame([('R1', 'q1', dates[0], 1.0)])).columns)
+
+
+class SnapshotRefreshTests(SimpleTestCase):
+    def refresh(self, version, watermark_version):
+        watermark = mock.Mock(version=json.dumps(watermark_version), max_index=10)
+        cursor = mock.MagicMock(rowcount=2)
+        cursor.fetchone.return_value = (12,)
+        cursor.fetchall.return_value = []
+        connection = mock.MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+        with mock.patch('myapp.snapshot.DynamicTableLoader.table_version', return_value=version), \
+                mock.patch('myapp.snapshot.SnapshotWatermark') as watermarks, \
+                mock.patch('myapp.snapshot.transaction'), \
+                mock.patch('myapp.snapshot.connection', connection):
+            watermarks.objects.filter.return_value.first.return_value = watermark
+            upserted = refresh_partition(2020, 1)
+        return upserted, [call.args for call in cursor.execute.call_args_list]
+
+    def test_unchanged_version_reads_nothing(self):
+        upserted, queries = self.refresh((10, 5, 0, 0), ['10', '5', '0', '0'])
+        self.assertEqual(upserted, 0)
+        self.assertEqual(queries, [])
+
+    def test_appended_rows_are_read_above_the_watermark(self):
+        upserted, queries = self.refresh((12, 7, 0, 0), ['10', '5', '0', '0'])
+        self.assertEqual(upserted, 2)
+        self.assertIn('django_index > %s', queries[0][0])
+        self.assertEqual(queries[0][1], [2020, 1, 10])
+        self.assertFalse(any(query.startswith('DELETE') for query, *_ in queries))
+
+    def test_deleted_rows_leave_the_snapshot(self):
+        upserted, queries = self.refresh((10, 5, 0, 1), ['10', '5', '0', '0'])
+        self.assertTrue(queries[0][0].startswith('DELETE'))
+        self.assertEqual(queries[0][1], [2020, 1])
+        self.assertNotIn('django_index > %s', queries[1][0])
+
+
+@skipIf(export.pq is None, "pyarrow is not installed")
+class StreamParquetTests(SimpleTestCase):
+    def test_text_columns_accept_other_values(self):
+        columns = ['Ramses_id', 'Num_ES', 'Branch']
+        chunks = [(columns, [('R1', 'ES 12', 1)]), (columns, [('R2', 1234, None), (3, None, 2)])]
+        data = b''.join(export.stream_parquet(iter(chunks), columns))
+        table = export.pq.read_table(export.pa.BufferReader(data))
+        self.assertEqual(table.column('Num_ES').to_pylist(), ['ES 12', '1234', None])
+        self.assertEqual(table.column('Ramses_id').to_pylist(), ['R1', 'R2', '3'])
+        self.assertEqual(table.column('Branch').to_pylist(), [1.0, None, 2.0])
+
+
+@skipIf(partition_mirror.pa is None, "pyarrow is not installed")
+class PartitionMirrorTests(SimpleTestCase):
+    def setUp(self):
+        pa = partition_mirror.pa
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(PARTITION_MIRROR_DIR=directory.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        # The dictionary of Quote_name is not in lexical order
+        table = pa.table({
+            'django_index': pa.array([1, 2, 3], type=pa.int64()),
+            'Ramses_id': pa.array(['R1', 'R1', 'R2']),
+            'Quote_name': partition_mirror.pc.dictionary_encode(pa.array(['b', 'c', 'a'])),
+            'Quote_measured_value': pa.array([1.0, 2.0, 3.0]),
+            'Date_control': pa.array([datetime(2020, 1, 6), datetime(2020, 2, 3), None], type=pa.timestamp('us')),
+        })
+        data_path, manifest_path = partition_mirror.mirror_paths(2020, 1)
+        with pa.OSFile(data_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        with open(manifest_path, 'w', encoding='utf-8') as handle:
+            json.dump({'version': ['3', '3', '0', '0'], 'columns': table.column_names, 'batches': [['R1', 'R2']]},
+                      handle)
+
+    def test_stale_mirror_is_not_read(self):
+        with mock.patch.object(DynamicTableLoader, 'table_version', return_value=(3, 3, 0, 0)):
+            self.assertTrue(partition_mirror.is_mirrored(2020, 1))
+        with mock.patch.object(DynamicTableLoader, 'table_version', return_value=(4, 4, 0, 0)):
+            self.assertFalse(partition_mirror.is_mirrored(2020, 1))
+
+    def test_read_takes_the_query_arguments(self):
+        df = partition_mirror.read_partition(2020, 1, columns=['Quote_name', 'Quote_measured_value'],
+                                             order_by=['-Quote_name'], limit=2, row_key=True)
+        self.assertEqual(list(df.columns), ['row_key', 'Quote_name', 'Quote_measured_value'])
+        self.assertEqual(df['row_key'].tolist(), ['2020:1:2', '2020:1:1'])
+        self.assertEqual(df['Quote_name'].astype(str).tolist(), ['c', 'b'])
+
+    def test_read_has_the_dtypes_of_cached_partitions(self):
+        df = partition_mirror.read_partition(2020, 1, order_by=['Quote_name'])
+        self.assertEqual(df['Quote_measured_value'].dtype, np.float32)
+        self.assertEqual(df['Quote_name'].dtype, object)
+        self.assertEqual(str(df['Date_control'].dt.tz), 'UTC')
+
+
+def raw_partition():
+    # A partition frame as fetched: object columns of Python values
+    return pd.DataFrame({
+        'Quote_name': ['q1', 'q2', 'q3', 'q4'],
+        'Quote_name_general': ['E', 'E', 'A', 'E'],
+        'Quote_measured_value': [1440.5, 1441.25, None, 1442.0],
+        'Nominal_value': [1435.1, 1435.1, 1435.1, 1435.1],
+        'Branch': [1, 2, 3, 300],
+        'Poste': [12, None, 14, 15],
+        'Date_control': ['15/03/2020', '01/04/2020', None, '28/02/2021'],
+        'Date_last_control': [datetime(2019, 3, 15), None, datetime(2020, 1, 6), datetime(2020, 2, 28)],
+        'Corrected_value': [1.5, 'n/a', 1.75, 2.0],
+        'Extra': ['x', 'y', 'z', 'w'],
+    }, dtype=object)
+
+
+class NormalizeFrameTests(SimpleTestCase):
+    def test_compact_dtypes(self):
+        df = normalize_frame(raw_partition())
+        self.assertIsInstance(df['Quote_name_general'].dtype, pd.CategoricalDtype)
+        self.assertEqual(df['Quote_measured_value'].dtype, np.float32)
+        # 1435.1 has no exact float32: float64 keeps the comparisons against limits unchanged
+        self.assertEqual(df['Nominal_value'].dtype, np.float64)
+        self.assertEqual(df['Branch'].dtype, np.int16)
+        self.assertEqual(df['Poste'].dtype, np.float32)
+        self.assertEqual(df['Date_control'].iloc[0], pd.Timestamp('2020-03-15', tz='UTC'))
+        self.assertTrue(pd.isna(df['Date_control'].iloc[2]))
+        self.assertEqual(df['Date_last_control'].iloc[0], pd.Timestamp('2019-03-15', tz='UTC'))
+        # Columns whose values do not all convert, or outside the model, are left as they are
+        self.assertEqual(df['Corrected_value'].dtype, object)
+        self.assertEqual(df['Extra'].dtype, object)
+
+    def test_naive_datetimes_become_utc(self):
+        naive = pd.DataFrame({'Date_control': pd.to_datetime(['2020-03-15 10:00'])})
+        aware = normalize_frame(pd.DataFrame({'Date_control': pd.Series([datetime(2020, 3, 16)], dtype=object)}))
+        combined = concat_frames([normalize_frame(naive), aware])
+        self.assertEqual(str(combined['Date_control'].dt.tz), 'UTC')
+        self.assertEqual(combined['Date_control'].iloc[0], pd.Timestamp('2020-03-15 10:00', tz='UTC'))
+
+    def test_categories_are_sorted(self):
+        names = pd.Series(pd.Categorical(['b', 'a', 'b', 'a'], categories=['b', 'a']))
+        df = normalize_frame(pd.DataFrame({'Quote_name': names}))
+        self.assertEqual(list(df['Quote_name'].cat.categories), ['a', 'b'])
+        self.assertEqual(df['Quote_name'].tolist(), ['b', 'a', 'b', 'a'])
+
+    def test_category_threshold(self):
+        rows = 10
+        limit = int(CATEGORY_MAX_RATIO * rows)
+        for distinct, categorical in [(limit, True), (limit + 1, False)]:
+            with self.subTest(distinct=distinct):
+                names = pd.Series([f'q{i % distinct}' for i in range(rows)], dtype=object)
+                df = normalize_frame(pd.DataFrame({'Quote_name': names}))
+                self.assertEqual(isinstance(df['Quote_name'].dtype, pd.CategoricalDtype), categorical)
+
+    def test_float32_only_when_every_value_round_trips(self):
+        cases = [([0.5, 1.25, 1e6], np.float32), ([0.5, 0.1], np.float64), ([16777217.0], np.float64),
+                 ([0.5, 'n/a'], object)]
+        for values, dtype in cases:
+            with self.subTest(values=values):
+                df = normalize_frame(pd.DataFrame({'IAL_min': pd.Series(values, dtype=object)}))
+                self.assertEqual(df['IAL_min'].dtype, dtype)
+                self.assertEqual(df['IAL_min'].tolist(), values)
+
+    def test_integer_downcast(self):
+        cases = [([1, 2, 127], np.int8), ([1, 40000], np.int32), ([-1, 2 ** 40], np.int64), ([1, None], np.float32)]
+        for values, dtype in cases:
+            with self.subTest(values=values):
+                df = normalize_frame(pd.DataFrame({'Arr': pd.Series(values, dtype=object)}))
+                self.assertEqual(df['Arr'].dtype, dtype)
+
+    def test_concat_frames_unions_categories(self):
+        first = normalize_chunk(raw_partition().iloc[:2])
+        second = normalize_chunk(raw_partition().iloc[2:])
+        combined = concat_frames([first, second.iloc[:0], second])
+        self.assertIsInstance(combined['Quote_name_general'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(combined['Quote_name_general'].cat.categories), ['A', 'E'])
+        self.assertEqual(combined['Quote_name_general'].tolist(), ['E', 'E', 'A', 'E'])
+        self.assertEqual(list(combined.index), [0, 1, 2, 3])
+        self.assertTrue(concat_frames([]).empty)
+
+
+class SelectListTests(SimpleTestCase):
+    def test_default_select_list_is_the_partition_layout(self):
+        select_list = build_select_list()
+        self.assertNotIn('*', select_list)
+        for column in PARTITION_KEY_COLUMNS:
+            self.assertNotIn(column, select_list)
+        for column in COLUMN_RENAMES:
+            with self.subTest(column=column):
+                self.assertIn(column, PARTITION_COLUMNS)
+
+    def test_fields_are_aliased(self):
+        self.assertEqual(build_select_list(['Ramses_id', 'Quote_name']),
+                         '"No. Ident." AS "Ramses_id", "Quote_name" AS "Quote_name"')
+
+
+class ReduceTraceTests(SimpleTestCase):
+    def test_measured_points_are_kept_below_the_budget(self):
+        x, y = reduce_trace(np.arange(20), np.repeat([1., 2., 2., 3.], 5), max_points=50)
+        self.assertEqual(list(x), list(range(20)))
+        self.assertEqual(len(y), 20)
+
+    def test_threshold_steps_are_collapsed(self):
+        x, y = reduce_trace(np.arange(20), np.repeat([1., 2., 2., 3.], 5), max_points=50, steps=True)
+        self.assertEqual(list(x), [0, 4, 5, 14, 15, 19])
+        self.assertEqual(list(y), [1., 1., 2., 2., 3., 3.])
+
+    def test_long_trace_is_downsampled_with_its_peak(self):
+        y = np.zeros(1000)
+        y[437] = 10.0
+        x, reduced = reduce_trace(np.arange(1000), y, max_points=50)
+        self.assertEqual(len(x), 50)
+        self.assertIn(437, list(x))
+        self.assertEqual(list(lttb_indices(np.arange(10), np.zeros(10), 20)), list(range(10)))
+
+
+class SwitchStoreTests(SimpleTestCase):
+    def test_every_quote_of_the_switch_is_stored(self):
+        dates = pd.date_range('2020-01-01', periods=4, freq='MS', tz='UTC')
+        df = pd.DataFrame({
+            'Quote_name': ['q1'] * 4 + ['q2'] * 2,
+            'Quote_name_general': 'E',
+            'Quote_measured_value': [1440.0, 1441.0, 1441.0, 1442.0, 5.0, 6.0],
+            'Date_control': list(dates) + list(dates[:2]),
+            'IAL_min': 1424.0, 'IAL_max': 1470.0, 'IL_min': 1426.0, 'IL_max': 1465.0, 'AL_min': 1428.0, 'AL_max': 0.0,
+        })
+        store = switch_store(df, 'R1')
+        self.assertEqual(store['ramses_id'], 'R1')
+        self.assertEqual(sorted(store['quotes']), ['q1', 'q2'])
+        q1 = store['quotes']['q1']
+        self.assertEqual(q1['values'], [1440.0, 1441.0, 1441.0, 1442.0])
+        self.assertEqual(q1['dates'][0], int(dates[0].timestamp() * 1000))
+        # Every measured point is kept, the constant thresholds collapse and all-zero ones are left out
+        self.assertEqual(len(q1['overview']['Quote_measured_value']['x']), 4)
+        self.assertEqual(len(q1['overview']['IAL_min']['x']), 2)
+        self.assertNotIn('AL_max', q1['overview'])
+
+
+class FetchColumnDataAsyncTests(SimpleTestCase):
+    def test_values_are_keyed_by_row_key(self):
+        frame = pd.DataFrame({'row_key': ['2020:1:4', '2021:1:2'], 'Branch': [3.0, np.nan]})
+        fetch = mock.AsyncMock(return_value=frame)
+        request = RequestFactory().get('/async/fetch_column_data/', {'column': 'Branch', 'years': ['2020', '2021'],
+                                                                     'arrondissements': ['1']})
+        with mock.patch('myapp.views.fetch_partitions_async', fetch):
+            response = asyncio.run(fetch_column_data_async(request))
+        self.assertEqual(json.loads(response.content), {'keys': ['2020:1:4', '2021:1:2'], 'columns': {'Branch': [3.0, '']}})
+        self.assertTrue(fetch.call_args.kwargs['row_key'])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_shared_load_is_reused_by_another_worker(self):
+        first, second = (SingleFlight(cache_alias='default', result_ttl=5) for _ in range(2))
+        frame = pd.DataFrame({'value': [1.0, 2.0]})
+        first.do(('shared', 1), lambda: frame, shared=True)
+        result = second.do(('shared', 1), lambda: self.fail('loaded twice'), shared=True)
+        pd.testing.assert_frame_equal(result, frame)
+        self.assertEqual(second.stats()['shared_hits'], 1)
+
+    def test_too_large_result_releases_the_waiting_workers(self):
+        first, second = (SingleFlight(cache_alias='default', lock_timeout=5, result_ttl=5, share_max_bytes=0)
+                         for _ in range(2))
+        frame = pd.DataFrame({'value': [1.0, 2.0]})
+        first.do(('large', 1), lambda: frame, shared=True)
+        # Another worker is still loading it: the second one must not wait for the lock
+        caches['default'].add(SingleFlight._cache_key(('large', 1), 'lock'), 'other', 5)
+        started = time.monotonic()
+        self.assertIs(second.do(('large', 1), lambda: frame, shared=True), frame)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((second.stats()['loads'], second.stats()['shared_hits']), (1, 0))
+
+
+class LoadCompactFrameTests(SimpleTestCase):
+    def load(self, chunk_size):
+        raw = raw_partition()
+        chunks = [raw.iloc[start:start + chunk_size].reset_index(drop=True) for start in range(0, len(raw), chunk_size)]
+        with mock.patch.object(DynamicTableLoader, 'iter_frames', return_value=iter(chunks)):
+            return load_compact_frame(2020, 1, chunk_size=chunk_size)
+
+    def test_chunked_load_matches_whole_load(self):
+        with override_settings(PARTITION_STREAMING_LOAD=False), \
+                mock.patch.object(DynamicTableLoader, 'load_frame', return_value=raw_partition()):
+            whole = load_compact_frame(2020, 1)
+        for chunk_size in (1, 2, 3, 4):
+            with self.subTest(chunk_size=chunk_size):
+                pd.testing.assert_frame_equal(self.load(chunk_size), whole)
+        self.assertIsInstance(whole['Quote_name_general'].dtype, pd.CategoricalDtype)
+        self.assertEqual(whole['Quote_name'].dtype, object)
+
+
+class IngestColumnsTests(SimpleTestCase):
+    def test_partition_layout_columns_have_a_source(self):
+        for column in COLUMN_RENAMES:
+            with self.subTest(column=column):
+                self.assertIn(column, PARTITION_COLUMNS + UNSOURCED_COLUMNS)
+
+    def test_source_columns_are_renamed(self):
+        query, params = build_source_query(after_section=12)
+        self.assertIn('s."Arrond.:"', query)
+        self.assertIn('AS "Arrond."', query)
+        self.assertIn('AS "Date_dernier_renouv"', query)
+        self.assertNotIn('AS "Section"', query)
+        self.assertEqual(params, [12])
+
+    def test_first_partition_has_every_partition_column(self):
+        connection = mock.MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (None,)
+        with mock.patch('myapp.ingest.connection', connection), \
+                mock.patch.object(partition_catalog, 'tables', return_value={}):
+            self.assertTrue(_ensure_partition('cleaned_data_2020.0_arr_1', 'SELECT 1', []))
+        ddl = ' '.join(call.args[0] for call in cursor.execute.call_args_list)
+        for column in PARTITION_COLUMNS:
+            with self.subTest(column=column):
+                self.assertIn(f'"{column}"' if column != 'django_index' else column, ddl)
+        self.assertIn(""""Date validation SMS" TEXT NOT NULL DEFAULT ' '""", ddl)
+
+    def test_writer_fills_the_unsourced_defaults(self):
+        connection = mock.MagicMock()
+        connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (41,)
+        with mock.patch('myapp.ingest.connection', connection), \
+                mock.patch('myapp.ingest._table_columns', return_value=INGESTED_COLUMNS + UNSOURCED_COLUMNS[:3]):
+            writer = _PartitionWriter('cleaned_data_2020.0_arr_1', buffer_rows=10)
+            writer.add(list(range(len(INGESTED_COLUMNS))))
+        row = writer.buffer.getvalue().rstrip('\r\n').split(',')
+        self.assertEqual(list(writer.defaults), ['Date validation SMS', 'Path'])
+        self.assertEqual(row[0], '42')
+        self.assertEqual(row[-2:], [' ', ''])
+
+
+def quote_history(values, limits, general='E', months=6, ramses_id='R1', quote_name='q1'):
+    # One quote controlled every `months` months; limits as (IAL_min, IAL_max, IL_min, IL_max, AL_min, AL_max)
+    dates = pd.date_range('2020-01-01', periods=len(values), freq=f'{months}MS')
+    return pd.DataFrame([(ramses_id, quote_name, general, value, date, *limits)
+                         for value, date in zip(values, dates)], columns=FORECAST_COLUMNS)
+
+
+class ForecastBreachesTests(SimpleTestCase):
+    both_ends = (1424, 1470, 1426, 1465, 1428, 1460)
+
+    def test_rising_trend_reaches_al_max(self):
+        forecast = forecast_breaches(quote_history(np.linspace(1440, 1452, 10), self.both_ends)).iloc[0]
+        self.assertEqual(forecast['next_limit'], 'AL_max')
+        self.assertEqual(forecast['band_after'], 'orange')
+        self.assertAlmostEqual(forecast['months_to_breach'], (1460 - forecast['fitted_value']) / forecast['slope'])
+        self.assertGreater(forecast['breach_date'], forecast['last_control'])
+
+    def test_robust_fit_ignores_an_outlier(self):
+        values = np.linspace(5, 8, 10)
+        values[4] = 30
+        limits = (15, 0, 12, 0, 10, 0)
+        plain = forecast_breaches(quote_history(values, limits, general='A')).iloc[0]
+        robust = forecast_breaches(quote_history(values, limits, general='A'), robust=True).iloc[0]
+        self.assertAlmostEqual(robust['fitted_value'], 8.0, places=2)
+        self.assertLess(plain['months_to_breach'], robust['months_to_breach'])
+
+    def test_flat_series_has_no_breach(self):
+        forecast = forecast_breaches(quote_history([5.1, 5.1, 5.1 + 1e-12], (0, 8, 0, 7, 0, 6))).iloc[0]
+        self.assertIsNone(forecast['next_limit'])
+        self.assertTrue(pd.isna(forecast['breach_date']))
+
+    def test_slow_trend_beyond_horizon_has_no_breach(self):
+        forecast = forecast_breaches(
+            quote_history([5.0, 5.006, 5.012], (0, 8, 0, 8, 0, 8), months=6)).iloc[0]
+        self.assertTrue(np.isnan(forecast['months_to_breach']))
+        self.assertTrue(pd.isna(forecast['breach_date']))
+
+    def test_single_measurement_and_empty_frame(self):
+        forecast = forecast_breaches(quote_history([3.0], (15, 0, 12, 0, 10, 0), general='A'))
+        self.assertEqual(forecast['slope'].tolist(), [0.0])
+        self.assertTrue(pd.isna(forecast['breach_date'].iloc[0]))
+        self.assertTrue(forecast_breaches(quote_history([], self.both_ends)).empty)
+
+    def test_undated_control_is_ignored(self):
+        history = quote_history(np.linspace(1440, 1452, 10), self.both_ends)
+        expected = forecast_breaches(history.drop(index=3)).iloc[0]
+        history['Date_control'] = history['Date_control'].astype(object)
+        history.loc[3, 'Date_control'] = None
+        forecast = forecast_breaches(history).iloc[0]
+        self.assertEqual(forecast['measurements'], 9)
+        self.assertAlmostEqual(forecast['slope'], expected['slope'])
+        self.assertEqual(forecast['breach_date'], expected['breach_date'])
+
+    def test_forecast_cache_has_its_own_size_limit(self):
+        cache = AnalysisCache(max_bytes=1)
+        forecast = forecast_breaches(quote_history(np.linspace(1440, 1452, 10), self.both_ends))
+        with mock.patch('myapp.analysis_cache.DynamicTableLoader.table_version', return_value=(1,)):
+            cache.get_or_compute('breach_forecast', [(2020, 1)], lambda: forecast, max_bytes=10 ** 7)
+            cache.get_or_compute('breach_forecast', [(2021, 1)], lambda: forecast)
+        self.assertEqual((cache.stores, cache.too_large), (1, 1))
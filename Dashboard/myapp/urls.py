@@ -4,7 +4,22 @@ from . import views
 urlpatterns = [
     path('', views.data_analysis_view, name='data_analysis'),
     path('fetch_column_data/', views.fetch_column_data, name='fetch_column_data'),
+    path('fetch_columns/', views.fetch_columns, name='fetch_columns'),
     path('load_data_view/', views.load_data_view, name='load_data_view'),
+    path('async/', views.data_analysis_view_async, name='data_analysis_async'),
+    path('async/fetch_column_data/', views.fetch_column_data_async, name='fetch_column_data_async'),
+    path('async/load_data_view/', views.load_data_view_async, name='load_data_view_async'),
+    path('datatable/', views.datatable_view, name='datatable'),
+    path('export/', views.export_view, name='export'),
+    path('gauge_report/', views.gauge_report_view, name='gauge_report'),
+    path('degradation/', views.degradation_view, name='degradation'),
+    path('fleet_status/', views.fleet_status_view, name='fleet_status'),
+    path('control_schedule/', views.control_schedule_view, name='control_schedule'),
+    path('breach_forecast/', views.breach_forecast_view, name='breach_forecast'),
+    path('fleet_overview/', views.fleet_overview_view, name='fleet_overview'),
+    path('latest_measurement/', views.latest_measurement_view, name='latest_measurement'),
+    path('cache_stats/', views.cache_stats_view, name='cache_stats'),
+    path('partitions/', views.partitions_view, name='partitions'),
     path('django_plotly_dash/', include('django_plotly_dash.urls')),
 ]
 
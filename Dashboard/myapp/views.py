@@ -1,37 +1,61 @@
 import pandas as pd
 import json
+import logging
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.forms.models import model_to_dict
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from .analysis_cache import analysis_cache
+from .control_schedule import days_overdue, due_switches
 from .data_analysis import perform_data_analysis
 from .models import DynamicTableLoader
-from .dash_app import get_dash_data 
+from .dash_app import DEGRADATION_COLUMNS, get_dash_data 
+from .dtypes import display_values
+from .degradation import degradation_rates, rank_degradation
+from .forecasting import fleet_forecast, rank_breaches, switch_urgency
+from .partition_cache import partition_cache
+from .partition_catalog import partition_catalog
+from .partition_fetch import fetch_partitions_async
+from .rollups import fleet_overview
+from .singleflight import singleflight
+from .gauges import LIMIT_COLUMNS, band_counts, classify_frame
+from .snapshot import SNAPSHOT_FIELDS, latest_measurement, snapshot_frame
+from .datatables import TABLE_COLUMNS, datatable_page, fetch_columns_by_key, parse_datatables_request
+from .export import EXPORT_FORMATS, export_chunks, pq, stream_csv, stream_parquet
 
 
-def data_analysis_view(request):
-    years = request.GET.getlist('years')
-    arrondissements = request.GET.getlist('arrondissements')
-
-    # Fetch data directly using get_dash_data
-    df = get_dash_data(years=years, arrondissements=arrondissements)
+def get_list_param(params, name):
+    # jQuery serializes arrays as name[]=..., plain forms as name=...
+    return params.getlist(name) or params.getlist(f'{name}[]')
 
-    print(years)
-    print(arrondissements)
-    print(df)
 
-    if df.empty:
-        return render(request, 'index.html', {
-            'summary_stats_array': json.dumps([]),  # Pass empty data
-        })
+def data_analysis_view(request):
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
 
-    # Convert DataFrame to a list of lists and column names for the frontend
-    summary_stats_array = df.fillna('').values.tolist()  
+    # The table is filled page by page through datatable_view, only the selection is passed on
     context = {
-        'summary_stats_array': json.dumps(summary_stats_array), 
+        'selected_years': json.dumps(years),
+        'selected_arrondissements': json.dumps(arrondissements),
     }
 
     return render(request, 'index.html', context)
 
 
+def datatable_view(request):
+    # DataTables server-side processing: only the requested page is queried and returned
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+
+    try:
+        page = parse_datatables_request(request.GET)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid paging parameters'}, status=400)
+
+    return JsonResponse(datatable_page(years, arrondissements, **page))
+
+
 def load_data_view(request):
     years = request.GET.getlist('years')
     arrondissements = request.GET.getlist('arrondissements')
@@ -50,7 +74,7 @@ def load_data_view(request):
     if df.empty:
         return JsonResponse({'data': [], 'columns': []})
 
-    data = df.fillna('').values.tolist()
+    data = display_values(df)
     columns = [{'title': col} for col in df.columns]
 
     return JsonResponse({'data': data, 'columns': columns})
@@ -74,3 +98,271 @@ def fetch_column_data(request):
         return JsonResponse(response_data, safe=False)
 
     return JsonResponse({"error": "Invalid request or column not found"}, status=400)
+
+
+async def data_analysis_view_async(request):
+    # Same page as data_analysis_view; rendering runs off the event loop since context processors may hit the database
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+    context = {
+        'selected_years': json.dumps(years),
+        'selected_arrondissements': json.dumps(arrondissements),
+    }
+    return await sync_to_async(render)(request, 'index.html', context)
+
+
+async def load_data_view_async(request):
+    # ASGI variant of load_data_view: the selected partitions are loaded concurrently
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+
+    if not years or not arrondissements:
+        return JsonResponse({'error': 'Years or arrondissements not provided'}, status=400)
+
+    try:
+        df = await fetch_partitions_async(years, arrondissements)
+    except Exception as e:
+        logging.error(f"Error in load_data_view_async: {str(e)}")
+        df = pd.DataFrame()
+
+    if df.empty:
+        return JsonResponse({'data': [], 'columns': []})
+
+    return JsonResponse({'data': display_values(df), 'columns': [{'title': col} for col in df.columns]})
+
+
+async def fetch_column_data_async(request):
+    # ASGI variant of fetch_column_data; only the requested column is read from each partition, and its
+    # values are keyed by row key like fetch_columns returns them
+    column_name = request.GET.get('column', None)
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+
+    if not column_name or column_name not in TABLE_COLUMNS:
+        return JsonResponse({"error": "Invalid request or column not found"}, status=400)
+
+    try:
+        data = await fetch_partitions_async(years, arrondissements, columns=[column_name], row_key=True)
+    except Exception as e:
+        logging.error(f"Error in fetch_column_data_async: {str(e)}")
+        data = pd.DataFrame()
+
+    if column_name not in data.columns:
+        return JsonResponse({'keys': [], 'columns': {column_name: []}})
+    values = data[column_name].astype(object).where(data[column_name].notna(), '')
+    return JsonResponse({'keys': data['row_key'].tolist(), 'columns': {column_name: values.tolist()}})
+
+
+def fetch_columns(request):
+    # Values of several hidden columns for the rows currently displayed, keyed by row key
+    columns = get_list_param(request.GET, 'columns')
+    row_keys = get_list_param(request.GET, 'keys')
+
+    if not columns or not row_keys:
+        return JsonResponse({"error": "Columns or row keys not provided"}, status=400)
+
+    try:
+        return JsonResponse(fetch_columns_by_key(columns, row_keys))
+    except ValueError:
+        return JsonResponse({"error": "Invalid row key"}, status=400)
+
+
+def export_view(request):
+    # Stream the filtered selection as CSV or Parquet, chunk by chunk from a server-side cursor
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+    export_format = request.GET.get('format', 'csv')
+    columns = [column for column in get_list_param(request.GET, 'columns') if column in TABLE_COLUMNS]
+    columns = columns or TABLE_COLUMNS
+
+    if not years or not arrondissements:
+        return JsonResponse({'error': 'Years or arrondissements not provided'}, status=400)
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'Invalid export format'}, status=400)
+    if export_format == 'parquet' and pq is None:
+        return JsonResponse({'error': 'Parquet export is not available'}, status=400)
+
+    filters = {
+        'ramses_ids': get_list_param(request.GET, 'ramses_id') or None,
+        'quote_names': get_list_param(request.GET, 'quote_name') or None,
+        'start_date': request.GET.get('start_date') or None,
+        'end_date': request.GET.get('end_date') or None,
+    }
+    # Only the switches overdue or due within due_within_days days, from the control schedule
+    if request.GET.get('due_within_days'):
+        try:
+            due = set(due_switches(int(request.GET['due_within_days']), arrondissements)
+                      .values_list('Ramses_id', flat=True))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid due_within_days'}, status=400)
+        filters['ramses_ids'] = sorted(due & set(filters['ramses_ids']) if filters['ramses_ids'] else due)
+
+    if filters['ramses_ids'] == []:
+        chunks = iter(())
+    else:
+        chunks = export_chunks(years, arrondissements, columns=columns,
+                               **{key: value for key, value in filters.items() if value is not None})
+
+    if export_format == 'csv':
+        response = StreamingHttpResponse(stream_csv(chunks, columns), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse(stream_parquet(chunks, columns), content_type='application/vnd.apache.parquet')
+    response['Content-Disposition'] = f'attachment; filename="measurements.{export_format}"'
+    return response
+
+
+def gauge_report_view(request):
+    # How many switch quotes sit in each gauge band, from their latest measurement
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+
+    if not years or not arrondissements:
+        return JsonResponse({'error': 'Years or arrondissements not provided'}, status=400)
+
+    df = get_dash_data(years=years, arrondissements=arrondissements,
+                       columns=['Ramses_id', 'Quote_name', 'Quote_name_general', 'Quote_measured_value',
+                                'Date_control'] + LIMIT_COLUMNS)
+    if df.empty:
+        return JsonResponse({'bands': {}, 'red': []})
+
+    df = df.dropna(subset=['Quote_measured_value']).sort_values(by='Date_control', kind='mergesort')
+    latest = df.groupby(['Ramses_id', 'Quote_name'], sort=False).tail(1)
+    bands = classify_frame(latest)['band']
+
+    return JsonResponse({
+        'bands': {band: int(count) for band, count in band_counts(latest).iloc[0].items()},
+        'red': latest.loc[bands == 'red', ['Ramses_id', 'Quote_name']].values.tolist(),
+    })
+
+
+def degradation_view(request):
+    # Degradation rates of every switch quote in the selection, fastest-degrading first
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+    sort = request.GET.get('sort', 'slope_total')
+    fit = request.GET.get('fit') in ('1', 'true') or sort == 'slope_fit'
+
+    if not years or not arrondissements:
+        return JsonResponse({'error': 'Years or arrondissements not provided'}, status=400)
+    if sort not in ('slope_total', 'slope_last_two', 'slope_fit'):
+        return JsonResponse({'error': 'Invalid sort column'}, status=400)
+
+    try:
+        top = int(request.GET.get('top', 100))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid top parameter'}, status=400)
+
+    df = get_dash_data(years=years, arrondissements=arrondissements, columns=DEGRADATION_COLUMNS)
+    if df.empty:
+        return JsonResponse({'data': []})
+
+    ranked = rank_degradation(degradation_rates(df, fit=fit), by=sort, top=top)
+    return JsonResponse({'data': json.loads(ranked.to_json(orient='records', date_format='iso'))})
+
+
+def breach_forecast_view(request):
+    # Quotes forecast to cross their next IAL/IL/AL limit, most urgent first; per=switch keeps one row per switch
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+    robust = request.GET.get('robust') in ('1', 'true')
+    try:
+        within_days = request.GET.get('within_days')
+        within_days = int(within_days) if within_days else None
+        top = int(request.GET.get('top', 100))
+        arrondissements = [int(arr) for arr in arrondissements]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid within_days, top or arrondissement'}, status=400)
+
+    ranked = rank_breaches(fleet_forecast(arrondissements, robust=robust), within_days=within_days)
+    if request.GET.get('per') == 'switch':
+        ranked = switch_urgency(ranked)
+    ranked = ranked.head(top)
+    return JsonResponse({'data': json.loads(ranked.to_json(orient='records', date_format='iso'))})
+
+
+def fleet_status_view(request):
+    # Gauge band counts per arrondissement, from the latest-measurement snapshot
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+
+    try:
+        latest = snapshot_frame(arrondissements)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid arrondissement'}, status=400)
+    if latest.empty:
+        return JsonResponse({'data': []})
+
+    counts = band_counts(latest, by='arrondissement')
+    data = [{'arrondissement': int(arr), **{band: int(count) for band, count in row.items()}}
+            for arr, row in counts.iterrows()]
+    return JsonResponse({'data': data})
+
+
+def fleet_overview_view(request):
+    # Network overview per arrondissement, Ligne and Poste, read from the pre-computed rollup table
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+    try:
+        rows, totals = fleet_overview(arrondissements)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid arrondissement'}, status=400)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'data': rows, 'totals': totals})
+    context = {
+        'rows': rows,
+        'totals': totals,
+        'refreshed_at': rows[0]['refreshed_at'] if rows else None,
+    }
+    return render(request, 'fleet_overview.html', context)
+
+
+def control_schedule_view(request):
+    # Switches overdue or due within `within_days` days (0 by default: overdue only), earliest due first
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+    try:
+        within_days = int(request.GET.get('within_days', 0))
+        switches = due_switches(within_days, arrondissements)
+        rows = list(switches.values('Ramses_id', 'arrondissement', 'Ligne', 'Poste', 'last_control',
+                                    'periodicity', 'due_date'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid within_days or arrondissement'}, status=400)
+
+    today = timezone.now().date()
+    for row in rows:
+        row['days_overdue'] = days_overdue(row['due_date'], today)
+    return JsonResponse({'data': rows})
+
+
+def latest_measurement_view(request):
+    # Latest control of one switch quote, as a point lookup in the snapshot
+    ramses_id = request.GET.get('ramses_id')
+    quote_name = request.GET.get('quote_name')
+
+    if not ramses_id or not quote_name:
+        return JsonResponse({'error': 'ramses_id or quote_name not provided'}, status=400)
+
+    latest = latest_measurement(ramses_id, quote_name)
+    if latest is None:
+        return JsonResponse({'error': 'No measurement found'}, status=404)
+
+    return JsonResponse(model_to_dict(latest, fields=SNAPSHOT_FIELDS + ['year', 'arrondissement']))
+
+
+def cache_stats_view(request):
+    # Hit/miss/eviction counters of this worker's partition cache, its coalesced loads and the analysis cache
+    return JsonResponse({
+        **partition_cache.stats(),
+        'singleflight': singleflight.stats(),
+        'analysis': analysis_cache.stats(),
+    })
+
+
+def partitions_view(request):
+    # Partition tables with their row and size estimates, and the estimate of a selection when given
+    years = get_list_param(request.GET, 'years')
+    arrondissements = get_list_param(request.GET, 'arrondissements')
+
+    response = {'partitions': sorted(partition_catalog.tables().values(),
+                                     key=lambda table: (table['year'], table['arrondissement']))}
+    if years and arrondissements:
+        response['selection'] = partition_catalog.estimate(years, arrondissements)
+        response['warning'] = partition_catalog.selection_warning(years, arrondissements)
+    return JsonResponse(response)